@@ -4,11 +4,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_babel import Babel
 import pymysql
-from flask_session import Session
-from flask_session_captcha import FlaskSessionCaptcha
+from app.captcha_pool import PooledSessionCaptcha
+from app.replica import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 # Define supported languages
@@ -16,7 +16,7 @@ LANGUAGES = ['en', 'id']
 
 # Setup Babel with a lazy loader for the locale
 babel = Babel()
-captcha = FlaskSessionCaptcha()
+captcha = PooledSessionCaptcha()
 
 def get_locale():
     """Get user's locale from session, defaulting to 'en'."""
@@ -27,7 +27,8 @@ def get_locale():
     # 2. Otherwise try to guess the language from the user accept header
     return request.accept_languages.best_match(LANGUAGES)
 
-def create_app():
+def create_app(config=None):
+    """Build the app; ``config`` overrides the settings below (benchmarks, throwaway databases)."""
     app = Flask(__name__)
     
     # Configuration
@@ -35,6 +36,12 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+pymysql://root:@localhost/pln_db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Optional read replica for report, dashboard and export reads (see app.replica):
+    # app.config['SQLALCHEMY_BINDS'] = {'replica': {'url': 'mysql+pymysql://ro@replica/pln_db', 'pool_size': 20}}
+    app.config['REPLICA_MAX_LAG'] = 30
+    app.config['REPLICA_CHECK_INTERVAL'] = 5
+    app.config['REPLICA_STICKY_SECONDS'] = 5
+    
     # Use absolute path for robustness
     basedir = os.path.abspath(os.path.dirname(__file__))
     app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'static/uploads')
@@ -47,8 +54,77 @@ def create_app():
     app.config['CAPTCHA_LENGTH'] = 5
     app.config['CAPTCHA_WIDTH'] = 160
     app.config['CAPTCHA_HEIGHT'] = 60
-    app.config['SESSION_TYPE'] = 'filesystem'
-
+    # Challenges pre-rendered per worker, refilled below the low-water mark
+    app.config['CAPTCHA_POOL_SIZE'] = 200
+    app.config['CAPTCHA_POOL_LOW_WATER'] = 50
+    # Server-side sessions in one SQLite database (WAL) under instance/
+    app.config['SESSION_TYPE'] = 'sqlite'
+    app.config['SESSION_SWEEP_INTERVAL'] = 300
+    
+    # Dashboard statistics cache, shared by all workers on the host
+    app.config['DASHBOARD_CACHE_TYPE'] = 'filesystem'
+    app.config['DASHBOARD_CACHE_TTL'] = 60
+    
+    # Processes used to render large PDF exports (1 renders in the request worker)
+    app.config['PDF_RENDER_WORKERS'] = 1
+    
+    # Threads per web process that build background exports
+    app.config['EXPORT_WORKERS'] = 2
+    app.config['EXPORT_DIR'] = None  # default: instance/exports
+    
+    # Threads per web process that run bulk transaction imports
+    app.config['IMPORT_WORKERS'] = 1
+    
+    # Per-process cache of logged-in user snapshots
+    app.config['IDENTITY_CACHE_TTL'] = 60
+    app.config['IDENTITY_CACHE_SIZE'] = 5000
+    
+    # Processes that hash passwords for bulk officer onboarding (None: one per CPU)
+    app.config['PASSWORD_HASH_WORKERS'] = None
+    
+    # Per-request SQL counts and timings; slower requests go to monitoring_logs
+    app.config['SQL_STATS_ENABLED'] = True
+    app.config['SLOW_REQUEST_MS'] = 1000
+    app.config['SQL_STATS_TOP'] = 5
+    app.config['SQL_STATS_FLUSH_INTERVAL'] = 60
+    
+    # Audit events are queued and written to monitoring_logs in batches
+    app.config['AUDIT_QUEUE_SIZE'] = 10000
+    app.config['AUDIT_BATCH_SIZE'] = 500
+    app.config['AUDIT_FLUSH_MS'] = 1000
+    app.config['AUDIT_BLOCK_MS'] = 50
+    
+    # Log rows older than this many days move to compressed files (flask archive run)
+    app.config['RETENTION_DAYS'] = {'wa_logs': 180, 'monitoring_logs': 90, 'print_logs': 365}
+    app.config['ARCHIVE_DIR'] = None  # default: instance/archive
+    app.config['ARCHIVE_CHUNK_ROWS'] = 20000
+    app.config['ARCHIVE_CACHE_SEGMENTS'] = 4
+    app.config['ARCHIVE_SCAN_SEGMENTS'] = 8  # segments a page may decode
+    
+    # WhatsApp delivery receipts posted by the gateway to /wa/receipts (disabled without a token)
+    app.config['WA_RECEIPT_TOKEN'] = None
+    app.config['WA_RECEIPT_MAX_BATCH'] = 10000
+    app.config['WA_RECEIPT_FLUSH_INTERVAL'] = 2
+    app.config['WA_RECEIPT_MAX_PENDING'] = 100000
+    
+    # Outbound reminders (flask wa send-reminders); see app.whatsapp.dispatcher
+    app.config['WA_GATEWAY_URL'] = None  # e.g. 'https://gateway.example.com/v1/messages'
+    app.config['WA_GATEWAY_TOKEN'] = None
+    app.config['WA_DISPATCH_RATE'] = 30  # messages per second
+    app.config['WA_DISPATCH_CONCURRENCY'] = 20
+    app.config['WA_DISPATCH_RETRIES'] = 3
+    app.config['WA_DISPATCH_BACKOFF'] = 0.5
+    app.config['WA_DISPATCH_TIMEOUT'] = 10
+    app.config['WA_DISPATCH_BATCH'] = 500
+    app.config['WA_REMINDER_TEMPLATE'] = ('Pelanggan {idpel}: tagihan listrik {months} bulan sejak {since} sebesar '
+                                          'Rp {total:,.0f} belum dibayar. Mohon segera melakukan pembayaran.')
+    
+    # Arrears aging of the tunggakan report, recomputed per worker after the TTL
+    app.config['TUNGGAKAN_CACHE_TTL'] = 300
+    app.config['TUNGGAKAN_CHUNK_ROWS'] = 100000
+    
+    if config:
+        app.config.update(config)
 
     # Initialize extensions with app
     db.init_app(app)
@@ -59,15 +135,16 @@ def create_app():
     # Pass the locale selector function during initialization
     babel.init_app(app, locale_selector=get_locale)
     captcha.init_app(app)
-    Session(app)
+    from app import session_store
+    session_store.init_app(app)
 
-    # Import User model
-    from app.models import User
+    # Logged-in users come from a per-process snapshot cache, not a query per request
+    from app.identity import identity_cache
+    identity_cache.init_app(app)
 
-    # Define user loader function
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.get(int(user_id))
     
     # Import and register blueprints
     from app.routes.auth import auth_bp
@@ -78,6 +155,7 @@ def create_app():
     from app.routes.talangan import talangan_bp
     from app.routes.information import information_bp
     from app.routes.anomaly import anomaly_bp
+    from app.routes.whatsapp import whatsapp_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
@@ -87,8 +165,62 @@ def create_app():
     app.register_blueprint(talangan_bp, url_prefix='/talangan')
     app.register_blueprint(information_bp, url_prefix='/information')
     app.register_blueprint(anomaly_bp, url_prefix='/anomaly')
+    app.register_blueprint(whatsapp_bp, url_prefix='/wa')
+    
+    # Read-only pages send their SELECTs to the replica bind when one is configured
+    from app import replica
+    replica.init_app(app, db)
+    replica.use_replica_for(app, 'reports', 'dashboard', 'information')
     
     # Create upload directory if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    # Register CLI commands
+    from app.migrations import schema_cli
+    app.cli.add_command(schema_cli)
+    
+    from app.seed import seed_cli
+    app.cli.add_command(seed_cli)
+    
+    from app.retention import archive_cli
+    app.cli.add_command(archive_cli)
+    
+    # Importing the modules registers their commands on the import group
+    from app.imports import import_cli, staff, transactions
+    app.cli.add_command(import_cli)
+    
+    from app.whatsapp import wa_cli, dispatcher
+    app.cli.add_command(wa_cli)
+    
+    # Initialize services that hook into the session or run in the background
+    from app import rollup
+    rollup.init_app(app)
+    
+    from app import customer_search
+    customer_search.init_app(app)
+    
+    from app import customer_summary
+    customer_summary.init_app(app)
+    
+    from app.dashboard_stats import dashboard_stats
+    dashboard_stats.init_app(app)
+    
+    from app.exports.jobs import export_jobs
+    export_jobs.init_app(app)
+    
+    from app.imports.jobs import import_jobs
+    import_jobs.init_app(app)
+    
+    from app.audit import audit_log
+    audit_log.init_app(app)
+    
+    from app.whatsapp.receipts import receipt_buffer
+    receipt_buffer.init_app(app)
+    
+    from app.sql_stats import sql_stats
+    sql_stats.init_app(app)
+    
+    from app.tunggakan import tunggakan_aging
+    tunggakan_aging.init_app(app)
+    
     return app
\ No newline at end of file
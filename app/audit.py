@@ -0,0 +1,192 @@
+"""Buffered audit and event writer for ``monitoring_logs``.
+
+Routes call ``log_event('create', 'Coordinator budi')`` after their own
+commit. The event (module = the request's blueprint, user = the logged-in
+user, timestamp taken now) goes onto a bounded in-process queue and the
+request carries on; it never waits for the database.
+
+A daemon thread in each worker takes events off the queue and writes them
+with one multi-row INSERT per batch: as soon as ``AUDIT_BATCH_SIZE`` events
+are waiting, or ``AUDIT_FLUSH_MS`` after the first event of a batch. When the
+queue (``AUDIT_QUEUE_SIZE`` events) is full because the database is slow or
+down, producers wait up to ``AUDIT_BLOCK_MS`` for room and then drop the
+event, counting it, rather than stall the page. On interpreter exit the
+queue is drained and written. A batch that fails to insert is logged and
+dropped.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import MonitoringLog
+
+COUNTER_KEYS = ('queued', 'written', 'dropped', 'failed', 'batches')
+MAX_DETAILS = 4000
+_STOP = object()
+
+
+class AuditLog:
+    def __init__(self, app=None):
+        self.queue_size = 10000
+        self.batch_size = 500
+        self.flush_ms = 1000
+        self.block_ms = 50
+        self._app = None
+        self._queue = queue.Queue(self.queue_size)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.queue_size = app.config.get('AUDIT_QUEUE_SIZE', self.queue_size)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_ms = app.config.get('AUDIT_FLUSH_MS', self.flush_ms)
+        self.block_ms = app.config.get('AUDIT_BLOCK_MS', self.block_ms)
+        self._queue = queue.Queue(self.queue_size)
+        atexit.register(self.close)
+
+    def emit(self, module_name, event_type, details=None, user_id=None):
+        """Queue one event; returns ``False`` if it was dropped because the queue is full"""
+        if details is not None and not isinstance(details, str):
+            details = json.dumps(details, default=str)
+        event = {
+            'module_name': module_name[:100],
+            'event_type': event_type[:50],
+            'details': details[:MAX_DETAILS] if details else details,
+            'user_id': user_id,
+            'created_at': datetime.utcnow(),
+        }
+        self._ensure_writer()
+        try:
+            if self.block_ms > 0:
+                self._queue.put(event, timeout=self.block_ms / 1000)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self._counters['dropped'] += 1
+            if self._counters['dropped'] % 1000 == 1:
+                self._app.logger.warning('Audit queue full, %s events dropped so far', self._counters['dropped'])
+            return False
+        self._counters['queued'] += 1
+        return True
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker gets its own queue and thread
+            self._queue = queue.Queue(self.queue_size)
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _next_batch(self):
+        """Block for the first event, then collect until the batch is full or ``flush_ms`` has passed
+
+        Returns the batch and the marker (``_STOP`` or a flush request) that ended it early, if any.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                event = self._queue.get()
+            else:
+                remaining = deadline - time.monotonic()
+                try:
+                    event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if event is _STOP or isinstance(event, threading.Event):
+                return batch, event
+            batch.append(event)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_ms / 1000
+        return batch, None
+
+    def _run(self):
+        while True:
+            batch, marker = self._next_batch()
+            if batch:
+                self._write(batch)
+            if marker is _STOP:
+                return
+            if marker is not None:
+                marker.set()
+
+    def _write(self, events):
+        try:
+            with self._app.app_context(), db.engine.begin() as connection:
+                connection.execute(MonitoringLog.__table__.insert(), events)
+        except SQLAlchemyError:
+            self._counters['failed'] += len(events)
+            self._app.logger.warning('Could not write %s audit events', len(events), exc_info=True)
+            return
+        self._counters['written'] += len(events)
+        self._counters['batches'] += 1
+
+    def flush(self, timeout=5):
+        """Write everything queued so far; waits for the writer thread if there is one"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            done = threading.Event()
+            try:
+                self._queue.put(done, timeout=timeout)
+            except queue.Full:
+                return False
+            return done.wait(timeout)
+        events = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(event, dict):
+                events.append(event)
+        for start in range(0, len(events), self.batch_size):
+            self._write(events[start:start + self.batch_size])
+        return True
+
+    def close(self, timeout=5):
+        """Stop the writer after it has written what is queued"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                thread.join(timeout)
+            except queue.Full:
+                pass
+        self._thread = None
+        self._pid = None
+        if self._app is not None:
+            # Anything the writer did not get to is written from here
+            self.flush()
+
+    def metrics(self):
+        return dict(self._counters, pending=self._queue.qsize(), queue_size=self.queue_size,
+                    batch_size=self.batch_size, flush_ms=self.flush_ms, pid=os.getpid())
+
+
+audit_log = AuditLog()
+
+
+def log_event(event_type, details=None, module_name=None, user_id=None):
+    """Queue an event of the current request; module and user default to its blueprint and user"""
+    if has_request_context():
+        if module_name is None:
+            module_name = request.blueprint or 'app'
+        if user_id is None and current_user and current_user.is_authenticated:
+            user_id = current_user.id
+    return audit_log.emit(module_name or 'app', event_type, details, user_id)
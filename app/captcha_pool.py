@@ -0,0 +1,116 @@
+"""Pre-rendered captcha challenges for the login page.
+
+``FlaskSessionCaptcha.generate()`` draws a new PNG with Pillow on every login
+page view, which makes the page CPU-bound when a whole shift logs in at once.
+``PooledSessionCaptcha`` keeps a deque of ready ``(answer, image)`` pairs
+rendered by a background thread: ``generate()`` pops one in O(1), stores the
+answer in the session exactly as before and wakes the renderer once fewer than
+``CAPTCHA_POOL_LOW_WATER`` are left; the renderer tops the pool back up to
+``CAPTCHA_POOL_SIZE``. Each challenge is handed out once. If the pool is empty
+(or the template asks for a non-default character set) the image is rendered
+inline as before, so ``captcha.validate()`` behaves exactly like the library's.
+
+The pool belongs to the worker process; a forked worker discards the
+challenges it inherited and renders its own. A challenge that fails to render
+is logged and the renderer waits for the next wake-up instead of dying.
+``_render`` uses the library's private answer generator, so requirements.txt
+pins ``flask_session_captcha``.
+"""
+import base64
+import os
+import threading
+import time
+from collections import deque
+from flask_session_captcha import FlaskSessionCaptcha
+from markupsafe import Markup
+
+COUNTER_KEYS = ('pooled', 'inline', 'rendered', 'render_errors')
+
+
+class PooledSessionCaptcha(FlaskSessionCaptcha):
+
+    def __init__(self, app=None):
+        self.pool_size = 200
+        self.low_water = 50
+        self._pool = deque()
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        self._app = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self._app = app
+        self.pool_size = app.config.get('CAPTCHA_POOL_SIZE', self.pool_size)
+        self.low_water = app.config.get('CAPTCHA_POOL_LOW_WATER', self.low_water)
+
+    def _render(self):
+        answer = self._FlaskSessionCaptcha__generate(include_alphabet=self.include_alphabet,
+                                                      include_punctuation=self.include_punctuation,
+                                                      include_numeric=self.include_numeric)
+        image = base64.b64encode(self.image_generator.generate(answer).getvalue()).decode('ascii')
+        self._counters['rendered'] += 1
+        return answer, f'data:image/png;base64, {image}'
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pool.clear()
+            self._wake.set()
+            threading.Thread(target=self._fill_forever, name='captcha-pool', daemon=True).start()
+
+    def _fill_forever(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while len(self._pool) < self.pool_size:
+                try:
+                    self._pool.append(self._render())
+                except Exception:
+                    self._counters['render_errors'] += 1
+                    if self._app is not None:
+                        self._app.logger.warning('Could not render a pooled captcha', exc_info=True)
+                    # Retry on the next wake-up; take() renders inline meanwhile
+                    time.sleep(1)
+                    break
+
+    def take(self):
+        """Return a pre-rendered ``(answer, image_uri)``, or render one inline if the pool is empty"""
+        self._ensure_worker()
+        try:
+            challenge = self._pool.popleft()
+            self._counters['pooled'] += 1
+        except IndexError:
+            challenge = None
+        if len(self._pool) < self.low_water:
+            self._wake.set()
+        if challenge is None:
+            self._counters['inline'] += 1
+            challenge = self._render()
+        return challenge
+
+    def generate(self, *args, **kwargs):
+        if not self.enabled or self.pool_size <= 0 or any(
+            kwargs.get(option, getattr(self, option)) != getattr(self, option)
+            for option in ('include_alphabet', 'include_numeric', 'include_punctuation')
+        ):
+            return super().generate(*args, **kwargs)
+
+        answer, data = self.take()
+        self.set_answer(answer)
+        self.debug_log(f'Captcha Generated. key: {answer}')
+        css = f"class='{kwargs.get('css_class')}'" if kwargs.get('css_class') else ''
+        return Markup(f"<img src='{data}' {css} >")
+
+    def metrics(self):
+        values = dict(self._counters, size=len(self._pool), pool_size=self.pool_size,
+                      low_water=self.low_water, pid=os.getpid())
+        served = values['pooled'] + values['inline']
+        values['pool_hit_rate'] = round(values['pooled'] / served, 4) if served else None
+        return values
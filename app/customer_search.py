@@ -0,0 +1,273 @@
+"""Prefix and typo-tolerant customer search on ``idpel``.
+
+Prefix matches come straight from the ``(idpel, periode)`` index on
+``transactions``. For typo tolerance every known idpel is split into
+positional 4-grams of ``^idpel$`` and stored in ``customer_search_grams``
+(4 rather than 3 characters: ids are digits only, so a trigram at a given
+position matches one customer in a thousand, too many to scan per lookup). A query looks
+up its own n-grams, allowing them to shift by up to the typo budget, keeps the
+idpels sharing enough of them and ranks those by edit distance. Only the few
+hundred candidates are ever compared in Python. The fuzzy pass is skipped
+when the query is an exact id or already has a page of prefix matches.
+
+Real ids share long prefixes (a whole area is numbered from one base), so
+n-grams like ``^510`` or ``0000`` belong to nearly every customer. Before
+matching, each query n-gram's rows are counted, stopping at
+``MAX_GRAM_ROWS + 1``. N-grams over the cap are left out, so a lookup reads
+at most ``MAX_GRAM_ROWS`` rows per n-gram whatever the number of customers.
+They would not tell candidates apart anyway.
+
+A session flush hook indexes idpels of new or changed transactions in the
+same database transaction. Deleted customers are not removed eagerly; they
+drop out of results because matches are read back from ``customer_summary``,
+and ``flask customer-search rebuild`` compacts the index.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, false, func, literal, or_, select
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import Transaction, CustomerSearchGram, CustomerSummary
+
+customer_search_cli = AppGroup('customer-search', help='Customer search index maintenance.')
+
+GRAM_SIZE = 4
+MIN_FUZZY_LENGTH = 4
+# Fuzzy candidates fetched from the index before ranking in Python
+CANDIDATE_LIMIT = 200
+# Query n-grams found in more index rows than this are too common to match on
+MAX_GRAM_ROWS = 1000
+MAX_RESULTS = 200
+DEFAULT_PER_PAGE = 20
+REBUILD_BATCH = 5000
+
+
+class SearchResults:
+    """One page of ranked customer matches"""
+
+    def __init__(self, query, items, page, per_page, total):
+        self.query = query
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page * self.per_page < self.total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def normalize(text):
+    return ''.join((text or '').split())
+
+
+def grams(idpel, end_marker=True):
+    """Return ``(position, n-gram)`` pairs of ``^idpel$``"""
+    padded = f'^{idpel}$' if end_marker else f'^{idpel}'
+    return [(i, padded[i:i + GRAM_SIZE]) for i in range(max(1, len(padded) - GRAM_SIZE + 1))]
+
+
+def max_typos(length):
+    return 1 if length < 8 else 2
+
+
+def _distance_row(query, text):
+    """Last DP row: edit distance from ``query`` to every prefix of ``text``"""
+    previous = list(range(len(text) + 1))
+    for i, qc in enumerate(query, 1):
+        current = [i]
+        for j, tc in enumerate(text, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (qc != tc)))
+        previous = current
+    return previous
+
+
+def edit_distance(a, b):
+    return _distance_row(a, b)[-1]
+
+
+def prefix_distance(query, idpel, typos):
+    """Edit distance between ``query`` and the closest-length prefix of ``idpel``"""
+    row = _distance_row(query, idpel[:len(query) + typos])
+    return min(row[max(0, len(query) - typos):])
+
+
+# Index maintenance
+
+def _insert_ignore(dialect_name):
+    table = CustomerSearchGram.__table__
+    if dialect_name == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    from sqlalchemy.dialects.sqlite import insert
+    return insert(table).on_conflict_do_nothing()
+
+
+def index_idpels(connection, idpels):
+    rows = [{'gram': gram, 'position': position, 'idpel': idpel}
+            for idpel in idpels for position, gram in grams(idpel)]
+    if rows:
+        connection.execute(_insert_ignore(connection.dialect.name), rows)
+
+
+def _changed_idpels(session):
+    idpels = set()
+    for obj in session.new:
+        if isinstance(obj, Transaction) and obj.idpel:
+            idpels.add(obj.idpel)
+    for obj in session.dirty:
+        if isinstance(obj, Transaction):
+            idpels.update(attributes.get_history(obj, 'idpel').added or ())
+    return idpels
+
+
+def index_new_idpels(connection, idpels):
+    """Index the idpels among ``idpels`` that are not in the index yet"""
+    idpels = set(idpels)
+    if not idpels:
+        return
+    known = connection.execute(
+        select(CustomerSearchGram.idpel).where(CustomerSearchGram.idpel.in_(idpels)).distinct()
+    ).scalars()
+    index_idpels(connection, idpels.difference(known))
+
+
+def _after_flush(session, flush_context):
+    idpels = _changed_idpels(session)
+    if idpels:
+        index_new_idpels(session.connection(), idpels)
+
+
+def clear():
+    """Empty the index, e.g. after a bulk delete of all transactions"""
+    db.session.execute(CustomerSearchGram.__table__.delete())
+
+
+def rebuild(connection=None):
+    """Re-index every distinct idpel in ``transactions``, in keyset batches"""
+    connection = connection or db.session.connection()
+    connection.execute(CustomerSearchGram.__table__.delete())
+    last = ''
+    total = 0
+    while True:
+        batch = connection.execute(
+            select(Transaction.idpel).where(Transaction.idpel > last)
+            .distinct().order_by(Transaction.idpel).limit(REBUILD_BATCH)
+        ).scalars().all()
+        if not batch:
+            return total
+        index_idpels(connection, batch)
+        total += len(batch)
+        last = batch[-1]
+
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+    app.cli.add_command(customer_search_cli)
+
+
+# Search
+
+def prefix_query(query, limit=MAX_RESULTS):
+    # A range rather than LIKE so every backend can use the idpel index
+    upper = query[:-1] + chr(ord(query[-1]) + 1)
+    return db.session.query(Transaction.idpel).filter(
+        Transaction.idpel >= query, Transaction.idpel < upper
+    ).distinct().order_by(Transaction.idpel).limit(limit)
+
+
+def _gram_match(position, gram, typos):
+    return and_(CustomerSearchGram.gram == gram,
+                CustomerSearchGram.position.between(position - typos, position + typos))
+
+
+def gram_rows_query(query_grams, typos, cap=MAX_GRAM_ROWS):
+    """``(n, rows)`` per n-gram of ``query_grams``; each count stops at ``cap + 1``"""
+    counts = [
+        db.session.query(literal(n).label('n'), func.count().label('rows')).select_from(
+            select(CustomerSearchGram.idpel).where(_gram_match(position, gram, typos)).limit(cap + 1).subquery()
+        ) for n, (position, gram) in enumerate(query_grams)
+    ]
+    return counts[0].union_all(*counts[1:])
+
+
+def selective_grams(query_grams, typos, cap=MAX_GRAM_ROWS):
+    """The n-grams of ``query_grams`` found in at most ``cap`` index rows"""
+    return [query_grams[n] for n, rows in gram_rows_query(query_grams, typos, cap) if rows <= cap]
+
+
+def fuzzy_query(query, typos, limit=CANDIDATE_LIMIT):
+    """Idpels sharing enough selective positional n-grams with ``query``.
+
+    The query has no end marker, so partial ids match as prefixes. One typo
+    breaks at most ``GRAM_SIZE`` n-grams.
+    """
+    query_grams = selective_grams(grams(query, end_marker=False), typos)
+    needed = max(1, len(query_grams) - GRAM_SIZE * typos)
+    hits = func.count(CustomerSearchGram.gram)
+    matches = or_(*[_gram_match(position, gram, typos) for position, gram in query_grams]) if query_grams else false()
+    return db.session.query(CustomerSearchGram.idpel, hits.label('hits')).filter(matches).group_by(
+        CustomerSearchGram.idpel
+    ).having(hits >= needed).order_by(hits.desc(), CustomerSearchGram.idpel).limit(limit)
+
+
+def _customer_stats(idpels):
+    rows = CustomerSummary.query.filter(CustomerSummary.idpel.in_(idpels), CustomerSummary.txn_count > 0)
+    return {row.idpel: row for row in rows}
+
+
+def search(query, page=1, per_page=DEFAULT_PER_PAGE):
+    """Return a ``SearchResults`` page: exact match, then prefixes, then near misses"""
+    query = normalize(query)
+    page = max(1, page)
+    if not query:
+        return SearchResults(query, [], page, per_page, 0)
+
+    # idpel -> (match rank, distance); lower sorts first
+    ranked = {}
+    for (idpel,) in prefix_query(query):
+        ranked[idpel] = (0, 0) if idpel == query else (1, len(idpel) - len(query))
+
+    if len(query) >= MIN_FUZZY_LENGTH and query not in ranked and len(ranked) < per_page:
+        typos = max_typos(len(query))
+        for idpel, _hits in fuzzy_query(query, typos):
+            if idpel in ranked:
+                continue
+            distance = prefix_distance(query, idpel, typos)
+            if distance <= typos:
+                ranked[idpel] = (2, distance)
+
+    ordered = sorted(ranked, key=lambda idpel: (ranked[idpel], idpel))[:MAX_RESULTS]
+    # The gram index can be ahead of the transactions: count and page only real customers
+    stats = _customer_stats(ordered) if ordered else {}
+    ordered = [idpel for idpel in ordered if idpel in stats]
+    start = (page - 1) * per_page
+    page_ids = ordered[start:start + per_page]
+
+    match_names = ('exact', 'prefix', 'similar')
+    items = [{
+        'idpel': idpel,
+        'match': match_names[ranked[idpel][0]],
+        'distance': ranked[idpel][1],
+        'txn_count': stats[idpel].txn_count,
+        'last_periode': stats[idpel].last_periode,
+    } for idpel in page_ids]
+    return SearchResults(query, items, page, per_page, len(ordered))
+
+
+@customer_search_cli.command('rebuild')
+def rebuild_command():
+    """Re-index every customer id found in transactions."""
+    count = rebuild()
+    db.session.commit()
+    click.echo(f'Customer search index rebuilt: {count} customers.')
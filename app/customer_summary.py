@@ -0,0 +1,220 @@
+"""Per-customer summary table.
+
+``customer_summary`` holds one row per idpel with what a customer page needs
+at a glance: transaction count and latest periode, last payment, outstanding
+count and amount, the officer of the latest transaction, talangan exposure
+(pending and approved advances), open anomalies and the latest WA status.
+
+Session flush hooks collect the idpels touched by inserted, updated or
+deleted transactions, talangan transactions, anomalies and WA logs and
+recompute just those rows from the source tables inside the same database
+transaction. Each refresh is a handful of grouped queries over the idpel
+indexes, whatever the number of customers in the flush.
+
+Concurrent writers for one customer (a web request, an import, the receipt
+flusher, the reminder writer) are serialized on its summary row, which is
+locked before any source row is written. ``before_flush`` makes sure the
+rows exist and locks them ``FOR UPDATE`` in idpel order. ``after_flush``
+then reads the sources with locking reads, which see the latest committed
+data rather than the transaction's snapshot. A second writer waits in its
+own ``before_flush``, before its insert, so the first writer's reads never
+wait on the second writer's uncommitted rows. It recomputes from both
+changes once the first commits.
+
+Bulk statements that bypass the ORM must call ``lock()`` for the idpels they
+are about to write and ``refresh()`` after writing, or ``rebuild()``.
+``flask customer-summary rebuild`` recomputes the table in one
+keyset-ordered pass over every known idpel.
+"""
+from datetime import datetime
+from decimal import Decimal
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, event, func, select, union
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import Transaction, TalanganTransaction, Anomaly, WALog, CustomerSummary
+
+customer_summary_cli = AppGroup('customer-summary', help='Customer summary maintenance.')
+
+SOURCES = (Transaction, TalanganTransaction, Anomaly, WALog)
+OPEN_TALANGAN = ('pending', 'approved')
+BATCH = 1000
+
+
+def _empty_row(idpel, now):
+    return {
+        'idpel': idpel, 'txn_count': 0, 'last_periode': None, 'last_payment_at': None,
+        'last_paid_periode': None, 'outstanding_count': 0, 'outstanding_amount': Decimal('0'),
+        'officer_id': None, 'talangan_exposure': Decimal('0'), 'open_anomalies': 0,
+        'last_wa_status': None, 'last_wa_at': None, 'updated_at': now,
+    }
+
+
+def _summarize(connection, idpels, lock=False):
+    """Compute summary rows for ``idpels``; customers with no data get no row
+
+    With ``lock`` the source rows are read with shared locking reads.
+    """
+    now = datetime.utcnow()
+    rows = {}
+
+    def execute(statement):
+        return connection.execute(statement.with_for_update(read=True) if lock else statement)
+
+    def row(idpel):
+        if idpel not in rows:
+            rows[idpel] = _empty_row(idpel, now)
+        return rows[idpel]
+
+    completed = Transaction.status == 'completed'
+    pending = Transaction.status == 'pending'
+    latest_ids = {}
+    for r in execute(select(
+        Transaction.idpel,
+        func.count(Transaction.id),
+        func.max(Transaction.periode),
+        func.max(case((completed, Transaction.created_at))),
+        func.max(case((completed, Transaction.periode))),
+        func.sum(case((pending, 1), else_=0)),
+        func.sum(case((pending, Transaction.total), else_=0)),
+        func.max(Transaction.id),
+    ).where(Transaction.idpel.in_(idpels)).group_by(Transaction.idpel)):
+        summary = row(r[0])
+        summary.update(txn_count=r[1], last_periode=r[2], last_payment_at=r[3], last_paid_periode=r[4],
+                       outstanding_count=int(r[5] or 0), outstanding_amount=r[6] or Decimal('0'))
+        latest_ids[r[7]] = r[0]
+
+    if latest_ids:
+        for txn_id, officer_id in execute(
+            select(Transaction.id, Transaction.officer_id).where(Transaction.id.in_(latest_ids))
+        ):
+            rows[latest_ids[txn_id]]['officer_id'] = officer_id
+
+    for idpel, exposure in execute(
+        select(TalanganTransaction.idpel, func.sum(TalanganTransaction.amount)).where(
+            TalanganTransaction.idpel.in_(idpels), TalanganTransaction.status.in_(OPEN_TALANGAN)
+        ).group_by(TalanganTransaction.idpel)
+    ):
+        row(idpel)['talangan_exposure'] = exposure or Decimal('0')
+
+    for idpel, open_count in execute(
+        select(Anomaly.idpel, func.count(Anomaly.id)).where(
+            Anomaly.idpel.in_(idpels), Anomaly.status != 'resolved'
+        ).group_by(Anomaly.idpel)
+    ):
+        row(idpel)['open_anomalies'] = open_count
+
+    latest_wa = select(func.max(WALog.id)).where(WALog.idpel.in_(idpels)).group_by(WALog.idpel)
+    for idpel, status, created_at in execute(
+        select(WALog.idpel, WALog.status, WALog.created_at).where(WALog.id.in_(latest_wa))
+    ):
+        row(idpel).update(last_wa_status=status, last_wa_at=created_at)
+
+    # Customers only known from resolved anomalies or settled advances still get a row
+    for model in (TalanganTransaction, Anomaly):
+        for (idpel,) in execute(
+            select(model.idpel).where(model.idpel.in_(set(idpels) - set(rows))).distinct()
+        ):
+            row(idpel)
+
+    return list(rows.values())
+
+
+def _lock_rows(connection, idpels):
+    """Create missing summary rows for one batch of sorted ``idpels`` and lock them until the transaction ends"""
+    table = CustomerSummary.__table__
+    now = datetime.utcnow()
+    placeholders = [_empty_row(idpel, now) for idpel in idpels]
+    if connection.dialect.name == 'mysql':
+        connection.execute(table.insert().prefix_with('IGNORE'), placeholders)
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(table).on_conflict_do_nothing(index_elements=['idpel']), placeholders)
+    connection.execute(select(table.c.idpel).where(table.c.idpel.in_(idpels))
+                       .order_by(table.c.idpel).with_for_update())
+
+
+def lock(connection, idpels):
+    """Lock the summary rows of ``idpels``; call before writing their source rows"""
+    idpels = sorted(set(idpels))
+    for start in range(0, len(idpels), BATCH):
+        _lock_rows(connection, idpels[start:start + BATCH])
+
+
+def refresh(connection, idpels):
+    """Recompute the summary rows of ``idpels``, locking any that ``lock()`` did not"""
+    idpels = sorted(set(idpels))
+    table = CustomerSummary.__table__
+    for start in range(0, len(idpels), BATCH):
+        batch = idpels[start:start + BATCH]
+        _lock_rows(connection, batch)
+        rows = _summarize(connection, batch, lock=True)
+        connection.execute(table.delete().where(table.c.idpel.in_(batch)))
+        if rows:
+            connection.execute(table.insert(), rows)
+
+
+def _touched_idpels(session):
+    idpels = set()
+    for obj in session.new:
+        if isinstance(obj, SOURCES):
+            idpels.add(obj.idpel)
+    for obj in list(session.deleted) + list(session.dirty):
+        if isinstance(obj, SOURCES) and (obj in session.deleted or session.is_modified(obj)):
+            # A changed idpel refreshes both the old and the new customer
+            idpels.update(attributes.get_history(obj, 'idpel').deleted or ())
+            idpels.add(obj.idpel)
+    idpels.discard(None)
+    return idpels
+
+
+def _before_flush(session, flush_context, instances):
+    idpels = _touched_idpels(session)
+    if idpels:
+        lock(session.connection(), idpels)
+
+
+def _after_flush(session, flush_context):
+    idpels = _touched_idpels(session)
+    if idpels:
+        refresh(session.connection(), idpels)
+
+
+def rebuild(connection=None):
+    """Recompute the whole table in idpel order, ``BATCH`` customers at a time"""
+    connection = connection or db.session.connection()
+    connection.execute(CustomerSummary.__table__.delete())
+    last = ''
+    total = 0
+    while True:
+        # The next BATCH idpels of each source, merged: every branch is a short index range
+        heads = [
+            select(model.idpel.label('idpel')).where(model.idpel > last)
+            .distinct().order_by(model.idpel).limit(BATCH).subquery()
+            for model in SOURCES
+        ]
+        known = union(*[select(head.c.idpel) for head in heads]).subquery()
+        batch = connection.execute(
+            select(known.c.idpel).order_by(known.c.idpel).limit(BATCH)
+        ).scalars().all()
+        if not batch:
+            return total
+        connection.execute(CustomerSummary.__table__.insert(), _summarize(connection, batch))
+        total += len(batch)
+        last = batch[-1]
+
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+    app.cli.add_command(customer_summary_cli)
+
+
+@customer_summary_cli.command('rebuild')
+def rebuild_command():
+    """Recompute customer_summary from transactions, talangan, anomalies and WA logs."""
+    count = rebuild()
+    db.session.commit()
+    click.echo(f'Customer summary rebuilt: {count} customers.')
@@ -0,0 +1,140 @@
+"""Cached dashboard statistics.
+
+All dashboard numbers are computed together (one conditional-aggregation
+query over the transaction rollup, the histogram and the recent rows) and
+stored as a single entry in a cachelib cache. The default filesystem backend
+is shared by every worker process on the host. The entry expires after
+``DASHBOARD_CACHE_TTL`` seconds and goes stale as soon as a transaction write
+commits, so the dashboard never shows stale counters for long.
+
+A commit does not delete the entry but stores a new invalidation generation
+next to it. Each entry is tagged with the generation read before its queries
+ran, and an entry whose tag is not the current generation counts as a miss.
+So a recompute that was already running when the write committed cannot
+bring its numbers back. Hit and miss counters are kept per worker process.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+from cachelib import FileSystemCache, SimpleCache, NullCache
+from sqlalchemy import case, event, func
+from app import db, loading
+from app.models import Transaction, TransactionDailyRollup
+
+CACHE_KEY = 'dashboard:stats'
+GENERATION_KEY = 'dashboard:generation'
+COUNTER_KEYS = ('hits', 'misses', 'invalidations', 'discarded')
+
+
+def status_counts_query():
+    """All, completed and pending transaction counts from the daily rollup"""
+    return db.session.query(
+        func.coalesce(func.sum(TransactionDailyRollup.txn_count), 0),
+        func.coalesce(func.sum(case((TransactionDailyRollup.status == 'completed', TransactionDailyRollup.txn_count), else_=0)), 0),
+        func.coalesce(func.sum(case((TransactionDailyRollup.status == 'pending', TransactionDailyRollup.txn_count), else_=0)), 0),
+    )
+
+
+def compute_stats():
+    """Run the dashboard queries and return a plain, picklable dict"""
+    from app import rollup
+
+    counts = status_counts_query().one()
+
+    six_months_ago = (datetime.now() - timedelta(days=180)).date()
+    months, monthly_counts, totals = rollup.monthly_histogram(six_months_ago)
+
+    recent = Transaction.query.options(*loading.transaction_officer()).order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(5).all()
+    recent_transactions = [{
+        'idpel': t.idpel,
+        'periode': t.periode,
+        'total': t.total,
+        'status': t.status,
+        'officer_name': t.officer.user.username if t.officer and t.officer.user else 'N/A',
+    } for t in recent]
+
+    return {
+        'total_transactions': int(counts[0]),
+        'completed_transactions': int(counts[1]),
+        'pending_transactions': int(counts[2]),
+        'months': months,
+        'counts': monthly_counts,
+        'totals': totals,
+        'recent_transactions': recent_transactions,
+    }
+
+
+class DashboardStats:
+    def __init__(self, app=None):
+        self.cache = NullCache()
+        self.ttl = 60
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('DASHBOARD_CACHE_TTL', 60)
+        cache_type = app.config.get('DASHBOARD_CACHE_TYPE', 'filesystem')
+        if cache_type == 'filesystem':
+            cache_dir = app.config.get('DASHBOARD_CACHE_DIR') or os.path.join(app.instance_path, 'dashboard_cache')
+            os.makedirs(cache_dir, exist_ok=True)
+            self.cache = FileSystemCache(cache_dir, default_timeout=0)
+        elif cache_type == 'simple':
+            self.cache = SimpleCache(default_timeout=0)
+        else:
+            self.cache = NullCache()
+
+        if not event.contains(db.session, 'after_flush', _mark_transaction_writes):
+            event.listen(db.session, 'after_flush', _mark_transaction_writes)
+            event.listen(db.session, 'after_commit', _invalidate_after_commit)
+            event.listen(db.session, 'after_rollback', _clear_write_mark)
+
+    def get(self):
+        generation = self.cache.get(GENERATION_KEY)
+        entry = self.cache.get(CACHE_KEY)
+        if entry is not None and entry[0] == generation:
+            self._counters['hits'] += 1
+            return entry[1]
+        self._counters['misses'] += 1
+        stats = compute_stats()
+        if self.cache.get(GENERATION_KEY) == generation:
+            self.cache.set(CACHE_KEY, (generation, stats), timeout=self.ttl)
+        else:
+            # A write committed while the queries ran; this request still
+            # shows the numbers, the next one recomputes
+            self._counters['discarded'] += 1
+        return stats
+
+    def invalidate(self):
+        # A fresh random generation rather than an increment, so two workers
+        # invalidating at once cannot land on a value an entry was tagged with
+        self.cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=0)
+        self._counters['invalidations'] += 1
+
+    def metrics(self):
+        values = dict(self._counters)
+        lookups = values['hits'] + values['misses']
+        values['hit_rate'] = round(values['hits'] / lookups, 4) if lookups else None
+        values['ttl'] = self.ttl
+        values['backend'] = type(self.cache).__name__
+        values['pid'] = os.getpid()
+        return values
+
+
+dashboard_stats = DashboardStats()
+
+
+def _mark_transaction_writes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Transaction):
+            session.info['dashboard_stale'] = True
+            return
+
+
+def _invalidate_after_commit(session):
+    if session.info.pop('dashboard_stale', False):
+        dashboard_stats.invalidate()
+
+
+def _clear_write_mark(session):
+    session.info.pop('dashboard_stale', None)
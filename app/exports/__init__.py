@@ -0,0 +1 @@
+"""Report export engines (Excel, CSV, PDF)"""
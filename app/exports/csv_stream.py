@@ -0,0 +1,62 @@
+"""Chunked CSV and gzip-CSV export.
+
+The response body is a generator: rows come off the database cursor in
+``yield_per`` batches, are written to a small text buffer and flushed to the
+client every ``CHUNK_ROWS`` rows. No Content-Length is sent, so the server
+uses chunked transfer encoding and the first bytes leave while the query is
+still being read. For ``csv.gz`` the same chunks go through an incremental
+gzip compressor.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from flask import Response, stream_with_context
+from app.exports.xlsx import stream_rows
+from app.exports.columns import headers_for, iter_formatted_batches
+
+CSV_FORMATS = ('csv', 'csv.gz')
+CHUNK_ROWS = 1000
+
+
+def iter_csv(rows, columns, chunk_rows=CHUNK_ROWS):
+    """Yield UTF-8 encoded CSV chunks for ``rows``, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers_for(columns, 'csv'))
+    for batch in iter_formatted_batches(rows, columns, 'csv', chunk_rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress an iterable of byte chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_query_to_csv(query, columns, filename_prefix, compress=False):
+    """Return a chunked CSV (or csv.gz) response streamed from ``query``"""
+    body = iter_csv(stream_rows(query), columns)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if compress:
+        body = iter_gzip(body)
+        mimetype = 'application/gzip'
+        filename = f'{filename_prefix}_{timestamp}.csv.gz'
+    else:
+        mimetype = 'text/csv'
+        filename = f'{filename_prefix}_{timestamp}.csv'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
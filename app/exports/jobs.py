@@ -0,0 +1,102 @@
+"""Background export jobs.
+
+A request queues a ``ReportExport`` row and returns straight away. A small
+thread pool in the web process builds the file into ``EXPORT_DIR`` (default
+``instance/exports``) using the same engines as the synchronous routes, then
+marks the row completed (or failed, with the error). Users follow their jobs
+on the export status page and download finished files from there.
+
+The directory is outside ``static/``, so a finished file is only served by
+the download route, to the user who queued it. ``exported_at`` is the time
+the job was queued and never changes; the export list pages on it.
+Jobs live in the process that queued them: a job that was queued or running
+when its worker process exited stays in that state and can be queued again.
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.replica import reading_from_replica
+from app.models import ReportExport
+from app.exports.registry import EXPORT_FORMATS, get_report, write_export
+
+
+
+class ExportJobRunner:
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        workers = app.config.get('EXPORT_WORKERS', 2)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        os.makedirs(self.export_dir(app), exist_ok=True)
+
+    @staticmethod
+    def export_dir(app=None):
+        app = app or current_app
+        return app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+
+    def path_for(self, job, app=None):
+        """Where the file of ``job`` is (or will be) written"""
+        return os.path.join(self.export_dir(app), os.path.basename(job.file_path))
+
+    def submit(self, user_id, report_name, format):
+        """Queue an export and return its ``ReportExport`` row"""
+        report = get_report(report_name)
+        if report is None or format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export {report_name}/{format}')
+
+        extension = EXPORT_FORMATS[format][0]
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f'{report.prefix_for(format)}_{timestamp}_{uuid.uuid4().hex}.{extension}'
+        job = ReportExport(
+            user_id=user_id,
+            report_type=report_name,
+            format=format,
+            status='queued',
+            file_path=filename,
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.executor.submit(self._run, job.id)
+        return job
+
+    def _run(self, job_id):
+        # Leaving the app context removes the scoped session for this thread
+        with self.app.app_context():
+            job = db.session.get(ReportExport, job_id)
+            if job is None:
+                return
+            job.status = 'running'
+            db.session.commit()
+
+            path = self.path_for(job, self.app)
+            try:
+                with open(path, 'wb') as output, reading_from_replica():
+                    write_export(get_report(job.report_type), job.format, output,
+                                 pdf_workers=self.app.config.get('PDF_RENDER_WORKERS', 1))
+            except Exception as exc:
+                db.session.rollback()
+                if os.path.exists(path):
+                    os.remove(path)
+                self.app.logger.exception('Export job %s failed', job_id)
+                self._finish(job_id, 'failed', str(exc)[:1000])
+            else:
+                self._finish(job_id, 'completed')
+
+    def _finish(self, job_id, status, error=None):
+        job = db.session.get(ReportExport, job_id)
+        job.status = status
+        job.error = error
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+
+
+export_jobs = ExportJobRunner()
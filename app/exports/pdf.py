@@ -0,0 +1,187 @@
+"""Paged PDF export.
+
+ReportLab's ``SimpleDocTemplate`` lays out one big ``Table`` at once and
+re-splits it on every page break, which is what made large reports take
+minutes. Here rows are cut into page-sized chunks up front and each chunk
+is drawn as its own small table with the header row repeated, directly onto
+a canvas. Layout work per page is constant, so total time grows linearly with
+the number of rows and only one batch of rows is held in memory.
+
+With ``workers > 1`` and pypdf installed, batches of pages are rendered in a
+process pool and the partial PDFs are concatenated in order.
+"""
+import io
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from flask import send_file, current_app
+from app.exports.xlsx import stream_rows
+from app.exports.columns import headers_for, iter_formatted
+
+# 35 rows of 13pt plus the header and first-page title fit landscape A4
+ROWS_PER_PAGE = 35
+PAGES_PER_BATCH = 25
+
+_pool = None
+_pool_workers = 0
+
+
+def _require_reportlab():
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        raise ImportError("reportlab is required for PDF export. Install it with: pip install reportlab")
+
+
+def _page_layout(headers):
+    from reportlab.lib.pagesizes import A4, landscape
+    pagesize = landscape(A4) if len(headers) > 5 else A4
+    margin = 36
+    width = pagesize[0] - 2 * margin
+    col_widths = [width / len(headers)] * len(headers)
+    return pagesize, margin, col_widths
+
+
+def _table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('FONTSIZE', (0, 1), (-1, -1), 7),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ])
+
+
+def _truncate(text, width):
+    # Rough Helvetica 7pt fit: about 3.6pt per character
+    limit = max(4, int(width / 3.6))
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def render_pages(pages, headers, title=None, first_page_number=1, output=None):
+    """Render pre-chunked pages of formatted rows.
+
+    Writes to ``output`` when given, otherwise returns the PDF bytes.
+    """
+    _require_reportlab()
+    from reportlab.pdfgen import canvas
+    from reportlab.platypus import Table
+
+    pagesize, margin, col_widths = _page_layout(headers)
+    style = _table_style()
+    target = output if output is not None else io.BytesIO()
+    pdf = canvas.Canvas(target, pagesize=pagesize, pageCompression=1)
+    page_number = first_page_number
+
+    for rows in pages:
+        top = pagesize[1] - margin
+        if title and page_number == 1:
+            pdf.setFont('Helvetica-Bold', 16)
+            pdf.drawCentredString(pagesize[0] / 2, top - 16, title)
+            top -= 36
+
+        data = [headers] + [[_truncate(v, w) for v, w in zip(row, col_widths)] for row in rows]
+        table = Table(data, colWidths=col_widths, rowHeights=[18] + [13] * len(rows))
+        table.setStyle(style)
+        _width, height = table.wrapOn(pdf, pagesize[0] - 2 * margin, top - margin)
+        table.drawOn(pdf, margin, top - height)
+
+        pdf.setFont('Helvetica', 7)
+        pdf.drawRightString(pagesize[0] - margin, margin / 2, f'Page {page_number}')
+        pdf.showPage()
+        page_number += 1
+
+    pdf.save()
+    if output is None:
+        return target.getvalue()
+
+
+def _chunk(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _batches(rows, columns, rows_per_page, pages_per_batch):
+    pages = _chunk(iter_formatted(rows, columns, 'pdf'), rows_per_page)
+    first = next(pages, [])
+    # An empty report still gets one page with the title and header row
+    return _chunk(_prepend(first, pages), pages_per_batch)
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def write_pdf(rows, columns, fileobj, title=None, workers=1,
+              rows_per_page=ROWS_PER_PAGE, pages_per_batch=PAGES_PER_BATCH):
+    """Render ``rows`` to ``fileobj`` as a paged PDF with one table column per export column"""
+    headers = [str(h) for h in headers_for(columns, 'pdf')]
+    batches = _batches(rows, columns, rows_per_page, pages_per_batch)
+
+    try:
+        from pypdf import PdfWriter, PdfReader
+    except ImportError:
+        workers = 1
+
+    if workers <= 1:
+        # One canvas, one batch of rows in memory at a time
+        pages = (page for batch in batches for page in batch)
+        render_pages(pages, headers, title, output=fileobj)
+        return
+
+    writer = PdfWriter()
+    pool = _get_pool(workers)
+    in_flight = []
+    page_number = 1
+    for batch in batches:
+        in_flight.append(pool.submit(render_pages, batch, headers, title, page_number))
+        page_number += len(batch)
+        # Keep at most two batches per worker queued
+        if len(in_flight) >= workers * 2:
+            _append_pdf(writer, PdfReader, in_flight.pop(0).result())
+    for future in in_flight:
+        _append_pdf(writer, PdfReader, future.result())
+    writer.write(fileobj)
+
+
+def _append_pdf(writer, reader_class, data):
+    for page in reader_class(io.BytesIO(data)).pages:
+        writer.add_page(page)
+
+
+def export_query_to_pdf(query, columns, filename_prefix, title='Report'):
+    """Render ``query`` to a paged PDF and return a file response"""
+    output = tempfile.TemporaryFile()
+    workers = current_app.config.get('PDF_RENDER_WORKERS', 1)
+    write_pdf(stream_rows(query), columns, output, title=title, workers=workers)
+    output.seek(0)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return send_file(
+        output,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'{filename_prefix}_{timestamp}.pdf'
+    )
@@ -0,0 +1,151 @@
+"""Catalogue of exportable reports.
+
+Every report that can be exported is declared once here: the query that
+produces its rows, its typed columns (see ``app.exports.columns``) and its
+title. The synchronous export routes and the background export jobs both
+look reports up by name, so the two paths always produce the same file.
+"""
+from sqlalchemy import func
+from app import db, rollup, tunggakan
+from app.models import Transaction, Officer, User
+from app.exports.xlsx import export_query_to_xlsx, write_xlsx, stream_rows
+from app.exports.csv_stream import export_query_to_csv, iter_csv, iter_gzip
+from app.exports.pdf import export_query_to_pdf, write_pdf
+from app.exports.columns import ExportColumn
+
+# format name -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'pdf': ('pdf', 'application/pdf'),
+}
+
+
+class ReportDefinition:
+    def __init__(self, name, query, columns, title, filename_prefix, excel_prefix=None):
+        self.name = name
+        self.query = query
+        self.columns = columns
+        self.title = title
+        self.filename_prefix = filename_prefix
+        self.excel_prefix = excel_prefix or filename_prefix
+
+    def prefix_for(self, format):
+        return self.excel_prefix if format == 'excel' else self.filename_prefix
+
+
+REPORTS = {}
+
+
+def register_report(name, query, columns, title, filename_prefix, excel_prefix=None):
+    REPORTS[name] = ReportDefinition(name, query, columns, title, filename_prefix, excel_prefix)
+    return REPORTS[name]
+
+
+def get_report(name):
+    return REPORTS.get(name)
+
+
+def export_response(report, format):
+    """Build ``report`` in ``format`` inside the request and return the response"""
+    prefix = report.prefix_for(format)
+    if format == 'excel':
+        return export_query_to_xlsx(report.query(), report.columns, prefix)
+    if format in ('csv', 'csv.gz'):
+        return export_query_to_csv(report.query(), report.columns, prefix, compress=format == 'csv.gz')
+    if format == 'pdf':
+        return export_query_to_pdf(report.query(), report.columns, prefix, report.title)
+    raise ValueError(f'Unsupported export format: {format}')
+
+
+def write_export(report, format, fileobj, pdf_workers=1):
+    """Write ``report`` in ``format`` to a binary file object"""
+    rows = stream_rows(report.query())
+    if format == 'excel':
+        write_xlsx(rows, report.columns, fileobj)
+    elif format in ('csv', 'csv.gz'):
+        chunks = iter_csv(rows, report.columns)
+        if format == 'csv.gz':
+            chunks = iter_gzip(chunks)
+        for chunk in chunks:
+            fileobj.write(chunk)
+    elif format == 'pdf':
+        write_pdf(rows, report.columns, fileobj, title=report.title, workers=pdf_workers)
+    else:
+        raise ValueError(f'Unsupported export format: {format}')
+
+
+def tunggakan_export_query():
+    """Pending transactions projected to flat export columns, in id order"""
+    return db.session.query(
+        Transaction.id,
+        Transaction.idpel,
+        Transaction.periode,
+        Transaction.total,
+        Transaction.payment_type,
+        Transaction.status,
+        func.coalesce(User.username, 'N/A').label('officer_name'),
+        Transaction.created_at
+    ).outerjoin(Officer, Officer.id == Transaction.officer_id).outerjoin(
+        User, User.id == Officer.user_id
+    ).filter(Transaction.status == 'pending').order_by(Transaction.id)
+
+
+def _summary_columns(key, label):
+    return [
+        ExportColumn(key, label, 'text'),
+        ExportColumn('count', 'Count', 'int'),
+        ExportColumn('total', 'Total', 'decimal'),
+    ]
+
+
+register_report('rbm', rollup.rbm_summary, _summary_columns('rbm_code', 'RBM Code'),
+                'RBM Report', 'rbm_report')
+register_report('coordinator', rollup.coordinator_summary, _summary_columns('username', 'Username'),
+                'Coordinator Report', 'coordinator_report')
+register_report('officer', rollup.officer_summary, _summary_columns('username', 'Username'),
+                'Officer Report', 'officer_report')
+register_report('area', rollup.area_summary, _summary_columns('name', 'Area'),
+                'Area Report', 'area_report')
+register_report('tunggakan', tunggakan_export_query, [
+    ExportColumn('id', 'ID', 'int'),
+    ExportColumn('idpel', 'ID Pelanggan', 'text'),
+    ExportColumn('periode', 'Periode', 'date'),
+    ExportColumn('total', 'Total', 'decimal'),
+    ExportColumn('payment_type', 'Tipe Pembayaran', 'text'),
+    ExportColumn('status', 'Status', 'text'),
+    ExportColumn('officer_name', 'Petugas', 'text'),
+    ExportColumn('created_at', 'Tanggal Dibuat', 'datetime'),
+], 'Outstanding Payment Report', 'tunggakan_report', excel_prefix='transactions')
+
+
+def _aging_columns():
+    return [
+        ExportColumn('customers', 'Pelanggan', 'int'),
+        ExportColumn('months', 'Bulan Tunggakan', 'int'),
+        ExportColumn('days_0_30', '0-30 Hari', 'decimal'),
+        ExportColumn('days_31_60', '31-60 Hari', 'decimal'),
+        ExportColumn('days_61_90', '61-90 Hari', 'decimal'),
+        ExportColumn('days_over_90', '> 90 Hari', 'decimal'),
+        ExportColumn('total', 'Total', 'decimal'),
+    ]
+
+
+register_report('tunggakan_customers', tunggakan.customer_export_rows, [
+    ExportColumn('idpel', 'ID Pelanggan', 'text'),
+    ExportColumn('officer_name', 'Petugas', 'text'),
+    ExportColumn('area_name', 'Area', 'text'),
+    ExportColumn('months', 'Bulan Tunggakan', 'int'),
+    ExportColumn('oldest', 'Periode Tertua', 'date'),
+    ExportColumn('days_overdue', 'Hari Tunggakan', 'int'),
+    ExportColumn('bucket', 'Umur', 'text'),
+] + _aging_columns()[2:], 'Arrears Aging by Customer', 'tunggakan_aging_customers')
+register_report('tunggakan_officers', tunggakan.officer_export_rows, [
+    ExportColumn('officer_name', 'Petugas', 'text'),
+    ExportColumn('area_code', 'Kode Area', 'text'),
+] + _aging_columns(), 'Arrears Aging by Officer', 'tunggakan_aging_officers')
+register_report('tunggakan_areas', tunggakan.area_export_rows, [
+    ExportColumn('area_code', 'Kode Area', 'text'),
+    ExportColumn('area_name', 'Area', 'text'),
+] + _aging_columns(), 'Arrears Aging by Area', 'tunggakan_aging_areas')
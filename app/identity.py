@@ -0,0 +1,146 @@
+"""Per-process cache of logged-in user identities.
+
+``login_manager.user_loader`` runs on every authenticated request. Instead of
+an ORM ``User`` it returns a ``UserSnapshot``: a small immutable record of the
+columns views and templates read from ``current_user`` (id, username, role,
+area, active flags and the officer id), loaded with one query and kept in a
+bounded LRU for ``IDENTITY_CACHE_TTL`` seconds.
+
+A session flush hook notes every ``User`` or ``Officer`` that is inserted,
+changed or deleted, and their cache entries are dropped once the transaction
+commits, so master-data edits, officer toggles, IMEI resets and password
+changes are seen on the next request in this process. Other worker processes
+pick them up when their entry expires, so keep the TTL short. Bulk updates
+that bypass the ORM call ``identity_cache.clear()``.
+
+Code that needs the ORM object (to change a password, say) loads it with
+``current_user.load()``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from app import db
+from app.models import User, Officer
+
+COUNTER_KEYS = ('hits', 'misses', 'invalidations', 'evictions')
+
+
+class UserSnapshot(UserMixin):
+    __slots__ = ('id', 'username', 'role', 'area_code', 'active', 'officer_id', 'officer_active')
+
+    def __init__(self, id, username, role, area_code, active, officer_id, officer_active):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.area_code = area_code
+        self.active = active
+        self.officer_id = officer_id
+        self.officer_active = officer_active
+
+    def get_id(self):
+        return str(self.id)
+
+    def load(self):
+        """The ORM ``User`` row, for writes"""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+def load_snapshot(user_id):
+    row = db.session.execute(
+        select(User.id, User.username, User.role, User.area_code, User.active, Officer.id, Officer.active)
+        .outerjoin(Officer, Officer.user_id == User.id)
+        .where(User.id == user_id)
+        .limit(1)
+    ).first()
+    return UserSnapshot(*row) if row else None
+
+
+class IdentityCache:
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_size = 5000
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', 5000)
+        if not event.contains(db.session, 'after_flush', _mark_identity_writes):
+            event.listen(db.session, 'after_flush', _mark_identity_writes)
+            event.listen(db.session, 'after_commit', _invalidate_after_commit)
+            event.listen(db.session, 'after_rollback', _clear_write_marks)
+
+    def get(self, user_id):
+        """Return the snapshot of ``user_id`` (``None`` if there is no such user)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self._counters['hits'] += 1
+                return entry[1]
+            self._counters['misses'] += 1
+
+        snapshot = load_snapshot(user_id)
+        if snapshot is None or self.ttl <= 0:
+            return snapshot
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+        return snapshot
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+            self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters['invalidations'] += 1
+
+    def metrics(self):
+        with self._lock:
+            values = dict(self._counters, size=len(self._entries))
+        lookups = values['hits'] + values['misses']
+        values['hit_rate'] = round(values['hits'] / lookups, 4) if lookups else None
+        values['ttl'] = self.ttl
+        values['max_size'] = self.max_size
+        return values
+
+
+identity_cache = IdentityCache()
+
+
+def _mark_identity_writes(session, flush_context):
+    stale = session.info.setdefault('identity_stale', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            stale.add(obj.id)
+        elif isinstance(obj, Officer):
+            stale.add(obj.user_id)
+    stale.discard(None)
+    if not stale:
+        session.info.pop('identity_stale')
+
+
+def _invalidate_after_commit(session):
+    stale = session.info.pop('identity_stale', None)
+    if stale:
+        identity_cache.invalidate(*stale)
+
+
+def _clear_write_marks(session):
+    session.info.pop('identity_stale', None)
@@ -0,0 +1,4 @@
+"""Bulk data imports (transaction spreadsheets, officer onboarding)"""
+from flask.cli import AppGroup
+
+import_cli = AppGroup('import', help='Bulk data imports.')
@@ -0,0 +1,73 @@
+"""Reading import files (CSV, csv.gz, XLSX) as chunks of text columns"""
+from datetime import datetime
+from itertools import islice
+import numpy as np
+import pandas as pd
+
+IMPORT_EXTENSIONS = ('.csv', '.csv.gz', '.xlsx')
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (format or missing columns)"""
+
+
+def allowed_file(filename):
+    return (filename or '').lower().endswith(IMPORT_EXTENSIONS)
+
+
+def _normalize_columns(frame, required, optional, aliases):
+    names = [str(c).strip().lower() for c in frame.columns]
+    frame.columns = [aliases.get(name, name) for name in names]
+    missing = [c for c in required if c not in frame.columns]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    for column, default in optional.items():
+        if column not in frame.columns:
+            frame[column] = default
+    return frame
+
+
+def _xlsx_chunks(path, chunk_rows):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError('The file is empty')
+        header = [str(h) if h is not None else '' for h in header]
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                return
+            frame = pd.DataFrame(chunk, columns=header)
+            # Cells come back typed; validate them as text like CSV values
+            for column in frame.columns:
+                values = frame[column].map(lambda v: v.isoformat() if isinstance(v, datetime) else v)
+                frame[column] = values.astype(object).where(values.notna(), '').astype(str)
+            yield frame
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunk_rows, required, optional=None, aliases=None):
+    """Yield DataFrames of text columns with a ``line`` column (file line numbers).
+
+    Column names are matched case-insensitively after applying ``aliases``;
+    missing ``optional`` columns are filled with their default.
+    """
+    lower = path.lower()
+    if lower.endswith('.csv') or lower.endswith('.csv.gz'):
+        chunks = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows,
+                             skipinitialspace=True, compression='infer')
+    elif lower.endswith('.xlsx'):
+        chunks = _xlsx_chunks(path, chunk_rows)
+    else:
+        raise ImportFileError(f"Unsupported file type; use {', '.join(IMPORT_EXTENSIONS)}")
+
+    first_line = 2
+    for frame in chunks:
+        frame = _normalize_columns(frame, required, optional or {}, aliases or {})
+        frame['line'] = np.arange(first_line, first_line + len(frame))
+        first_line += len(frame)
+        yield frame
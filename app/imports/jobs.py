@@ -0,0 +1,110 @@
+"""Background transaction imports.
+
+An upload is saved under ``UPLOAD_FOLDER/imports`` and tracked by a
+``TransactionImport`` row. A single worker thread per web process (imports
+write heavily; running several at once only makes them contend for the same
+indexes) runs ``import_file`` and stores the running counters on the row after
+every committed batch, so the upload page can show progress. Rejected rows go
+to a CSV next to the upload.
+
+As with exports, a job that was queued or running when its process exited
+stays in that state; the batches it committed are kept and the file can be
+uploaded again, since rows are upserted on (idpel, periode).
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from werkzeug.utils import secure_filename
+from app import db
+from app.models import TransactionImport
+from app.imports.files import IMPORT_EXTENSIONS, allowed_file
+from app.imports.transactions import import_file
+
+IMPORT_SUBDIR = 'imports'
+
+
+class ImportJobRunner:
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        workers = app.config.get('IMPORT_WORKERS', 1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import')
+        os.makedirs(self.import_dir(app), exist_ok=True)
+
+    @staticmethod
+    def import_dir(app=None):
+        app = app or current_app
+        return os.path.join(app.config['UPLOAD_FOLDER'], IMPORT_SUBDIR)
+
+    def submit(self, user_id, upload):
+        """Save an uploaded ``FileStorage`` and queue its import; returns the ``TransactionImport``"""
+        if not allowed_file(upload.filename):
+            raise ValueError(f"Unsupported file type; use {', '.join(IMPORT_EXTENSIONS)}")
+
+        original = secure_filename(upload.filename) or 'transactions.csv'
+        filename = f'{uuid.uuid4().hex}_{original}'
+        upload.save(os.path.join(self.import_dir(), filename))
+        job = TransactionImport(
+            user_id=user_id,
+            filename=original,
+            file_path=os.path.join(IMPORT_SUBDIR, filename),
+            status='queued',
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        self.executor.submit(self._run, job.id)
+        return job
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            job = db.session.get(TransactionImport, job_id)
+            if job is None:
+                return
+            job.status = 'running'
+            job.rejects_path = os.path.splitext(job.file_path)[0] + '_rejects.csv'
+            db.session.commit()
+
+            folder = self.app.config['UPLOAD_FOLDER']
+            try:
+                result = import_file(os.path.join(folder, job.file_path),
+                                     os.path.join(folder, job.rejects_path),
+                                     progress=lambda result: self._progress(job_id, result))
+            except Exception as exc:
+                db.session.rollback()
+                self.app.logger.exception('Import job %s failed', job_id)
+                self._finish(job_id, 'failed', error=str(exc)[:1000])
+            else:
+                self._finish(job_id, 'completed', result)
+
+    def _progress(self, job_id, result):
+        job = db.session.get(TransactionImport, job_id)
+        job.total_rows = result.rows
+        job.inserted = result.inserted
+        job.updated = result.updated
+        job.rejected = result.rejected
+        db.session.commit()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        if result is not None:
+            self._progress(job_id, result)
+        job = db.session.get(TransactionImport, job_id)
+        job.status = status
+        job.error = error
+        job.completed_at = datetime.utcnow()
+        if not job.rejected:
+            path = os.path.join(self.app.config['UPLOAD_FOLDER'], job.rejects_path or '')
+            if job.rejects_path and os.path.exists(path):
+                os.remove(path)
+            job.rejects_path = None
+        db.session.commit()
+
+
+import_jobs = ImportJobRunner()
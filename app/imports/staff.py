@@ -0,0 +1,218 @@
+"""Bulk onboarding of field officers and coordinators.
+
+A CSV or XLSX file lists ``username`` and ``password`` plus optional
+``role`` (field_officer or coordinator, default field_officer),
+``area_code``, ``rbm_code`` and ``coordinator`` (the username of an existing
+coordinator or of one in the same file).
+
+The whole file is validated first. Usernames already taken are found with
+set-based ``IN`` queries (one per 1000 names) rather than one lookup per row,
+and areas and coordinators come from one query each.
+Password hashing is deliberately slow, so it runs in a process pool
+(``PASSWORD_HASH_WORKERS`` processes) before any row is written. The
+``users`` and ``officers`` rows are then inserted with executemany batches in
+one transaction: either every valid row is onboarded or none is.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import click
+import pandas as pd
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Officer, Area
+from app.imports import files, import_cli
+from app.imports.files import ImportFileError
+
+REQUIRED_COLUMNS = ('username', 'password')
+OPTIONAL_COLUMNS = {'role': 'field_officer', 'area_code': '', 'rbm_code': '', 'coordinator': ''}
+COLUMN_ALIASES = {'area': 'area_code', 'rbm': 'rbm_code', 'coordinator_username': 'coordinator'}
+ROLES = ('field_officer', 'coordinator')
+# Rows per read chunk and per INSERT batch
+BATCH_ROWS = 1000
+MAX_USERNAME = 50
+
+_pool = None
+_pool_workers = 0
+
+
+class StaffImportResult:
+    def __init__(self, rows, coordinators=0, officers=0, rejects=None):
+        self.rows = rows
+        self.coordinators = coordinators
+        self.officers = officers
+        # [(line, username, reason)]
+        self.rejects = rejects or []
+
+    @property
+    def rejected(self):
+        return len(self.rejects)
+
+    def as_dict(self):
+        return {'rows': self.rows, 'coordinators': self.coordinators, 'officers': self.officers,
+                'rejected': self.rejected}
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def hash_passwords(passwords, workers=1):
+    """Hash ``passwords`` in order, spread over ``workers`` processes"""
+    if workers <= 1 or len(passwords) < 2:
+        return [generate_password_hash(p) for p in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(_get_pool(workers).map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def read_file(path):
+    chunks = files.read_chunks(path, BATCH_ROWS, REQUIRED_COLUMNS, OPTIONAL_COLUMNS, COLUMN_ALIASES)
+    frames = list(chunks)
+    if not frames:
+        raise ImportFileError('The file has no rows')
+    return pd.concat(frames, ignore_index=True)
+
+
+def _or_none(values):
+    return values.astype(object).where(values != '', None)
+
+
+def validate(frame):
+    """Return ``(valid, rejects, coordinator_ids)``.
+
+    ``valid`` is a DataFrame of the rows to create, ``rejects`` a list of
+    ``(line, username, reason)`` and ``coordinator_ids`` maps lower-cased
+    usernames of existing coordinators to their user id.
+    """
+    username = frame['username'].str.strip()
+    folded = username.str.lower()
+    role = frame['role'].str.strip().str.lower().replace('', OPTIONAL_COLUMNS['role'])
+    area_code = frame['area_code'].str.strip()
+    coordinator = frame['coordinator'].str.strip().str.lower()
+
+    names = [n for n in username.unique() if n]
+    taken = set()
+    for start in range(0, len(names), BATCH_ROWS):
+        taken.update(n.lower() for n in db.session.execute(
+            select(User.username).where(User.username.in_(names[start:start + BATCH_ROWS]))
+        ).scalars())
+    areas = set(db.session.execute(select(Area.code)).scalars())
+
+    checks = [
+        ((username == '') | (username.str.len() > MAX_USERNAME), 'invalid username'),
+        (folded.isin(taken), 'username already exists'),
+        (folded.duplicated(keep='first'), 'duplicate username in file'),
+        (frame['password'] == '', 'missing password'),
+        (~role.isin(ROLES), 'invalid role'),
+        ((area_code != '') & ~area_code.isin(areas), 'unknown area'),
+    ]
+    reason = pd.Series('', index=frame.index)
+    for failed, message in reversed(checks):
+        reason = reason.mask(failed, message)
+
+    # Officers may name a coordinator created by the same file, if that row is valid
+    existing = {name.lower(): user_id for user_id, name in db.session.execute(
+        select(User.id, User.username).where(User.role == 'coordinator')
+    )}
+    new_coordinators = set(folded[(reason == '') & (role == 'coordinator')])
+    unknown = ((role == 'field_officer') & (coordinator != '')
+               & ~coordinator.isin(existing) & ~coordinator.isin(new_coordinators))
+    reason = reason.mask((reason == '') & unknown, 'unknown coordinator')
+
+    ok = reason == ''
+    valid = pd.DataFrame({
+        'username': username[ok],
+        'password': frame['password'][ok],
+        'role': role[ok],
+        'area_code': _or_none(area_code[ok]),
+        'rbm_code': _or_none(frame['rbm_code'][ok].str.strip()),
+        'coordinator': coordinator[ok],
+    })
+    rejects = list(zip(frame['line'][~ok], username[~ok], reason[~ok]))
+    return valid, rejects, existing
+
+
+def _insert(connection, table, rows):
+    for start in range(0, len(rows), BATCH_ROWS):
+        connection.execute(table.insert(), rows[start:start + BATCH_ROWS])
+
+
+def _user_ids(connection, usernames):
+    ids = {}
+    for start in range(0, len(usernames), BATCH_ROWS):
+        for user_id, username in connection.execute(
+            select(User.id, User.username).where(User.username.in_(usernames[start:start + BATCH_ROWS]))
+        ):
+            ids[username.lower()] = user_id
+    return ids
+
+
+def import_staff(path, workers=None):
+    """Onboard the valid rows of ``path``; returns a ``StaffImportResult``.
+
+    Nothing is written when no row is valid. Raises ``ImportFileError`` for an
+    unreadable file or if a username was taken while the passwords were hashed.
+    """
+    if workers is None:
+        workers = current_app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+    frame = read_file(path)
+    valid, rejects, coordinator_ids = validate(frame)
+    result = StaffImportResult(len(frame), rejects=rejects)
+    if valid.empty:
+        return result
+
+    hashes = hash_passwords(valid['password'].tolist(), workers)
+    now = datetime.utcnow()
+    users = [
+        {'username': row.username, 'password_hash': password_hash, 'role': row.role,
+         'area_code': row.area_code, 'active': True, 'created_at': now}
+        for row, password_hash in zip(valid.itertuples(index=False), hashes)
+    ]
+
+    connection = db.session.connection()
+    try:
+        _insert(connection, User.__table__, users)
+        ids = _user_ids(connection, valid['username'].tolist())
+        coordinator_ids.update(
+            (name.lower(), ids[name.lower()]) for name in valid['username'][valid['role'] == 'coordinator']
+        )
+        officers = [
+            {'user_id': ids[row.username.lower()], 'rbm_code': row.rbm_code,
+             'coordinator_id': coordinator_ids.get(row.coordinator), 'active': True,
+             'created_at': now, 'updated_at': now}
+            for row in valid.itertuples(index=False) if row.role == 'field_officer'
+        ]
+        _insert(connection, Officer.__table__, officers)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise ImportFileError('Some usernames were created while the file was being imported; '
+                              'nothing was saved, please import the file again.')
+
+    result.officers = len(officers)
+    result.coordinators = len(users) - len(officers)
+    return result
+
+
+@import_cli.command('staff')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, help='Password hashing processes (default PASSWORD_HASH_WORKERS or CPU count).')
+def import_staff_command(path, workers):
+    """Create field officers and coordinators from a CSV or XLSX file."""
+    try:
+        result = import_staff(path, workers)
+    except ImportFileError as exc:
+        raise click.ClickException(str(exc))
+    for line, username, reason in result.rejects:
+        click.echo(f'line {line}: {username or "-"}: {reason}', err=True)
+    click.echo(f'Created {result.officers} officers and {result.coordinators} coordinators; '
+               f'{result.rejected} of {result.rows} rows rejected.')
@@ -0,0 +1,224 @@
+"""Bulk transaction import from CSV, csv.gz or XLSX files.
+
+The file is read in chunks of ``BATCH_ROWS`` rows. Each chunk is validated
+column by column with pandas; officers (by username or id) are resolved from
+a single lookup loaded once per import. Valid rows are upserted with
+multi-row ``INSERT ... ON DUPLICATE KEY UPDATE`` (``ON CONFLICT`` on SQLite)
+keyed on the unique ``(idpel, periode)`` index, and every chunk is committed
+on its own, so an interrupted import keeps the batches already written and
+can simply be run again.
+
+Core statements bypass the ORM flush hooks, so each batch updates the derived
+tables itself in the same transaction: rollup deltas computed from the rows
+it replaces, new idpels in the search index and the touched customers'
+summaries.
+
+Expected columns: ``idpel``, ``periode``, ``total``, ``officer`` (username or
+officer id) and optionally ``payment_type`` (default cash) and ``status``
+(default pending). Rejected rows are reported with their file line number.
+"""
+import csv
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+import click
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, tuple_
+from app import db, rollup, customer_search, customer_summary
+from app.models import Transaction, Officer, User
+from app.imports import files, import_cli
+from app.imports.files import ImportFileError
+
+BATCH_ROWS = 5000
+REQUIRED_COLUMNS = ('idpel', 'periode', 'total', 'officer')
+OPTIONAL_COLUMNS = {'payment_type': 'cash', 'status': 'pending'}
+COLUMN_ALIASES = {'officer_id': 'officer', 'officer_username': 'officer', 'username': 'officer'}
+PAYMENT_TYPES = ('cash', 'installment', 'transfer')
+STATUSES = ('pending', 'completed', 'failed')
+# transactions.total is DECIMAL(10, 2)
+MAX_TOTAL = 99999999.99
+REJECT_COLUMNS = ('line', 'reason', *REQUIRED_COLUMNS, *OPTIONAL_COLUMNS)
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+
+    def as_dict(self):
+        return {'rows': self.rows, 'inserted': self.inserted, 'updated': self.updated, 'rejected': self.rejected}
+
+
+# Reading
+
+def read_chunks(path, chunk_rows=BATCH_ROWS):
+    return files.read_chunks(path, chunk_rows, REQUIRED_COLUMNS, OPTIONAL_COLUMNS, COLUMN_ALIASES)
+
+
+# Validation
+
+def officer_lookup():
+    """Map lower-cased username and str(officer id) to officer id, from one query"""
+    lookup = {}
+    for officer_id, username in db.session.query(Officer.id, User.username).join(User, Officer.user_id == User.id):
+        lookup[str(officer_id)] = officer_id
+        lookup[username.lower()] = officer_id
+    return lookup
+
+
+def validate(frame, officers):
+    """Split a chunk into ``(valid, rejects)``.
+
+    ``valid`` has typed columns ready for insert, deduplicated on
+    (idpel, periode) with the last row winning; ``rejects`` has ``line``,
+    ``reason`` and the original values.
+    """
+    idpel = frame['idpel'].str.strip()
+    periode = pd.to_datetime(frame['periode'].str.strip(), errors='coerce', format='ISO8601')
+    total = pd.to_numeric(frame['total'].str.strip().str.replace(',', '', regex=False), errors='coerce')
+    payment_type = frame['payment_type'].str.strip().str.lower().replace('', OPTIONAL_COLUMNS['payment_type'])
+    status = frame['status'].str.strip().str.lower().replace('', OPTIONAL_COLUMNS['status'])
+    officer_id = frame['officer'].str.strip().str.lower().map(officers)
+
+    checks = [
+        ((idpel == '') | (idpel.str.len() > 20), 'invalid idpel'),
+        (periode.isna(), 'invalid periode'),
+        (total.isna() | (total < 0) | (total > MAX_TOTAL), 'invalid total'),
+        (~payment_type.isin(PAYMENT_TYPES), 'invalid payment_type'),
+        (~status.isin(STATUSES), 'invalid status'),
+        (officer_id.isna(), 'unknown officer'),
+    ]
+    reason = pd.Series(np.select([c.to_numpy() for c, _ in checks], [r for _, r in checks], default=''),
+                       index=frame.index)
+    ok = reason == ''
+
+    valid = pd.DataFrame({
+        'idpel': idpel[ok],
+        'periode': periode[ok].dt.date,
+        'total': total[ok].round(2),
+        'payment_type': payment_type[ok],
+        'status': status[ok],
+        'officer_id': officer_id[ok].astype('int64'),
+    }).drop_duplicates(['idpel', 'periode'], keep='last')
+    rejects = frame.loc[~ok, REJECT_COLUMNS[2:]]
+    rejects.insert(0, 'reason', reason[~ok])
+    rejects.insert(0, 'line', frame['line'][~ok])
+    return valid, rejects
+
+
+# Writing
+
+def upsert_statement(dialect_name):
+    """Executemany-able upsert on (idpel, periode); existing rows keep created_at"""
+    table = Transaction.__table__
+    updated = ('total', 'payment_type', 'officer_id', 'status', 'updated_at')
+    if dialect_name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in updated})
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.idpel, table.c.periode],
+        set_={c: stmt.excluded[c] for c in updated},
+    )
+
+
+def _rollup_key(officer_id, periode, status, payment_type):
+    return (int(officer_id), periode, status, payment_type)
+
+
+def apply_batch(connection, records):
+    """Upsert ``records`` (dicts) and update the derived tables; returns ``(inserted, updated)``"""
+    if not records:
+        return 0, 0
+    keys = [(r['idpel'], r['periode']) for r in records]
+    existing = {
+        (row.idpel, row.periode): row for row in connection.execute(
+            select(Transaction.idpel, Transaction.periode, Transaction.officer_id, Transaction.status,
+                   Transaction.payment_type, Transaction.total)
+            .where(tuple_(Transaction.idpel, Transaction.periode).in_(keys))
+        )
+    }
+
+    now = datetime.utcnow()
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for record in records:
+        record['created_at'] = now
+        record['updated_at'] = now
+        old = existing.get((record['idpel'], record['periode']))
+        if old is not None:
+            delta = deltas[_rollup_key(old.officer_id, old.periode, old.status, old.payment_type)]
+            delta[0] -= 1
+            delta[1] -= Decimal(str(old.total))
+        delta = deltas[_rollup_key(record['officer_id'], record['periode'], record['status'], record['payment_type'])]
+        delta[0] += 1
+        delta[1] += Decimal(str(record['total']))
+
+    idpels = {record['idpel'] for record in records}
+    customer_summary.lock(connection, idpels)
+    connection.execute(upsert_statement(connection.dialect.name), records)
+    rollup.apply_deltas(connection, {k: v for k, v in deltas.items() if v[0] or v[1]})
+    customer_search.index_new_idpels(connection, idpels)
+    customer_summary.refresh(connection, idpels)
+    return len(records) - len(existing), len(existing)
+
+
+def import_file(path, rejects_path=None, batch_rows=BATCH_ROWS, progress=None):
+    """Import a transaction file; returns an ``ImportResult``.
+
+    Rejected rows are written to ``rejects_path`` as CSV (line, reason, values) when
+    given. ``progress`` is called with the running result after each batch.
+    """
+    from app.dashboard_stats import dashboard_stats
+
+    officers = officer_lookup()
+    result = ImportResult()
+    rejects_file = open(rejects_path, 'w', newline='') if rejects_path else None
+    try:
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if rejects_writer:
+            rejects_writer.writerow(REJECT_COLUMNS)
+
+        for frame in read_chunks(path, batch_rows):
+            valid, rejects = validate(frame, officers)
+            records = valid.to_dict('records')
+            for record in records:
+                record['total'] = Decimal(str(record['total']))
+            with db.engine.begin() as connection:
+                inserted, updated = apply_batch(connection, records)
+
+            result.rows += len(frame)
+            result.inserted += inserted
+            result.updated += updated
+            result.rejected += len(rejects)
+            if rejects_writer and len(rejects):
+                rejects_writer.writerows(rejects.itertuples(index=False, name=None))
+            if progress:
+                progress(result)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        dashboard_stats.invalidate()
+    return result
+
+
+@import_cli.command('transactions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-rows', default=BATCH_ROWS, show_default=True, help='Rows validated and committed per batch.')
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False), help='Write rejected rows to this CSV.')
+def import_transactions_command(path, batch_rows, rejects_path):
+    """Import transactions from a CSV, csv.gz or XLSX file."""
+    def progress(result):
+        click.echo(f'{result.rows} rows: {result.inserted} inserted, {result.updated} updated, '
+                   f'{result.rejected} rejected')
+
+    try:
+        result = import_file(path, rejects_path, batch_rows, progress)
+    except ImportFileError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Import finished: {result.rows} rows, {result.inserted} inserted, {result.updated} updated, '
+               f'{result.rejected} rejected.')
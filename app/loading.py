@@ -0,0 +1,110 @@
+"""Relationship loading policy for list views and exports.
+
+Templates and exports that print a related name (``transaction.officer.user``,
+``log.user``, ``anomaly.reporter``...) would otherwise lazy-load it once per
+row. Each view applies the loader options it needs from here, so a page costs
+a fixed number of queries however many rows it shows. Exports that only need
+flat columns use projected queries instead (see ``app.exports.registry``).
+
+``QueryCounter`` and ``assert_max_queries`` count the statements a block of
+code runs, to check that a view stays within its query budget;
+``benchmarks/check_query_budgets.py`` runs every list view and export under
+them.
+"""
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, contains_eager
+from app import db
+from app.models import (Transaction, TalanganTransaction, Officer, User, Anomaly,
+                        PrintLog, MonitoringLog, DailySettlement, CustomerSummary)
+
+
+def transaction_officer():
+    """Transaction rows showing the officer's username"""
+    return (joinedload(Transaction.officer).joinedload(Officer.user),)
+
+
+def talangan_officer():
+    """Talangan rows showing the officer's username; the view already joins Officer"""
+    return (contains_eager(TalanganTransaction.officer).joinedload(Officer.user),)
+
+
+def customer_summary_officer():
+    return (joinedload(CustomerSummary.officer).joinedload(Officer.user),)
+
+
+def settlement_officer():
+    return (joinedload(DailySettlement.officer).joinedload(Officer.user),)
+
+
+def officer_list():
+    """Officer lists and selects; the queries already join User on Officer.user_id"""
+    return (contains_eager(Officer.user), joinedload(Officer.coordinator))
+
+
+def officer_select():
+    return (contains_eager(Officer.user),)
+
+
+def coordinator_list():
+    return (joinedload(User.area),)
+
+
+def anomaly_reporter():
+    return (joinedload(Anomaly.reporter),)
+
+
+def print_log_user():
+    return (joinedload(PrintLog.user),)
+
+
+def monitoring_log_user():
+    return (joinedload(MonitoringLog.user),)
+
+
+class QueryCounter:
+    """Record every SQL statement the current thread executes on ``engine`` while active
+
+    Statements of background threads (the audit writer, the SQL stats flusher)
+    are not the block's own and are left out.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+        self.thread = threading.get_ident()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread:
+            self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        self.engine = self.engine or db.engine
+        self.thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def assert_max_queries(max_queries, engine=None):
+    """Fail with the executed statements if the block runs more than ``max_queries``.
+
+    Typical use with a test client, inside an app context::
+
+        with assert_max_queries(6):
+            client.get('/reports/tunggakan')
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        listing = '\n'.join(f'{i}. {s}' for i, s in enumerate(counter.statements, 1))
+        raise AssertionError(f'{counter.count} queries executed, expected at most {max_queries}:\n{listing}')
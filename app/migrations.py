@@ -0,0 +1,315 @@
+"""Versioned schema migrations and query plan checks.
+
+Run with the Flask CLI::
+
+    flask schema status
+    flask schema upgrade
+    flask schema check-plans
+
+Each migration is applied at most once and recorded in ``schema_migrations``.
+Steps check the live schema before changing it, so a database created from an
+up-to-date ``schema.sql`` (or ``db.create_all()``) upgrades cleanly.
+"""
+from datetime import datetime, date
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+from app import db
+
+schema_cli = AppGroup('schema', help='Database schema migrations.')
+
+# Tables with fewer rows than this are allowed to be scanned during
+# check-plans; the optimizer rightly prefers a scan on tiny tables.
+PLAN_CHECK_MIN_ROWS = 1000
+
+
+def create_index(conn, table, name, columns, unique=False):
+    """Create an index unless one with the same name already exists"""
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(table)}
+    if name in existing:
+        return False
+    keyword = 'UNIQUE INDEX' if unique else 'INDEX'
+    conn.execute(text(f"CREATE {keyword} {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def _hot_query_indexes(conn):
+    # dashboard counters, tunggakan list and status-filtered reports
+    create_index(conn, 'transactions', 'ix_transactions_status_created', ['status', 'created_at', 'id'])
+    # information.customer_lookup
+    create_index(conn, 'transactions', 'ix_transactions_idpel_periode', ['idpel', 'periode'])
+    # dashboard histogram
+    create_index(conn, 'transactions', 'ix_transactions_periode', ['periode'])
+    # rbm/coordinator/officer/area report joins
+    create_index(conn, 'transactions', 'ix_transactions_officer_status', ['officer_id', 'status'])
+    create_index(conn, 'transactions', 'ix_transactions_created', ['created_at', 'id'])
+
+    create_index(conn, 'wa_logs', 'ix_wa_logs_created', ['created_at', 'id'])
+    create_index(conn, 'wa_logs', 'ix_wa_logs_status_created', ['status', 'created_at'])
+    create_index(conn, 'wa_logs', 'ix_wa_logs_idpel', ['idpel'])
+
+    create_index(conn, 'monitoring_logs', 'ix_monitoring_logs_created', ['created_at', 'id'])
+    create_index(conn, 'monitoring_logs', 'ix_monitoring_logs_module_created', ['module_name', 'created_at'])
+
+    create_index(conn, 'anomalies', 'ix_anomalies_created', ['created_at', 'id'])
+    create_index(conn, 'anomalies', 'ix_anomalies_status_created', ['status', 'created_at'])
+    create_index(conn, 'anomalies', 'ix_anomalies_idpel', ['idpel'])
+
+    create_index(conn, 'talangan_transactions', 'ix_talangan_date', ['date', 'id'])
+    create_index(conn, 'talangan_transactions', 'ix_talangan_status_date', ['status', 'date'])
+    create_index(conn, 'talangan_transactions', 'ix_talangan_idpel', ['idpel'])
+
+    create_index(conn, 'daily_settlements', 'ix_daily_settlements_date', ['date', 'id'])
+    create_index(conn, 'print_logs', 'ix_print_logs_printed', ['printed_at', 'id'])
+    create_index(conn, 'users', 'ix_users_role_area', ['role', 'area_code'])
+
+
+def drop_index(conn, table, name):
+    """Drop an index if it exists"""
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        return False
+    if conn.dialect.name == 'mysql':
+        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
+    return True
+
+
+def add_column(conn, table, name, definition, mysql_definition=None):
+    """Add a column unless it already exists"""
+    existing = {column['name'] for column in inspect(conn).get_columns(table)}
+    if name in existing:
+        return False
+    if conn.dialect.name == 'mysql' and mysql_definition:
+        definition = mysql_definition
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+    return True
+
+
+def _transaction_rollup(conn):
+    from app.models import TransactionDailyRollup
+    from app import rollup
+    TransactionDailyRollup.__table__.create(conn, checkfirst=True)
+    create_index(conn, 'transaction_daily_rollup', 'ix_rollup_day', ['day'])
+    rollup.rebuild(conn)
+
+
+def _export_job_columns(conn):
+    add_column(conn, 'report_exports', 'format', 'VARCHAR(10)')
+    add_column(conn, 'report_exports', 'status', "VARCHAR(20) DEFAULT 'completed'",
+               mysql_definition="ENUM('queued', 'running', 'completed', 'failed') DEFAULT 'completed'")
+    add_column(conn, 'report_exports', 'error', 'TEXT')
+    add_column(conn, 'report_exports', 'completed_at', 'DATETIME NULL')
+    create_index(conn, 'report_exports', 'ix_report_exports_user_exported', ['user_id', 'exported_at'])
+
+
+def _customer_search_index(conn):
+    from app.models import CustomerSearchGram
+    from app import customer_search
+    CustomerSearchGram.__table__.create(conn, checkfirst=True)
+    create_index(conn, 'customer_search_grams', 'ix_customer_search_grams_idpel', ['idpel'])
+    customer_search.rebuild(conn)
+
+
+def _customer_summary(conn):
+    from app.models import CustomerSummary
+    from app import customer_summary
+    CustomerSummary.__table__.create(conn, checkfirst=True)
+    customer_summary.rebuild(conn)
+
+
+def _transaction_imports(conn):
+    from app.models import TransactionImport
+    duplicates = conn.execute(text(
+        "SELECT COUNT(*) FROM (SELECT idpel, periode FROM transactions "
+        "GROUP BY idpel, periode HAVING COUNT(*) > 1) d"
+    )).scalar()
+    if duplicates:
+        raise click.ClickException(
+            f'{duplicates} (idpel, periode) pairs occur more than once in transactions; '
+            'merge or delete the duplicates, then run the upgrade again.'
+        )
+    create_index(conn, 'transactions', 'uq_transactions_idpel_periode', ['idpel', 'periode'], unique=True)
+    # The unique index serves every lookup the plain one did
+    drop_index(conn, 'transactions', 'ix_transactions_idpel_periode')
+    TransactionImport.__table__.create(conn, checkfirst=True)
+
+
+def _endpoint_sql_stats(conn):
+    from app.models import EndpointSqlStats
+    EndpointSqlStats.__table__.create(conn, checkfirst=True)
+
+
+def _archive_segments(conn):
+    from app.models import ArchiveSegment
+    ArchiveSegment.__table__.create(conn, checkfirst=True)
+
+
+def _wa_message_ids(conn):
+    add_column(conn, 'wa_logs', 'message_id', 'VARCHAR(64)')
+    create_index(conn, 'wa_logs', 'uq_wa_logs_message_id', ['message_id'], unique=True)
+
+
+def _rollup_status_index(conn):
+    # dashboard status counts sum txn_count per status over the whole rollup
+    create_index(conn, 'transaction_daily_rollup', 'ix_rollup_status_count', ['status', 'txn_count'])
+
+
+def _archive_segment_filters(conn):
+    from app import retention
+    add_column(conn, 'archive_segments', 'filter_bloom', 'BLOB')
+    retention.fill_filter_blooms(conn)
+
+
+# (version, description, step) in the order they must be applied
+MIGRATIONS = [
+    ('0001', 'Indexes for dashboard, report and list view queries', _hot_query_indexes),
+    ('0002', 'Transaction daily rollup table', _transaction_rollup),
+    ('0003', 'Background export job columns', _export_job_columns),
+    ('0004', 'Customer search n-gram index', _customer_search_index),
+    ('0005', 'Customer summary table', _customer_summary),
+    ('0006', 'Unique transaction (idpel, periode) and import tracking', _transaction_imports),
+    ('0007', 'Per-endpoint SQL statistics', _endpoint_sql_stats),
+    ('0008', 'Log table archive segments', _archive_segments),
+    ('0009', 'WhatsApp gateway message ids', _wa_message_ids),
+    ('0010', 'Covering index for the dashboard status counts', _rollup_status_index),
+    ('0011', 'Archive segment filter blooms', _archive_segment_filters),
+]
+
+
+def applied_versions():
+    from app.models import SchemaMigration
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {m.version for m in SchemaMigration.query.all()}
+
+
+def pending_migrations():
+    done = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade():
+    """Apply all pending migrations, each in its own transaction"""
+    from app.models import SchemaMigration
+    applied = []
+    for version, description, step in pending_migrations():
+        with db.engine.begin() as conn:
+            step(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+
+def plan_check_queries():
+    """Representative statements for the hot read paths, keyed by route"""
+    from app.models import (Transaction, TransactionDailyRollup, WALog, MonitoringLog, Anomaly,
+                            TalanganTransaction, DailySettlement, PrintLog, Officer)
+    from app import customer_search
+    from app.sql_stats import endpoint_ranking
+    from app.dashboard_stats import status_counts_query
+    from app.routes.information import customer_summary_query, recent_transactions_query
+    since = date.today().replace(day=1)
+    return {
+        'dashboard.index (status counts)':
+            status_counts_query(),
+        'dashboard.index (histogram)':
+            db.session.query(TransactionDailyRollup.day, db.func.sum(TransactionDailyRollup.txn_count)).filter(TransactionDailyRollup.day >= since).group_by(TransactionDailyRollup.day),
+        'information.customer_lookup (summary)':
+            customer_summary_query('00000000000'),
+        'information.customer_lookup (transactions)':
+            recent_transactions_query('00000000000'),
+        'information.customer_search (prefix)':
+            customer_search.prefix_query('0012'),
+        'information.customer_search (n-gram rows)':
+            customer_search.gram_rows_query(customer_search.grams('00123456780', end_marker=False), 2),
+        'information.customer_search (similar)':
+            customer_search.fuzzy_query('00123456780', 2),
+        'reports.tunggakan (aging scan)':
+            db.session.query(Transaction.idpel, Transaction.periode, Transaction.total, Transaction.officer_id).filter(Transaction.status == 'pending'),
+        'reports.wa_monitoring':
+            WALog.query.order_by(WALog.created_at.desc(), WALog.id.desc()).limit(51),
+        'reports.log_monitoring':
+            MonitoringLog.query.order_by(MonitoringLog.created_at.desc(), MonitoringLog.id.desc()).limit(51),
+        'reports.daily_settlement':
+            DailySettlement.query.order_by(DailySettlement.date.desc(), DailySettlement.id.desc()).limit(51),
+        'reports.bluetooth_print':
+            PrintLog.query.order_by(PrintLog.printed_at.desc(), PrintLog.id.desc()).limit(51),
+        'anomaly.daily_reports':
+            Anomaly.query.order_by(Anomaly.created_at.desc(), Anomaly.id.desc()).limit(51),
+        'talangan.transactions':
+            TalanganTransaction.query.join(Officer).order_by(TalanganTransaction.date.desc(), TalanganTransaction.id.desc()).limit(51),
+        'reports.sql_stats':
+            endpoint_ranking(since),
+    }
+
+
+def _table_rows(conn, table):
+    return conn.execute(text(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+    ), {'name': table}).scalar() or 0
+
+
+def full_scans(query, min_rows=PLAN_CHECK_MIN_ROWS):
+    """Return the tables ``query`` reads with a full scan according to EXPLAIN"""
+    conn = db.session.connection()
+    compiled = query.statement.compile(dialect=conn.dialect)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+
+    scans = []
+    if conn.dialect.name == 'mysql':
+        result = conn.exec_driver_sql('EXPLAIN ' + str(compiled), params)
+        for row in result.mappings():
+            if row['type'] == 'ALL' and row['table'] and _table_rows(conn, row['table']) >= min_rows:
+                scans.append(row['table'])
+    elif conn.dialect.name == 'sqlite':
+        result = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)
+        for row in result:
+            detail = row[-1]
+            # Subquery results show up as SCAN of their alias; only tables count
+            if detail.startswith('SCAN ') and 'INDEX' not in detail and detail.split()[1] in db.metadata.tables:
+                scans.append(detail.split()[1])
+    else:
+        raise click.ClickException(f'EXPLAIN check not supported for {conn.dialect.name}')
+    return scans
+
+
+@schema_cli.command('status')
+def status_command():
+    """Show applied and pending migrations."""
+    done = applied_versions()
+    for version, description, _step in MIGRATIONS:
+        mark = 'applied' if version in done else 'pending'
+        click.echo(f'{version}  {mark:<8} {description}')
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending migrations."""
+    applied = upgrade()
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(applied)}")
+    else:
+        click.echo('Schema is up to date.')
+
+
+@schema_cli.command('check-plans')
+@click.option('--min-rows', default=PLAN_CHECK_MIN_ROWS, show_default=True,
+              help='Ignore full scans of tables smaller than this (MySQL only).')
+def check_plans_command(min_rows):
+    """Fail if any hot query falls back to a full table scan."""
+    failures = 0
+    for name, query in plan_check_queries().items():
+        scans = full_scans(query, min_rows)
+        if scans:
+            failures += 1
+            click.echo(f"FULL SCAN  {name}: {', '.join(scans)}")
+        else:
+            click.echo(f'ok         {name}')
+    if failures:
+        raise click.ClickException(f'{failures} query plan(s) use a full table scan')
@@ -6,6 +6,9 @@ from datetime import datetime
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_role_area', 'role', 'area_code'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -60,6 +63,13 @@ class Officer(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_status_created', 'status', 'created_at', 'id'),
+        db.Index('uq_transactions_idpel_periode', 'idpel', 'periode', unique=True),
+        db.Index('ix_transactions_periode', 'periode'),
+        db.Index('ix_transactions_officer_status', 'officer_id', 'status'),
+        db.Index('ix_transactions_created', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     idpel = db.Column(db.String(20), nullable=False)
@@ -77,8 +87,45 @@ class Transaction(db.Model):
     def __repr__(self):
         return f'<Transaction {self.id}>'
 
+class TransactionDailyRollup(db.Model):
+    """Pre-aggregated transaction counts and totals, maintained by app.rollup"""
+    __tablename__ = 'transaction_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_rollup_day', 'day'),
+        db.Index('ix_rollup_status_count', 'status', 'txn_count'),
+    )
+    
+    officer_id = db.Column(db.Integer, db.ForeignKey('officers.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.Enum('pending', 'completed', 'failed'), primary_key=True)
+    payment_type = db.Column(db.Enum('cash', 'installment', 'transfer'), primary_key=True)
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<TransactionDailyRollup {self.officer_id} {self.day} {self.status} {self.payment_type}>'
+
+class CustomerSearchGram(db.Model):
+    """Positional n-grams of customer ids, maintained by app.customer_search"""
+    __tablename__ = 'customer_search_grams'
+    __table_args__ = (
+        db.Index('ix_customer_search_grams_idpel', 'idpel'),
+    )
+    
+    gram = db.Column(db.String(4), primary_key=True)
+    position = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    idpel = db.Column(db.String(20), primary_key=True)
+    
+    def __repr__(self):
+        return f'<CustomerSearchGram {self.gram}@{self.position} {self.idpel}>'
+
 class TalanganTransaction(db.Model):
     __tablename__ = 'talangan_transactions'
+    __table_args__ = (
+        db.Index('ix_talangan_date', 'date', 'id'),
+        db.Index('ix_talangan_status_date', 'status', 'date'),
+        db.Index('ix_talangan_idpel', 'idpel'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     idpel = db.Column(db.String(20), nullable=False)
@@ -97,10 +144,18 @@ class TalanganTransaction(db.Model):
 
 class WALog(db.Model):
     __tablename__ = 'wa_logs'
+    __table_args__ = (
+        db.Index('ix_wa_logs_created', 'created_at', 'id'),
+        db.Index('ix_wa_logs_status_created', 'status', 'created_at'),
+        db.Index('ix_wa_logs_idpel', 'idpel'),
+        db.Index('uq_wa_logs_message_id', 'message_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     idpel = db.Column(db.String(20), nullable=False)
     message = db.Column(db.Text)
+    # Id the gateway gave the message; delivery receipts refer to it
+    message_id = db.Column(db.String(64))
     status = db.Column(db.Enum('sent', 'delivered', 'read', 'failed'), default='sent')
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     delivered_at = db.Column(db.DateTime)
@@ -112,6 +167,9 @@ class WALog(db.Model):
 
 class PrintLog(db.Model):
     __tablename__ = 'print_logs'
+    __table_args__ = (
+        db.Index('ix_print_logs_printed', 'printed_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
@@ -128,6 +186,10 @@ class PrintLog(db.Model):
 
 class MonitoringLog(db.Model):
     __tablename__ = 'monitoring_logs'
+    __table_args__ = (
+        db.Index('ix_monitoring_logs_created', 'created_at', 'id'),
+        db.Index('ix_monitoring_logs_module_created', 'module_name', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     module_name = db.Column(db.String(100), nullable=False)
@@ -144,6 +206,11 @@ class MonitoringLog(db.Model):
 
 class Anomaly(db.Model):
     __tablename__ = 'anomalies'
+    __table_args__ = (
+        db.Index('ix_anomalies_created', 'created_at', 'id'),
+        db.Index('ix_anomalies_status_created', 'status', 'created_at'),
+        db.Index('ix_anomalies_idpel', 'idpel'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     idpel = db.Column(db.String(20), nullable=False)
@@ -162,14 +229,45 @@ class Anomaly(db.Model):
     def __repr__(self):
         return f'<Anomaly {self.id}>'
 
+class CustomerSummary(db.Model):
+    """One row per customer, maintained by app.customer_summary"""
+    __tablename__ = 'customer_summary'
+    
+    idpel = db.Column(db.String(20), primary_key=True)
+    txn_count = db.Column(db.Integer, nullable=False, default=0)
+    last_periode = db.Column(db.Date)
+    last_payment_at = db.Column(db.DateTime)
+    last_paid_periode = db.Column(db.Date)
+    outstanding_count = db.Column(db.Integer, nullable=False, default=0)
+    outstanding_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    officer_id = db.Column(db.Integer, db.ForeignKey('officers.id'))
+    talangan_exposure = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    open_anomalies = db.Column(db.Integer, nullable=False, default=0)
+    last_wa_status = db.Column(db.Enum('sent', 'delivered', 'read', 'failed'))
+    last_wa_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Officer of the customer's latest transaction
+    officer = db.relationship('Officer')
+    
+    def __repr__(self):
+        return f'<CustomerSummary {self.idpel}>'
+
 class ReportExport(db.Model):
     __tablename__ = 'report_exports'
+    __table_args__ = (
+        db.Index('ix_report_exports_user_exported', 'user_id', 'exported_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     report_type = db.Column(db.String(100), nullable=False)
     file_path = db.Column(db.String(255), nullable=False)
     exported_at = db.Column(db.DateTime, default=datetime.utcnow)
+    format = db.Column(db.String(10))
+    status = db.Column(db.Enum('queued', 'running', 'completed', 'failed'), default='completed')
+    error = db.Column(db.Text)
+    completed_at = db.Column(db.DateTime)
     
     # Relationship
     user = db.relationship('User', backref='report_exports')
@@ -192,6 +290,9 @@ class AnomalyMaster(db.Model):
 
 class DailySettlement(db.Model):
     __tablename__ = 'daily_settlements'
+    __table_args__ = (
+        db.Index('ix_daily_settlements_date', 'date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False)
@@ -205,4 +306,79 @@ class DailySettlement(db.Model):
     officer = db.relationship('Officer', backref='daily_settlements')
     
     def __repr__(self):
-        return f'<DailySettlement {self.id}>'
\ No newline at end of file
+        return f'<DailySettlement {self.id}>'
+
+class TransactionImport(db.Model):
+    """A bulk transaction import file and its progress, run by app.imports.jobs"""
+    __tablename__ = 'transaction_imports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.Enum('queued', 'running', 'completed', 'failed'), default='queued')
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    rejects_path = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    user = db.relationship('User', backref='transaction_imports')
+    
+    def __repr__(self):
+        return f'<TransactionImport {self.id}>'
+
+class EndpointSqlStats(db.Model):
+    """Per-day SQL totals of each endpoint, flushed by app.sql_stats"""
+    __tablename__ = 'endpoint_sql_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    endpoint = db.Column(db.String(100), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    queries = db.Column(db.BigInteger, nullable=False, default=0)
+    # Microseconds
+    db_time = db.Column(db.BigInteger, nullable=False, default=0)
+    request_time = db.Column(db.BigInteger, nullable=False, default=0)
+    max_db_time = db.Column(db.BigInteger, nullable=False, default=0)
+    slow_requests = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<EndpointSqlStats {self.day} {self.endpoint}>'
+
+class ArchiveSegment(db.Model):
+    """One compressed file of log rows moved out of their table by app.retention"""
+    __tablename__ = 'archive_segments'
+    __table_args__ = (
+        db.Index('ix_archive_segments_table_range', 'table_name', 'max_time', 'max_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    # Oldest and newest (time, id) of the rows in the file
+    min_time = db.Column(db.DateTime, nullable=False)
+    max_time = db.Column(db.DateTime, nullable=False)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    # Relative to ARCHIVE_DIR
+    path = db.Column(db.String(255), nullable=False)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    # Bloom filter of the page filter values (app.retention.FILTER_COLUMNS); read a few bytes at a time
+    filter_bloom = db.deferred(db.Column(db.LargeBinary))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchiveSegment {self.table_name} {self.min_id}-{self.max_id}>'
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.String(20), primary_key=True)
+    description = db.Column(db.String(255))
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}>'
@@ -0,0 +1,179 @@
+import base64
+import json
+from datetime import date, datetime
+from flask import request, abort
+from sqlalchemy import and_, or_, text
+from app import db
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+# Counting stops after this many rows; anything above is shown as "10,000+"
+COUNT_CAP = 10000
+
+
+class KeysetPage:
+    """One page of a keyset-paginated list view"""
+
+    def __init__(self, items, per_page, next_cursor=None, cursor=None, total=None, total_capped=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        self.total = total
+        self.total_capped = total_capped
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the last (sort value, id) of a page into an opaque URL token"""
+    raw = json.dumps([_encode_value(sort_value), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token, aborting with 400 on tampered input"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return _decode_value(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def get_per_page(default=DEFAULT_PER_PAGE):
+    """Read ?per_page= from the request, clamped to [1, MAX_PER_PAGE]"""
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page or default, MAX_PER_PAGE))
+
+
+def apply_filters(query, filters):
+    """Apply equality filters from the query string.
+
+    ``filters`` maps a request argument name to the column it filters, e.g.
+    ``{'status': WALog.status}``. Empty arguments are ignored.
+    """
+    active = {}
+    for arg, column in (filters or {}).items():
+        value = request.args.get(arg, '').strip()
+        if value:
+            query = query.filter(column == value)
+            active[arg] = value
+    return query, active
+
+
+def approximate_count(query, table_name=None, filtered=False):
+    """Return ``(count, capped)`` for a list view without a full COUNT(*).
+
+    For an unfiltered MySQL table the InnoDB row estimate from
+    information_schema is used. Otherwise rows are counted up to COUNT_CAP.
+    """
+    if table_name and not filtered and db.engine.dialect.name == 'mysql':
+        estimate = db.session.execute(
+            text("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"),
+            {'name': table_name}
+        ).scalar()
+        if estimate is not None:
+            return int(estimate), False
+
+    limited = query.order_by(None).limit(COUNT_CAP + 1).subquery()
+    count = db.session.query(db.func.count()).select_from(limited).scalar()
+    return min(count, COUNT_CAP), count > COUNT_CAP
+
+
+def keyset_paginate(query, sort_column, id_column, per_page=None, with_total=False, table_name=None, filtered=False,
+                    archive=None):
+    """Paginate ``query`` newest-first on ``(sort_column, id_column)``.
+
+    Instead of OFFSET, the next page starts strictly after the last row of the
+    previous one, so every page costs the same index range scan no matter how
+    deep the user pages. The cursor is read from ``?after=``.
+
+    With an ``archive`` (an ``app.retention.ArchiveReader``) a page that runs
+    past the oldest row of ``query`` is filled up from the archived rows. If
+    the archive scan stops early the page links on from where it stopped.
+    """
+    per_page = per_page or get_per_page()
+    token = request.args.get('after')
+
+    total, total_capped = None, False
+    if with_total:
+        total, total_capped = approximate_count(query, table_name, filtered)
+
+    before = None
+    if token:
+        last_value, last_id = decode_cursor(token)
+        before = (last_value, last_id)
+        query = query.filter(or_(
+            sort_column < last_value,
+            and_(sort_column == last_value, id_column < last_id)
+        ))
+
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    if archive is not None:
+        if with_total and not filtered:
+            total += archive.count()
+        if len(rows) <= per_page:
+            if rows:
+                before = (getattr(rows[-1], sort_column.key), getattr(rows[-1], id_column.key))
+            rows += archive.rows(before, per_page + 1 - len(rows))
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    elif archive is not None and archive.resume is not None:
+        # The archive scan stopped early; the next page carries on from there
+        next_cursor = encode_cursor(*archive.resume)
+
+    return KeysetPage(rows, per_page, next_cursor=next_cursor, cursor=token,
+                      total=total, total_capped=total_capped)
+
+
+def paginate_view(query, sort_column, id_column, filters=None, with_total=True, table_name=None, archived=False):
+    """Filter and keyset-paginate a list view from the current request args.
+
+    Returns ``(page, active_filters)``. ``?count=0`` skips the total count.
+    ``archived=True`` continues into the archived rows of ``table_name``
+    (see ``app.retention``); the filter names must then be its column names.
+    """
+    query, active = apply_filters(query, filters)
+    with_total = with_total and request.args.get('count', '1') != '0'
+    archive = None
+    if archived:
+        from app.retention import ArchiveReader
+        archive = ArchiveReader(table_name, active)
+    page = keyset_paginate(query, sort_column, id_column, with_total=with_total,
+                           table_name=table_name, filtered=bool(active), archive=archive)
+    return page, active
@@ -0,0 +1,155 @@
+"""Read-replica routing.
+
+When ``SQLALCHEMY_BINDS`` has a ``replica`` bind, SELECTs issued while
+serving GET requests of the read-only blueprints (``use_replica_for``), and
+inside ``reading_from_replica()`` blocks such as background exports, run on
+the replica engine. Everything else stays on the primary:
+
+- Statements other than SELECT, and ``db.session.connection()``, which the
+  derived-table hooks use.
+- Every statement in a session that has already flushed a write.
+- The requests of a user who committed a write less than
+  ``REPLICA_STICKY_SECONDS`` ago, so they read their own changes.
+- All reads while the replica lags by more than ``REPLICA_MAX_LAG`` seconds
+  or cannot be reached. Lag is checked at most every
+  ``REPLICA_CHECK_INTERVAL`` seconds per process.
+
+Each bind takes its own pool settings, e.g.::
+
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 20, 'pool_recycle': 3600}
+    SQLALCHEMY_BINDS = {'replica': {'url': 'mysql+pymysql://ro@replica/pln_db',
+                                    'pool_size': 40, 'pool_recycle': 3600}}
+
+Without a ``replica`` bind everything runs on the primary, as before. Two
+local servers (or two SQLite files, for tests) are enough to try it out.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+STICKY_KEY = '_db_primary_until'
+COUNTER_KEYS = ('replica', 'stale', 'sticky')
+
+_lock = threading.Lock()
+_health = {'checked_at': 0.0, 'healthy': False, 'lag': None}
+_counters = dict.fromkeys(COUNTER_KEYS, 0)
+
+
+def replica_lag(connection):
+    """Seconds the replica is behind, 0 if it is not replicating, ``None`` if replication is broken"""
+    if connection.dialect.name != 'mysql':
+        connection.execute(text('SELECT 1'))
+        return 0
+    for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+        try:
+            row = connection.execute(text(statement)).mappings().first()
+        except SQLAlchemyError:
+            continue
+        if row is None:
+            return 0
+        return row.get(column)
+    return None
+
+
+def replica_healthy(app, engine):
+    now = time.monotonic()
+    if now - _health['checked_at'] < app.config.get('REPLICA_CHECK_INTERVAL', 5):
+        return _health['healthy']
+    with _lock:
+        if now - _health['checked_at'] < app.config.get('REPLICA_CHECK_INTERVAL', 5):
+            return _health['healthy']
+        try:
+            with engine.connect() as connection:
+                lag = replica_lag(connection)
+        except SQLAlchemyError:
+            app.logger.warning('Replica unreachable, reading from the primary', exc_info=True)
+            lag = None
+        _health.update(checked_at=now, lag=lag,
+                       healthy=lag is not None and lag <= app.config.get('REPLICA_MAX_LAG', 30))
+        return _health['healthy']
+
+
+def _count(name):
+    _counters[name] += 1
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible SELECTs to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and has_app_context() and g.get('db_read_replica'):
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        engine = self._db.engines.get(REPLICA_BIND)
+        if engine is None or self.info.get('db_wrote'):
+            return None
+        if has_request_context() and flask_session.get(STICKY_KEY, 0) > time.time():
+            _count('sticky')
+            return None
+        if not replica_healthy(current_app, engine):
+            _count('stale')
+            return None
+        _count('replica')
+        return engine
+
+
+@contextmanager
+def reading_from_replica():
+    """Route the SELECTs of this block to the replica (when configured and fresh)"""
+    previous = g.get('db_read_replica')
+    g.db_read_replica = True
+    try:
+        yield
+    finally:
+        g.db_read_replica = previous
+
+
+def use_replica_for(app, *blueprints):
+    """Read from the replica during GET and HEAD requests of the named ``blueprints``"""
+    names = set(blueprints)
+
+    @app.before_request
+    def route_reads():
+        if request.blueprint in names and request.method in ('GET', 'HEAD'):
+            g.db_read_replica = True
+
+
+def _mark_write(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info['db_wrote'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('db_wrote', False) and has_request_context():
+        sticky = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+        if sticky and REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {}):
+            flask_session[STICKY_KEY] = time.time() + sticky
+
+
+def _after_rollback(session):
+    session.info.pop('db_wrote', None)
+
+
+def metrics():
+    values = dict(_counters, replica_healthy=_health['healthy'], replica_lag=_health['lag'])
+    routed = values['replica'] + values['stale'] + values['sticky']
+    values['replica_share'] = round(values['replica'] / routed, 4) if routed else None
+    return values
+
+
+def init_app(app, db):
+    if not event.contains(db.session, 'after_flush', _mark_write):
+        event.listen(db.session, 'after_flush', _mark_write)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
@@ -0,0 +1,352 @@
+"""Time-based retention for the log tables.
+
+Run from cron on the web host (the archive lives on its local disk)::
+
+    flask archive run                  # every table, as configured
+    flask archive run --table wa_logs --dry-run
+    flask archive status
+
+``RETENTION_DAYS`` gives the age, per table, after which rows of
+``wa_logs``, ``monitoring_logs`` and ``print_logs`` leave the table. Rows
+past it are moved oldest first in chunks of ``ARCHIVE_CHUNK_ROWS``. Each
+chunk is one transaction: it selects the rows and writes them to a file under
+``ARCHIVE_DIR``, then records the file in ``archive_segments`` and deletes the
+rows. If any step fails the transaction rolls back and the file is removed,
+so a row is always either in its table or in a recorded file. The hot tables
+therefore hold at most ``RETENTION_DAYS`` of rows.
+
+A segment file is a zip with one deflate-compressed JSON array per column
+(``columns.json`` lists them), so it needs nothing beyond the standard
+library and a reader can load only the columns it uses. Print logs also keep
+the ``idpel`` of their transaction, which the print report filters on.
+
+The list pages read through: when keyset pagination runs past the oldest row
+still in the table it continues into the segments (see ``ArchiveReader``),
+newest first, with the same filters. The last ``ARCHIVE_CACHE_SEGMENTS``
+decoded segments are kept in memory per process.
+
+So that a selective filter (one customer's WA logs, say) does not decode the
+whole archive, each segment records a fixed-size bloom filter of the values
+its rows hold in the page filter columns (``FILTER_COLUMNS``). The segment
+query fetches only the few bytes of it that a filter value maps to and skips
+the segments that cannot hold a match without opening their files. A page
+still decodes at most ``ARCHIVE_SCAN_SEGMENTS`` segments; when it stops there
+it offers the next page from where it stopped, possibly with fewer rows.
+
+Archived rows are not seen by anything that queries the tables directly; the
+customer summary keeps the WA status it last recorded.
+"""
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, Date, func, select
+from app import db
+from app.models import ArchiveSegment, MonitoringLog, PrintLog, Transaction, User, WALog
+
+archive_cli = AppGroup('archive', help='Log table retention and archive.')
+
+# table name -> (model, column the age is measured on, column holding a user id)
+POLICIES = {
+    'wa_logs': (WALog, 'created_at', None),
+    'monitoring_logs': (MonitoringLog, 'created_at', 'user_id'),
+    'print_logs': (PrintLog, 'printed_at', 'printed_by'),
+}
+# Columns the list pages filter on; each segment keeps a bloom filter of their values
+FILTER_COLUMNS = {
+    'wa_logs': ('status', 'idpel'),
+    'monitoring_logs': ('module_name', 'event_type'),
+    'print_logs': ('printed_by', 'idpel'),
+}
+# 32 KB per segment: about a 0.5% false positive rate at 20,000 distinct values
+BLOOM_BITS = 32768 * 8
+BLOOM_HASHES = 4
+# Rows deleted per statement within a chunk
+DELETE_BATCH = 1000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def archive_dir(app=None):
+    app = app or current_app
+    return app.config.get('ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+
+
+def _columns(table_name):
+    """Selectable columns and their archive kinds for one table"""
+    model = POLICIES[table_name][0]
+    columns = list(model.__table__.columns)
+    if model is PrintLog:
+        columns.append(Transaction.__table__.c.idpel)
+    kinds = ['datetime' if isinstance(c.type, DateTime) else 'date' if isinstance(c.type, Date) else 'value'
+             for c in columns]
+    return columns, kinds
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode(kind, values):
+    if kind == 'datetime':
+        return [datetime.fromisoformat(v) if v is not None else None for v in values]
+    if kind == 'date':
+        return [date.fromisoformat(v) if v is not None else None for v in values]
+    return values
+
+
+def _bloom_positions(name, value):
+    digest = hashlib.blake2b(f'{name}\x1f{value}'.encode(), digest_size=8).digest()
+    h1, h2 = int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little') | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def filter_bloom(table_name, data):
+    """The bloom filter of the ``FILTER_COLUMNS`` values in ``{column: [values]}``, compared as strings"""
+    bits = bytearray(BLOOM_BITS // 8)
+    for name in FILTER_COLUMNS[table_name]:
+        for value in set(data[name]) - {None}:
+            for position in _bloom_positions(name, value):
+                bits[position >> 3] |= 1 << (position & 7)
+    return bytes(bits)
+
+
+def write_segment(path, names, kinds, rows):
+    """Write ``rows`` (tuples in ``names`` order) column by column to a zip at ``path``"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.tmp'
+    with zipfile.ZipFile(partial, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        archive.writestr('columns.json', json.dumps([{'name': n, 'kind': k} for n, k in zip(names, kinds)]))
+        for i, name in enumerate(names):
+            archive.writestr(f'{name}.json', json.dumps([_encode(row[i]) for row in rows], separators=(',', ':')))
+    os.replace(partial, path)
+    return os.path.getsize(path)
+
+
+def read_segment(path):
+    """``{column: [values]}`` of one segment file, decoded"""
+    with zipfile.ZipFile(path) as archive:
+        columns = json.loads(archive.read('columns.json'))
+        return {c['name']: _decode(c['kind'], json.loads(archive.read(f"{c['name']}.json"))) for c in columns}
+
+
+def _load_segment(segment):
+    path = os.path.join(archive_dir(), segment.path)
+    with _cache_lock:
+        if path in _cache:
+            _cache.move_to_end(path)
+            return _cache[path]
+    data = read_segment(path)
+    with _cache_lock:
+        _cache[path] = data
+        while len(_cache) > current_app.config.get('ARCHIVE_CACHE_SEGMENTS', 4):
+            _cache.popitem(last=False)
+    return data
+
+
+def fill_filter_blooms(connection):
+    """Record the bloom filter of segments archived without one; returns how many were filled"""
+    table = ArchiveSegment.__table__
+    filled = 0
+    for segment_id, table_name, path in connection.execute(
+        select(table.c.id, table.c.table_name, table.c.path).where(table.c.filter_bloom.is_(None))
+    ).all():
+        path = os.path.join(archive_dir(), path)
+        if table_name in FILTER_COLUMNS and os.path.exists(path):
+            connection.execute(table.update().where(table.c.id == segment_id).values(
+                filter_bloom=filter_bloom(table_name, read_segment(path))))
+            filled += 1
+    return filled
+
+
+def cutoff(table_name, now=None):
+    """Rows of ``table_name`` older than this are archived; ``None`` keeps them forever"""
+    days = current_app.config.get('RETENTION_DAYS', {}).get(table_name)
+    if not days:
+        return None
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def archive_table(table_name, before, chunk_rows=None, log=None):
+    """Move the rows of ``table_name`` older than ``before`` into segment files; returns the row count"""
+    model, time_name, _ = POLICIES[table_name]
+    table = model.__table__
+    time_column, id_column = table.c[time_name], table.c.id
+    columns, kinds = _columns(table_name)
+    names = [c.name for c in columns]
+    chunk_rows = chunk_rows or current_app.config.get('ARCHIVE_CHUNK_ROWS', 20000)
+    query = select(*columns).where(time_column < before).order_by(time_column, id_column).limit(chunk_rows)
+    if model is PrintLog:
+        query = query.select_from(table.outerjoin(Transaction.__table__))
+    moved = 0
+    while True:
+        path = None
+        try:
+            with db.engine.begin() as connection:
+                rows = connection.execute(query).all()
+                if not rows:
+                    return moved
+                first, last = rows[0]._mapping, rows[-1]._mapping
+                ids = [row.id for row in rows]
+                relative = os.path.join(table_name, f"{table_name}_{first[time_name]:%Y%m%d}_{min(ids)}-{max(ids)}.zip")
+                path = os.path.join(archive_dir(), relative)
+                size = write_segment(path, names, kinds, rows)
+                connection.execute(ArchiveSegment.__table__.insert().values(
+                    table_name=table_name, min_time=first[time_name], max_time=last[time_name],
+                    min_id=min(ids), max_id=max(ids), row_count=len(rows), path=relative,
+                    size_bytes=size,
+                    filter_bloom=filter_bloom(table_name, {name: [row[i] for row in rows]
+                                                           for i, name in enumerate(names)}),
+                    created_at=datetime.utcnow()))
+                for start in range(0, len(ids), DELETE_BATCH):
+                    connection.execute(table.delete().where(id_column.in_(ids[start:start + DELETE_BATCH])))
+        except BaseException:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            raise
+        moved += len(rows)
+        if log:
+            log(f'{table_name}: archived {len(rows)} rows up to {last[time_name]} into {relative}')
+
+
+def run_retention(tables=None, now=None, log=None):
+    """Archive every configured table (or ``tables``); returns ``{table: rows moved}``"""
+    moved = {}
+    for table_name in tables or POLICIES:
+        before = cutoff(table_name, now)
+        if before is not None:
+            moved[table_name] = archive_table(table_name, before, log=log)
+    return moved
+
+
+class ArchiveReader:
+    """Archived rows of one table, newest first, for a keyset-paginated list view
+
+    ``filters`` are the active equality filters of the page, by column name.
+    After ``rows()``, ``resume`` is the cursor to continue from when the scan
+    stopped at ``ARCHIVE_SCAN_SEGMENTS`` decoded segments, else ``None``.
+    """
+
+    def __init__(self, table_name, filters=None):
+        self.table_name = table_name
+        self.filters = filters or {}
+        self.time_name = POLICIES[table_name][1]
+        self.user_column = POLICIES[table_name][2]
+        self.resume = None
+
+    def count(self):
+        return db.session.query(func.coalesce(func.sum(ArchiveSegment.row_count), 0)).filter(
+            ArchiveSegment.table_name == self.table_name).scalar()
+
+    def _probes(self):
+        """Bloom filter bit positions of the active filters on ``FILTER_COLUMNS``"""
+        return [position for name, value in self.filters.items() if name in FILTER_COLUMNS[self.table_name]
+                for position in _bloom_positions(name, value)]
+
+    def rows(self, before=None, limit=50):
+        """Up to ``limit`` rows strictly older than the ``(time, id)`` cursor ``before``"""
+        probes = self._probes()
+        # Only the filter's bytes of each bloom are read; NULL for segments archived without one
+        segments = select(ArchiveSegment, *[
+            func.substr(ArchiveSegment.filter_bloom, position // 8 + 1, 1) for position in probes
+        ]).where(ArchiveSegment.table_name == self.table_name)
+        if before is not None:
+            segments = segments.where(ArchiveSegment.min_time <= before[0])
+        found = []
+        decoded = 0
+        self.resume = None
+        for segment, *probed in db.session.execute(
+            segments.order_by(ArchiveSegment.max_time.desc(), ArchiveSegment.max_id.desc())
+        ):
+            newest = (segment.max_time, segment.max_id)
+            # Segments are ordered by their newest row; once enough rows are newer than it, stop
+            if len(found) >= limit and newest < found[limit - 1][0]:
+                break
+            if not all(byte is None or byte[0] >> (position & 7) & 1 for byte, position in zip(probed, probes)):
+                continue
+            if decoded == current_app.config.get('ARCHIVE_SCAN_SEGMENTS', 8):
+                # Rows up to this segment's newest may still be older than ones it holds:
+                # keep the rows above it and let the next page start just above it
+                found = [item for item in found if item[0] > newest]
+                self.resume = (segment.max_time, segment.max_id + 1)
+                break
+            found.extend(self._matching(_load_segment(segment), before))
+            found.sort(key=lambda item: item[0], reverse=True)
+            decoded += 1
+        rows = [ArchivedRow(values) for _, values in found[:limit]]
+        self._attach_users(rows)
+        return rows
+
+    def _matching(self, data, before):
+        times, ids = data[self.time_name], data['id']
+        wanted = [(name, str(value)) for name, value in self.filters.items() if name in data]
+        for i in range(len(ids)):
+            key = (times[i], ids[i])
+            if before is not None and key >= tuple(before):
+                continue
+            if all(str(data[name][i]) == value for name, value in wanted):
+                yield key, {name: values[i] for name, values in data.items()}
+
+    def _attach_users(self, rows):
+        if not self.user_column or not rows:
+            return
+        user_ids = {getattr(row, self.user_column) for row in rows} - {None}
+        users = {u.id: u for u in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+        for row in rows:
+            row.user = users.get(getattr(row, self.user_column))
+
+
+class ArchivedRow:
+    """A row read back from a segment, with the attributes of its model instance"""
+    archived = True
+
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+
+@archive_cli.command('run')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(sorted(POLICIES)),
+              help='Only this table (repeatable); default every table with a retention period.')
+@click.option('--dry-run', is_flag=True, help='Only count the rows that would be archived.')
+def run_command(tables, dry_run):
+    """Move log rows past their retention period into the archive."""
+    if dry_run:
+        for table_name in tables or POLICIES:
+            before = cutoff(table_name)
+            if before is None:
+                continue
+            model, time_name, _ = POLICIES[table_name]
+            count = db.session.query(func.count()).select_from(model).filter(
+                getattr(model, time_name) < before).scalar()
+            click.echo(f'{table_name}: {count} rows older than {before:%Y-%m-%d %H:%M}')
+        return
+    moved = run_retention(tables, log=click.echo)
+    for table_name, count in moved.items():
+        click.echo(f'{table_name}: {count} rows archived')
+
+
+@archive_cli.command('status')
+def status_command():
+    """Show the retention period and archive size of each table."""
+    for table_name, (model, time_name, _) in POLICIES.items():
+        days = current_app.config.get('RETENTION_DAYS', {}).get(table_name)
+        hot = db.session.query(func.count()).select_from(model).scalar()
+        segments, rows, size = db.session.query(
+            func.count(ArchiveSegment.id), func.coalesce(func.sum(ArchiveSegment.row_count), 0),
+            func.coalesce(func.sum(ArchiveSegment.size_bytes), 0),
+        ).filter(ArchiveSegment.table_name == table_name).one()
+        keep = f'{days} days' if days else 'forever'
+        click.echo(f'{table_name:<16} keep {keep:<10} {hot:>10} in table  {rows:>10} archived '
+                   f'in {segments} files ({size / 1048576:.1f} MB)')
@@ -0,0 +1,208 @@
+"""Incrementally maintained transaction rollup.
+
+``transaction_daily_rollup`` holds one row per (officer_id, day, status,
+payment_type) with the number of transactions and their total, where ``day``
+is the transaction's ``periode``. Session flush hooks fold every inserted,
+updated or deleted ``Transaction`` into the rollup inside the same database
+transaction, so the reports can aggregate a few rows per officer and day
+instead of scanning ``transactions``.
+
+Bulk statements that bypass the ORM (``Query.delete()``, raw SQL imports)
+must call ``rebuild()`` or ``clear()`` themselves. ``flask rollup rebuild``
+recomputes the table from scratch.
+"""
+from collections import defaultdict
+from decimal import Decimal
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import Transaction, TransactionDailyRollup, Officer, User, Area
+
+rollup_cli = AppGroup('rollup', help='Transaction rollup maintenance.')
+
+KEY_FIELDS = ('officer_id', 'periode', 'status', 'payment_type')
+
+
+def _old_value(obj, field):
+    history = attributes.get_history(obj, field)
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, field)
+
+
+def _key(values):
+    officer_id, periode, status, payment_type = values
+    return (int(officer_id), periode, status or 'pending', payment_type or 'cash')
+
+
+def _amount(value):
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+
+def collect_deltas(session):
+    """Compute rollup deltas for the Transaction objects in a flush"""
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            delta = deltas[_key([getattr(obj, f) for f in KEY_FIELDS])]
+            delta[0] += 1
+            delta[1] += _amount(obj.total)
+
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            delta = deltas[_key([_old_value(obj, f) for f in KEY_FIELDS])]
+            delta[0] -= 1
+            delta[1] -= _amount(_old_value(obj, 'total'))
+
+    for obj in session.dirty:
+        if not isinstance(obj, Transaction) or not session.is_modified(obj):
+            continue
+        old_key = _key([_old_value(obj, f) for f in KEY_FIELDS])
+        new_key = _key([getattr(obj, f) for f in KEY_FIELDS])
+        old_total = _amount(_old_value(obj, 'total'))
+        new_total = _amount(obj.total)
+        if old_key == new_key and old_total == new_total:
+            continue
+        deltas[old_key][0] -= 1
+        deltas[old_key][1] -= old_total
+        deltas[new_key][0] += 1
+        deltas[new_key][1] += new_total
+
+    return {key: value for key, value in deltas.items() if value[0] or value[1]}
+
+
+def upsert_statement(dialect_name, rows):
+    """Build an additive multi-row upsert for the rollup table"""
+    table = TransactionDailyRollup.__table__
+    if dialect_name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        return stmt.on_duplicate_key_update(
+            txn_count=table.c.txn_count + stmt.inserted.txn_count,
+            total=table.c.total + stmt.inserted.total,
+        )
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[c for c in table.primary_key.columns],
+        set_={
+            'txn_count': table.c.txn_count + stmt.excluded.txn_count,
+            'total': table.c.total + stmt.excluded.total,
+        },
+    )
+
+
+def apply_deltas(connection, deltas):
+    if not deltas:
+        return
+    rows = [
+        {'officer_id': officer_id, 'day': day, 'status': status, 'payment_type': payment_type,
+         'txn_count': count, 'total': total}
+        for (officer_id, day, status, payment_type), (count, total) in deltas.items()
+    ]
+    connection.execute(upsert_statement(connection.dialect.name, rows))
+    if any(count < 0 for count, _total in deltas.values()):
+        table = TransactionDailyRollup.__table__
+        connection.execute(table.delete().where(table.c.txn_count <= 0))
+
+
+def _after_flush(session, flush_context):
+    apply_deltas(session.connection(), collect_deltas(session))
+
+
+def clear():
+    """Empty the rollup, e.g. after a bulk delete of all transactions"""
+    db.session.execute(TransactionDailyRollup.__table__.delete())
+
+
+def rebuild(connection=None):
+    """Recompute the whole rollup from ``transactions`` in one statement"""
+    connection = connection or db.session.connection()
+    table = TransactionDailyRollup.__table__
+    source = select(
+        Transaction.officer_id,
+        Transaction.periode,
+        Transaction.status,
+        Transaction.payment_type,
+        func.count(Transaction.id),
+        func.sum(Transaction.total),
+    ).group_by(Transaction.officer_id, Transaction.periode, Transaction.status, Transaction.payment_type)
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['officer_id', 'day', 'status', 'payment_type', 'txn_count', 'total'], source
+    ))
+
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+    app.cli.add_command(rollup_cli)
+
+
+# Report queries. Each returns an unexecuted Query: views call .all(), exports
+# stream it from the cursor.
+
+_count = func.sum(TransactionDailyRollup.txn_count).label('count')
+_total = func.sum(TransactionDailyRollup.total).label('total')
+
+
+def rbm_summary():
+    return db.session.query(Officer.rbm_code, _count, _total).join(
+        TransactionDailyRollup, Officer.id == TransactionDailyRollup.officer_id
+    ).group_by(Officer.rbm_code)
+
+
+def coordinator_summary():
+    return db.session.query(User.username, _count, _total).join(
+        Officer, User.id == Officer.coordinator_id
+    ).join(
+        TransactionDailyRollup, Officer.id == TransactionDailyRollup.officer_id
+    ).group_by(User.id, User.username)
+
+
+def officer_summary():
+    return db.session.query(User.username, _count, _total).join(
+        Officer, User.id == Officer.user_id
+    ).join(
+        TransactionDailyRollup, Officer.id == TransactionDailyRollup.officer_id
+    ).group_by(User.id, User.username)
+
+
+def area_summary():
+    return db.session.query(Area.name, _count, _total).select_from(Area).join(
+        User, Area.code == User.area_code
+    ).join(
+        Officer, User.id == Officer.user_id
+    ).join(
+        TransactionDailyRollup, Officer.id == TransactionDailyRollup.officer_id
+    ).group_by(Area.code, Area.name)
+
+
+def monthly_histogram(since):
+    """Return ``(months, counts, totals)`` for periods on or after ``since``"""
+    rows = db.session.query(TransactionDailyRollup.day, _count, _total).filter(
+        TransactionDailyRollup.day >= since
+    ).group_by(TransactionDailyRollup.day).order_by(TransactionDailyRollup.day).all()
+
+    buckets = {}
+    for row in rows:
+        month = row.day.strftime('%Y-%m')
+        count, total = buckets.get(month, (0, 0.0))
+        buckets[month] = (count + int(row.count or 0), total + float(row.total or 0))
+
+    months = list(buckets)
+    counts = [buckets[m][0] for m in months]
+    totals = [buckets[m][1] for m in months]
+    return months, counts, totals
+
+
+@rollup_cli.command('rebuild')
+def rebuild_command():
+    """Recompute transaction_daily_rollup from transactions."""
+    rebuild()
+    db.session.commit()
+    rows = TransactionDailyRollup.query.count()
+    click.echo(f'Rollup rebuilt: {rows} rows.')
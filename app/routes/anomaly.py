@@ -3,6 +3,9 @@ from flask_login import login_required, current_user
 from flask_babel import _
 from app.models import Anomaly, AnomalyMaster, User
 from app import db
+from app.pagination import paginate_view
+from app import loading
+from app.audit import log_event
 from datetime import datetime
 
 anomaly_bp = Blueprint('anomaly', __name__)
@@ -15,8 +18,12 @@ def index():
 @anomaly_bp.route('/daily-reports')
 @login_required
 def daily_reports():
-    anomalies = Anomaly.query.order_by(Anomaly.created_at.desc()).all()
-    return render_template('anomaly/daily_reports.html', anomalies=anomalies)
+    page, filters = paginate_view(
+        Anomaly.query.options(*loading.anomaly_reporter()), Anomaly.created_at, Anomaly.id,
+        filters={'status': Anomaly.status, 'idpel': Anomaly.idpel},
+        table_name='anomalies'
+    )
+    return render_template('anomaly/daily_reports.html', anomalies=page.items, page=page, filters=filters)
 
 @anomaly_bp.route('/daily-reports/add', methods=['GET', 'POST'])
 @login_required
@@ -35,6 +42,7 @@ def add_anomaly():
         )
         db.session.add(anomaly)
         db.session.commit()
+        log_event('create', f'Anomaly {anomaly_type} {idpel}')
         flash(_('Anomaly report added successfully'), 'success')
         return redirect(url_for('anomaly.daily_reports'))
     
@@ -56,6 +64,7 @@ def edit_anomaly(id):
             anomaly.resolved_at = datetime.utcnow()
         
         db.session.commit()
+        log_event('update', f"Anomaly #{id} {request.form.get('status', 'reported')}")
         flash(_('Anomaly report updated successfully'), 'success')
         return redirect(url_for('anomaly.daily_reports'))
     
@@ -67,6 +76,7 @@ def delete_anomaly(id):
     anomaly = Anomaly.query.get_or_404(id)
     db.session.delete(anomaly)
     db.session.commit()
+    log_event('delete', f'Anomaly #{id}')
     flash(_('Anomaly report deleted successfully'), 'success')
     return redirect(url_for('anomaly.daily_reports'))
 
@@ -78,6 +88,7 @@ def resolve_anomaly(id):
     anomaly.resolved_by = current_user.id
     anomaly.resolved_at = datetime.utcnow()
     db.session.commit()
+    log_event('resolve', f'Anomaly #{id}')
     flash(_('Anomaly report resolved successfully'), 'success')
     return redirect(url_for('anomaly.daily_reports'))
 
@@ -118,6 +129,7 @@ def add_anomaly_master():
         )
         db.session.add(anomaly_master)
         db.session.commit()
+        log_event('create', f'Anomaly type {code}')
         flash(_('Anomaly master data added successfully'), 'success')
         return redirect(url_for('anomaly.master_data'))
     
@@ -135,6 +147,7 @@ def edit_anomaly_master(id):
         anomaly_master.active = request.form.get('active') == 'on'
         
         db.session.commit()
+        log_event('update', f'Anomaly type #{id}')
         flash(_('Anomaly master data updated successfully'), 'success')
         return redirect(url_for('anomaly.master_data'))
     
@@ -146,5 +159,6 @@ def delete_anomaly_master(id):
     anomaly_master = AnomalyMaster.query.get_or_404(id)
     db.session.delete(anomaly_master)
     db.session.commit()
+    log_event('delete', f'Anomaly type #{id}')
     flash(_('Anomaly master data deleted successfully'), 'success')
     return redirect(url_for('anomaly.master_data'))
\ No newline at end of file
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from flask_babel import _
 from app.models import User
 from app import db, captcha
+from app.audit import log_event
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -20,8 +21,10 @@ def login():
 
         if user and user.check_password(password):
             login_user(user)
+            log_event('login', user.username)
             return redirect(url_for('dashboard.index'))
         else:
+            log_event('login_failed', username, user_id=user.id if user else None)
             flash(_('Invalid username or password.'), 'error')
             return redirect(url_for('auth.login'))
             
@@ -30,6 +33,7 @@ def login():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    log_event('logout', current_user.username)
     logout_user()
     flash(_('You have been logged out.'), 'info')
     return redirect(url_for('auth.login'))
@@ -42,7 +46,8 @@ def change_password():
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
         
-        if not current_user.check_password(current_password):
+        user = current_user.load()
+        if not user.check_password(current_password):
             flash(_('Current password is incorrect'), 'error')
             return render_template('auth/change_password.html')
         
@@ -50,8 +55,9 @@ def change_password():
             flash(_('New passwords do not match'), 'error')
             return render_template('auth/change_password.html')
         
-        current_user.set_password(new_password)
+        user.set_password(new_password)
         db.session.commit()
+        log_event('password_change', current_user.username)
         
         flash(_('Password updated successfully'), 'success')
         return redirect(url_for('main.index'))
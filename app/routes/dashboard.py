@@ -1,42 +1,67 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, jsonify
 from flask_login import login_required
-from flask_babel import _
-from app.models import Transaction, User, Officer
-from app import db
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from app import captcha, replica
+from app.dashboard_stats import dashboard_stats
+from app.identity import identity_cache
+from app.sql_stats import sql_stats
+from app.audit import audit_log
+from app.whatsapp.receipts import receipt_buffer
+from app.tunggakan import tunggakan_aging
+from app.utils import admin_required
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/')
 @login_required
 def index():
-    # Get summary statistics
-    total_transactions = Transaction.query.count()
-    completed_transactions = Transaction.query.filter_by(status='completed').count()
-    pending_transactions = Transaction.query.filter_by(status='pending').count()
-    
-    # Get transaction data for the last 6 months for the histogram
-    six_months_ago = datetime.now() - timedelta(days=180)
-    monthly_data = db.session.query(
-        func.date_format(Transaction.periode, '%Y-%m').label('month'),
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).filter(Transaction.periode >= six_months_ago).group_by('month').all()
-    
-    # Prepare data for the chart
-    months = [row.month for row in monthly_data]
-    counts = [row.count for row in monthly_data]
-    totals = [float(row.total) if row.total else 0 for row in monthly_data]
-    
-    # Get recent transactions
-    recent_transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(5).all()
-    
-    return render_template('dashboard/index.html', 
-                          total_transactions=total_transactions,
-                          completed_transactions=completed_transactions,
-                          pending_transactions=pending_transactions,
-                          months=months,
-                          counts=counts,
-                          totals=totals,
-                          recent_transactions=recent_transactions)
\ No newline at end of file
+    # All counters, the histogram and recent rows come from one cached bundle
+    stats = dashboard_stats.get()
+    return render_template('dashboard/index.html', **stats)
+
+@dashboard_bp.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(dashboard_stats.metrics())
+
+@dashboard_bp.route('/identity-cache-stats')
+@login_required
+@admin_required
+def identity_cache_stats():
+    return jsonify(identity_cache.metrics())
+
+@dashboard_bp.route('/captcha-pool-stats')
+@login_required
+@admin_required
+def captcha_pool_stats():
+    return jsonify(captcha.metrics())
+
+@dashboard_bp.route('/replica-stats')
+@login_required
+@admin_required
+def replica_stats():
+    return jsonify(replica.metrics())
+
+@dashboard_bp.route('/sql-stats')
+@login_required
+@admin_required
+def sql_stats_metrics():
+    return jsonify(sql_stats.metrics())
+
+@dashboard_bp.route('/audit-log-stats')
+@login_required
+@admin_required
+def audit_log_stats():
+    return jsonify(audit_log.metrics())
+
+@dashboard_bp.route('/wa-receipt-stats')
+@login_required
+@admin_required
+def wa_receipt_stats():
+    return jsonify(receipt_buffer.metrics())
+
+@dashboard_bp.route('/tunggakan-aging-stats')
+@login_required
+@admin_required
+def tunggakan_aging_stats():
+    return jsonify(tunggakan_aging.metrics())
@@ -1,11 +1,26 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 from flask_babel import _
-from app.models import User, Transaction
-from app import db
+from app.models import User, Transaction, CustomerSummary
+from app import loading, customer_search
 
 information_bp = Blueprint('information', __name__)
 
+# Transaction history rows shown on the customer page
+RECENT_TRANSACTIONS = 24
+
+
+def customer_summary_query(idpel):
+    """The customer panel's one primary-key read, officer and user joined"""
+    return CustomerSummary.query.options(*loading.customer_summary_officer()).filter(CustomerSummary.idpel == idpel)
+
+
+def recent_transactions_query(idpel):
+    """The newest ``RECENT_TRANSACTIONS`` bills of one customer"""
+    return Transaction.query.filter_by(idpel=idpel).order_by(
+        Transaction.periode.desc(), Transaction.id.desc()
+    ).limit(RECENT_TRANSACTIONS)
+
 @information_bp.route('/')
 @login_required
 def index():
@@ -15,27 +30,47 @@ def index():
 @login_required
 def customer_lookup():
     customer_data = None
-    if request.method == 'POST':
-        search_query = request.form.get('search_query')
-        
-        # Search by idpel or other customer information
-        # First, try direct ID Pelanggan match
-        transactions = Transaction.query.filter_by(idpel=search_query).all()
-        
-        if not transactions:
-            # If no transactions found by idpel, try searching in other related tables
-            # Look for customer data by name if available in future implementation
-            pass
+    results = None
+    search_query = (request.values.get('search_query') or '').strip()
+    idpel = request.args.get('idpel')
+    
+    if search_query and not idpel:
+        # An exact ID Pelanggan goes straight to the customer, anything else
+        # shows ranked prefix and near matches
+        results = customer_search.search(search_query, page=request.args.get('page', 1, type=int))
+        if results.items and results.items[0]['match'] == 'exact' and request.method == 'POST':
+            idpel, results = results.items[0]['idpel'], None
+        elif not results.total:
+            flash(_('No customer found with ID: %(id)s', id=search_query), 'warning')
+            results = None
+    
+    if idpel:
+        # Everything in the customer panel comes from one primary-key read
+        summary = customer_summary_query(idpel).one_or_none()
         
-        if transactions:
-            # Get customer information from the first transaction
-            transaction = transactions[0]
+        if summary:
+            transactions = recent_transactions_query(idpel).all() if summary.txn_count else []
             customer_data = {
-                'idpel': search_query,
+                'idpel': idpel,
+                'summary': summary,
                 'transactions': transactions,
-                'officer_name': transaction.officer.user.username if transaction.officer.user else 'N/A'
+                'officer_name': summary.officer.user.username if summary.officer and summary.officer.user else 'N/A'
             }
         else:
-            flash(_('No customer found with ID: %(id)s', id=search_query), 'warning')
+            flash(_('No customer found with ID: %(id)s', id=idpel), 'warning')
     
-    return render_template('information/customer_lookup.html', customer_data=customer_data)
\ No newline at end of file
+    return render_template('information/customer_lookup.html', customer_data=customer_data,
+                           results=results, search_query=search_query)
+
+@information_bp.route('/customer-search')
+@login_required
+def customer_search_json():
+    results = customer_search.search(request.args.get('q', ''), page=request.args.get('page', 1, type=int))
+    return jsonify({
+        'query': results.query,
+        'page': results.page,
+        'total': results.total,
+        'has_next': results.has_next,
+        'results': [dict(item, last_periode=item['last_periode'].isoformat() if item['last_periode'] else None)
+                    for item in results.items],
+    })
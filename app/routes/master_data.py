@@ -1,12 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import os
+import tempfile
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, current_app
 from flask_login import login_required, current_user
 from flask_babel import _
-from app.models import User, Area, Officer
-from app import db
+from app.models import User, Area, Officer, Transaction, TalanganTransaction, TransactionImport
+from app import db, rollup, loading, customer_search, customer_summary
 from app.utils import admin_required
+from app.dashboard_stats import dashboard_stats
+from app.identity import identity_cache
+from app.imports import staff
+from app.imports.files import ImportFileError, allowed_file
+from app.imports.jobs import import_jobs
+from app.audit import log_event
 
 master_data_bp = Blueprint('master_data', __name__)
 
+RECENT_IMPORTS = 20
+
 @master_data_bp.route('/')
 @login_required
 def index():
@@ -18,7 +28,7 @@ def index():
 def coordinators():
     area_code = request.args.get('area', '')
     
-    query = User.query.filter_by(role='coordinator')
+    query = User.query.filter_by(role='coordinator').options(*loading.coordinator_list())
     if area_code:
         query = query.filter(User.area_code == area_code)
     
@@ -54,6 +64,7 @@ def add_coordinator():
         
         db.session.add(coordinator)
         db.session.commit()
+        log_event('create', f'Coordinator {username}')
         flash(_('Coordinator added successfully'), 'success')
         return redirect(url_for('master_data.coordinators'))
     
@@ -86,6 +97,7 @@ def edit_coordinator(id):
             coordinator.set_password(new_password)
         
         db.session.commit()
+        log_event('update', f'Coordinator {username} (#{id})')
         flash(_('Coordinator updated successfully'), 'success')
         return redirect(url_for('master_data.coordinators'))
     
@@ -112,6 +124,7 @@ def delete_coordinator(id):
     
     db.session.delete(coordinator)
     db.session.commit()
+    log_event('delete', f'Coordinator #{id}')
     flash(_('Coordinator deleted successfully'), 'success')
     return redirect(url_for('master_data.coordinators'))
 
@@ -119,7 +132,7 @@ def delete_coordinator(id):
 @login_required
 @admin_required
 def officers():
-    officers = Officer.query.join(User, Officer.user_id == User.id).all()
+    officers = Officer.query.join(User, Officer.user_id == User.id).options(*loading.officer_list()).all()
     return render_template('master_data/officers.html', officers=officers)
     
 @master_data_bp.route('/officers/add', methods=['GET', 'POST'])
@@ -147,9 +160,9 @@ def add_officer():
         )
         user.set_password(password)
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
 
-        # Create new officer
+        # Create new officer in the same transaction
         officer = Officer(
             user_id=user.id,
             rbm_code=rbm_code,
@@ -157,6 +170,7 @@ def add_officer():
         )
         db.session.add(officer)
         db.session.commit()
+        log_event('create', f'Officer {username}')
         flash(_('Officer added successfully'), 'success')
         return redirect(url_for('master_data.officers'))
 
@@ -165,6 +179,41 @@ def add_officer():
     return render_template('master_data/add_officer.html', areas=areas, coordinators=coordinators)
 
 
+@master_data_bp.route('/officers/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_officers():
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash(_('Please choose a file to import'), 'danger')
+            return redirect(url_for('master_data.import_officers'))
+        if not allowed_file(upload.filename):
+            flash(_('Unsupported file type. Use CSV, CSV.GZ or XLSX.'), 'danger')
+            return redirect(url_for('master_data.import_officers'))
+        
+        # Keep the extension so the reader can tell CSV from XLSX
+        suffix = '.csv.gz' if upload.filename.lower().endswith('.csv.gz') else os.path.splitext(upload.filename)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix.lower()) as saved:
+            upload.save(saved)
+            saved.flush()
+            try:
+                result = staff.import_staff(saved.name)
+            except ImportFileError as exc:
+                flash(str(exc), 'danger')
+                return redirect(url_for('master_data.import_officers'))
+        
+        log_event('import', f'Staff file {upload.filename}: {result.officers} officers, '
+                            f'{result.coordinators} coordinators, {result.rejected} rejected')
+        if result.officers or result.coordinators:
+            flash(_('Created %(officers)s officers and %(coordinators)s coordinators',
+                    officers=result.officers, coordinators=result.coordinators), 'success')
+        if result.rejected:
+            flash(_('%(count)s rows were rejected', count=result.rejected), 'warning')
+    
+    return render_template('master_data/import_officers.html', result=result)
+
 @master_data_bp.route('/officers/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -185,6 +234,7 @@ def edit_officer(id):
         officer.active = 'active' in request.form
 
         db.session.commit()
+        log_event('update', f'Officer #{id}')
         flash(_('Officer updated successfully'), 'success')
         return redirect(url_for('master_data.officers'))
 
@@ -199,6 +249,7 @@ def toggle_officer_active(officer_id):
     officer = Officer.query.get_or_404(officer_id)
     officer.active = not officer.active
     db.session.commit()
+    log_event('update', f"Officer #{officer.id} {'activated' if officer.active else 'deactivated'}")
     status = _('active') if officer.active else _('inactive')
     flash(_('Officer status updated to %(status)s', status=status), 'success')
     return redirect(url_for('master_data.officers'))
@@ -212,6 +263,7 @@ def reset_officer_imei(officer_id):
     if officer.user:
         officer.user.imei = None
     db.session.commit()
+    log_event('reset_imei', f'Officer #{officer_id}')
     flash(_('Officer IMEI reset successfully'), 'success')
     return redirect(url_for('master_data.officers'))
 
@@ -231,11 +283,15 @@ def reset_umt():
         if reset_users:
             # Reset user data
             User.query.update({User.imei: None})
+            identity_cache.clear()
             reset_messages.append("User IMEI data has been reset")
         
         if reset_transactions:
             # Reset transaction data
             Transaction.query.delete()
+            rollup.clear()
+            customer_search.clear()
+            dashboard_stats.invalidate()
             reset_messages.append("Transaction data has been cleared")
         
         if reset_talangan:
@@ -243,9 +299,13 @@ def reset_umt():
             TalanganTransaction.query.delete()
             reset_messages.append("Talangan transaction data has been cleared")
         
+        if reset_transactions or reset_talangan:
+            customer_summary.rebuild()
+        
         db.session.commit()
         
         if reset_messages:
+            log_event('reset', '; '.join(reset_messages))
             for msg in reset_messages:
                 flash(_(msg), 'success')
         else:
@@ -253,4 +313,51 @@ def reset_umt():
         
         return redirect(url_for('master_data.reset_umt'))
     
-    return render_template('master_data/reset_umt.html')
\ No newline at end of file
+    return render_template('master_data/reset_umt.html')
+
+@master_data_bp.route('/import-transactions', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_transactions():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash(_('Please choose a file to import'), 'danger')
+        elif not allowed_file(upload.filename):
+            flash(_('Unsupported file type. Use CSV, CSV.GZ or XLSX.'), 'danger')
+        else:
+            job = import_jobs.submit(current_user.id, upload)
+            log_event('import', f'Transaction import #{job.id} {upload.filename} queued')
+            flash(_('Import #%(id)s queued. Progress is shown below.', id=job.id), 'info')
+        return redirect(url_for('master_data.import_transactions'))
+    
+    imports = TransactionImport.query.order_by(TransactionImport.id.desc()).limit(RECENT_IMPORTS).all()
+    return render_template('master_data/import_transactions.html', imports=imports)
+
+@master_data_bp.route('/import-transactions/<int:import_id>')
+@login_required
+@admin_required
+def import_status(import_id):
+    job = TransactionImport.query.get_or_404(import_id)
+    return jsonify({
+        'import_id': job.id,
+        'filename': job.filename,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'inserted': job.inserted,
+        'updated': job.updated,
+        'rejected': job.rejected,
+        'error': job.error,
+        'rejects_url': url_for('master_data.import_rejects', import_id=job.id) if job.rejects_path else None,
+    })
+
+@master_data_bp.route('/import-transactions/<int:import_id>/rejects')
+@login_required
+@admin_required
+def import_rejects(import_id):
+    job = TransactionImport.query.get_or_404(import_id)
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], job.rejects_path or '')
+    if not job.rejects_path or not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='text/csv', as_attachment=True,
+                     download_name=f'import_{job.id}_rejects.csv')
@@ -1,12 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
-from flask_login import login_required
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, abort, jsonify
+from flask_login import login_required, current_user
 from flask_babel import _
-from app.models import Transaction, User, Officer, Area, WALog, PrintLog, MonitoringLog, DailySettlement
-from app import db
+from app.models import Transaction, WALog, PrintLog, MonitoringLog, DailySettlement, ReportExport
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from app.utils import export_transactions_to_excel, export_to_excel, export_to_pdf
-import decimal
+from app.pagination import paginate_view, get_per_page
+from app import rollup, loading
+from app.exports.registry import EXPORT_FORMATS, get_report, export_response
+from app.exports.jobs import export_jobs
+from app.sql_stats import endpoint_ranking
+from app.utils import admin_required
+from app.audit import log_event
+from app.tunggakan import tunggakan_aging, BUCKETS
+import os
 
 reports_bp = Blueprint('reports', __name__)
 
@@ -18,12 +23,8 @@ def index():
 @reports_bp.route('/rbm')
 @login_required
 def rbm():
-    # Get transaction data grouped by RBM
-    rbm_data = db.session.query(
-        Officer.rbm_code,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Transaction, Officer.id == Transaction.officer_id).group_by(Officer.rbm_code).all()
+    # Get transaction data grouped by RBM from the rollup table
+    rbm_data = rollup.rbm_summary().all()
     
     return render_template('reports/rbm.html', rbm_data=rbm_data)
 
@@ -31,11 +32,7 @@ def rbm():
 @login_required
 def coordinator():
     # Get transaction data grouped by coordinator
-    coordinator_data = db.session.query(
-        User.username,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Officer, User.id == Officer.coordinator_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(User.id).all()
+    coordinator_data = rollup.coordinator_summary().all()
     
     return render_template('reports/coordinator.html', coordinator_data=coordinator_data)
 
@@ -43,11 +40,7 @@ def coordinator():
 @login_required
 def officer():
     # Get transaction data grouped by officer
-    officer_data = db.session.query(
-        User.username,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Officer, User.id == Officer.user_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(User.id).all()
+    officer_data = rollup.officer_summary().all()
     
     return render_template('reports/officer.html', officer_data=officer_data)
 
@@ -55,48 +48,81 @@ def officer():
 @login_required
 def area():
     # Get transaction data grouped by area
-    area_data = db.session.query(
-        Area.name,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).select_from(Area).join(User, Area.code == User.area_code).join(Officer, User.id == Officer.user_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(Area.code).all()
+    area_data = rollup.area_summary().all()
     
     return render_template('reports/area.html', area_data=area_data)
 
 @reports_bp.route('/tunggakan')
 @login_required
 def tunggakan():
-    # Get outstanding payments (pending transactions)
-    tunggakan_data = Transaction.query.filter_by(status='pending').all()
-    return render_template('reports/tunggakan.html', tunggakan_data=tunggakan_data)
+    # Arrears aging per customer, officer and area, from the cached aging report
+    report = tunggakan_aging.get()
+    filters = {name: request.args[name] for name in ('idpel', 'officer_id', 'area', 'bucket') if request.args.get(name)}
+    customers = report.select(idpel=filters.get('idpel'), officer_id=request.args.get('officer_id', type=int),
+                              area=filters.get('area'), bucket=filters.get('bucket'))
+    per_page = get_per_page()
+    page_number = max(1, request.args.get('page', 1, type=int))
+    return render_template(
+        'reports/tunggakan.html', report=report, filters=filters, summary=report.summary(customers),
+        areas=report.by_area(customers), officers=report.by_officer(customers),
+        tunggakan_data=report.rows(customers, (page_number - 1) * per_page, per_page),
+        page_number=page_number, per_page=per_page, has_next=page_number * per_page < len(customers),
+        buckets=BUCKETS,
+    )
 
 @reports_bp.route('/wa-monitoring')
 @login_required
 def wa_monitoring():
     # Get WA logs data
-    wa_logs = WALog.query.order_by(WALog.created_at.desc()).all()
-    return render_template('reports/wa_monitoring.html', wa_logs=wa_logs)
+    page, filters = paginate_view(
+        WALog.query, WALog.created_at, WALog.id,
+        filters={'status': WALog.status, 'idpel': WALog.idpel},
+        table_name='wa_logs', archived=True
+    )
+    return render_template('reports/wa_monitoring.html', wa_logs=page.items, page=page, filters=filters)
 
 @reports_bp.route('/log-monitoring')
 @login_required
 def log_monitoring():
     # Get monitoring logs data
-    monitoring_logs = MonitoringLog.query.order_by(MonitoringLog.created_at.desc()).all()
-    return render_template('reports/log_monitoring.html', monitoring_logs=monitoring_logs)
+    page, filters = paginate_view(
+        MonitoringLog.query.options(*loading.monitoring_log_user()), MonitoringLog.created_at, MonitoringLog.id,
+        filters={'module_name': MonitoringLog.module_name, 'event_type': MonitoringLog.event_type},
+        table_name='monitoring_logs', archived=True
+    )
+    return render_template('reports/log_monitoring.html', monitoring_logs=page.items, page=page, filters=filters)
+
+@reports_bp.route('/sql-stats')
+@login_required
+@admin_required
+def sql_stats():
+    days = request.args.get('days', 1, type=int)
+    if days not in (1, 7, 30):
+        days = 1
+    rows = endpoint_ranking(datetime.utcnow().date() - timedelta(days=days - 1)).limit(100).all()
+    return render_template('reports/sql_stats.html', rows=rows, days=days)
 
 @reports_bp.route('/daily-settlement')
 @login_required
 def daily_settlement():
     # Get daily settlement data
-    settlements = DailySettlement.query.order_by(DailySettlement.date.desc()).all()
-    return render_template('reports/daily_settlement.html', settlements=settlements)
+    page, filters = paginate_view(
+        DailySettlement.query.options(*loading.settlement_officer()), DailySettlement.date, DailySettlement.id,
+        filters={'status': DailySettlement.status, 'officer_id': DailySettlement.officer_id},
+        table_name='daily_settlements'
+    )
+    return render_template('reports/daily_settlement.html', settlements=page.items, page=page, filters=filters)
 
 @reports_bp.route('/bluetooth-print')
 @login_required
 def bluetooth_print():
     # Get print logs data
-    print_logs = PrintLog.query.join(Transaction).order_by(PrintLog.printed_at.desc()).all()
-    return render_template('reports/bluetooth_print.html', print_logs=print_logs)
+    page, filters = paginate_view(
+        PrintLog.query.join(Transaction).options(*loading.print_log_user()), PrintLog.printed_at, PrintLog.id,
+        filters={'printed_by': PrintLog.printed_by, 'idpel': Transaction.idpel},
+        table_name='print_logs', archived=True
+    )
+    return render_template('reports/bluetooth_print.html', print_logs=page.items, page=page, filters=filters)
 
 @reports_bp.route('/morning-evening')
 @login_required
@@ -113,166 +139,99 @@ def monthly():
     return render_template('reports/monthly.html')
 
 # Export routes
+def _export(report_name, format, fallback_endpoint):
+    report = get_report(report_name)
+    if format not in EXPORT_FORMATS:
+        flash('Invalid export format', 'error')
+        return redirect(url_for(fallback_endpoint))
+    log_event('export', f'{report_name} {format}')
+    return export_response(report, format)
+
 @reports_bp.route('/rbm/export/<format>')
 @login_required
 def rbm_export(format):
-    rbm_data = db.session.query(
-        Officer.rbm_code,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Transaction, Officer.id == Transaction.officer_id).group_by(Officer.rbm_code).all()
-    
-    if format == 'excel':
-        headers = ['rbm_code', 'count', 'total']
-        output, filename = export_to_excel(rbm_data, headers, 'rbm_report')
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    elif format == 'pdf':
-        headers = ['RBM Code', 'Count', 'Total']
-        output, filename = export_to_pdf(rbm_data, headers, 'rbm_report', 'RBM Report')
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('reports.rbm'))
+    return _export('rbm', format, 'reports.rbm')
 
 @reports_bp.route('/coordinator/export/<format>')
 @login_required
 def coordinator_export(format):
-    coordinator_data = db.session.query(
-        User.username,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Officer, User.id == Officer.coordinator_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(User.id).all()
-    
-    if format == 'excel':
-        headers = ['username', 'count', 'total']
-        output, filename = export_to_excel(coordinator_data, headers, 'coordinator_report')
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    elif format == 'pdf':
-        headers = ['Username', 'Count', 'Total']
-        output, filename = export_to_pdf(coordinator_data, headers, 'coordinator_report', 'Coordinator Report')
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('reports.coordinator'))
+    return _export('coordinator', format, 'reports.coordinator')
 
 @reports_bp.route('/officer/export/<format>')
 @login_required
 def officer_export(format):
-    officer_data = db.session.query(
-        User.username,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).join(Officer, User.id == Officer.user_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(User.id).all()
-    
-    if format == 'excel':
-        headers = ['username', 'count', 'total']
-        output, filename = export_to_excel(officer_data, headers, 'officer_report')
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    elif format == 'pdf':
-        headers = ['Username', 'Count', 'Total']
-        output, filename = export_to_pdf(officer_data, headers, 'officer_report', 'Officer Report')
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('reports.officer'))
+    return _export('officer', format, 'reports.officer')
 
 @reports_bp.route('/area/export/<format>')
 @login_required
 def area_export(format):
-    area_data = db.session.query(
-        Area.name,
-        func.count(Transaction.id).label('count'),
-        func.sum(Transaction.total).label('total')
-    ).select_from(Area).join(User, Area.code == User.area_code).join(Officer, User.id == Officer.user_id).join(Transaction, Officer.id == Transaction.officer_id).group_by(Area.code).all()
-
-    if format == 'excel':
-        headers = ['name', 'count', 'total']
-        output, filename = export_to_excel(area_data, headers, 'area_report')
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    elif format == 'pdf':
-        headers = ['Area', 'Count', 'Total']
-        output, filename = export_to_pdf(area_data, headers, 'area_report', 'Area Report')
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('reports.area'))
+    return _export('area', format, 'reports.area')
 
 @reports_bp.route('/tunggakan/export/<format>')
 @login_required
 def tunggakan_export(format):
-    tunggakan_data = Transaction.query.filter_by(status='pending').all()
-    
-    if format == 'excel':
-        output, filename = export_transactions_to_excel(tunggakan_data)
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
-    elif format == 'pdf':
-        headers = ['ID', 'ID Pelanggan', 'Periode', 'Total', 'Tipe Pembayaran', 'Status', 'Petugas', 'Tanggal Dibuat']
-        processed_data = []
-        for t in tunggakan_data:
-            processed_t = [
-                t.id,
-                t.idpel,
-                t.periode,
-                float(t.total) if t.total else 0,
-                t.payment_type,
-                t.status,
-                t.officer.user.username if t.officer and t.officer.user else 'N/A',
-                t.created_at
-            ]
-            processed_data.append(processed_t)
-        
-        output, filename = export_to_pdf(processed_data, headers, 'tunggakan_report', 'Outstanding Payment Report')
-        return send_file(
-            output,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('reports.tunggakan'))
\ No newline at end of file
+    return _export('tunggakan', format, 'reports.tunggakan')
+
+@reports_bp.route('/tunggakan/<breakdown>/export/<format>')
+@login_required
+def tunggakan_aging_export(breakdown, format):
+    if breakdown not in ('customers', 'officers', 'areas'):
+        abort(404)
+    return _export(f'tunggakan_{breakdown}', format, 'reports.tunggakan')
+
+# Background export jobs
+@reports_bp.route('/<report_name>/export/<format>/queue', methods=['POST'])
+@login_required
+def queue_export(report_name, format):
+    if get_report(report_name) is None or format not in EXPORT_FORMATS:
+        abort(404)
+    job = export_jobs.submit(current_user.id, report_name, format)
+    log_event('export', f'{report_name} {format} queued as #{job.id}')
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job.id, 'status': job.status,
+                        'status_url': url_for('reports.export_status', job_id=job.id)}), 202
+    flash(_('Export #%(id)s queued. It will appear below when ready.', id=job.id), 'info')
+    return redirect(url_for('reports.exports'))
+
+@reports_bp.route('/exports')
+@login_required
+def exports():
+    page, filters = paginate_view(
+        ReportExport.query.filter_by(user_id=current_user.id), ReportExport.exported_at, ReportExport.id,
+        filters={'status': ReportExport.status, 'report_type': ReportExport.report_type}
+    )
+    return render_template('reports/exports.html', jobs=page.items, page=page, filters=filters)
+
+def _own_job(job_id):
+    job = ReportExport.query.get_or_404(job_id)
+    if job.user_id != current_user.id and current_user.role != 'admin':
+        abort(403)
+    return job
+
+@reports_bp.route('/exports/<int:job_id>')
+@login_required
+def export_status(job_id):
+    job = _own_job(job_id)
+    return jsonify({
+        'job_id': job.id,
+        'report': job.report_type,
+        'format': job.format,
+        'status': job.status,
+        'error': job.error,
+        'download_url': url_for('reports.download_export', job_id=job.id) if job.status == 'completed' else None,
+    })
+
+@reports_bp.route('/exports/<int:job_id>/download')
+@login_required
+def download_export(job_id):
+    job = _own_job(job_id)
+    if job.status != 'completed':
+        flash(_('Export #%(id)s is not ready yet', id=job.id), 'warning')
+        return redirect(url_for('reports.exports'))
+    path = export_jobs.path_for(job)
+    if not os.path.exists(path):
+        abort(404)
+    extension, mimetype = EXPORT_FORMATS[job.format]
+    log_event('download', f'Export #{job.id} {job.report_type} {job.format}')
+    download_name = os.path.basename(job.file_path).rsplit('_', 1)[0] + '.' + extension
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
@@ -3,6 +3,9 @@ from flask_login import login_required
 from flask_babel import _
 from app.models import TalanganTransaction, Officer, User
 from app import db
+from app.pagination import paginate_view
+from app import loading
+from app.audit import log_event
 
 talangan_bp = Blueprint('talangan', __name__)
 
@@ -28,9 +31,13 @@ def daily_target():
 @talangan_bp.route('/transactions')
 @login_required
 def transactions():
-    # Get all talangan transactions
-    transactions = TalanganTransaction.query.join(Officer).order_by(TalanganTransaction.date.desc()).all()
-    return render_template('talangan/transactions.html', transactions=transactions)
+    # Get talangan transactions, one keyset page at a time
+    page, filters = paginate_view(
+        TalanganTransaction.query.join(Officer).options(*loading.talangan_officer()), TalanganTransaction.date, TalanganTransaction.id,
+        filters={'status': TalanganTransaction.status, 'idpel': TalanganTransaction.idpel},
+        table_name='talangan_transactions'
+    )
+    return render_template('talangan/transactions.html', transactions=page.items, page=page, filters=filters)
 
 @talangan_bp.route('/transactions/add', methods=['GET', 'POST'])
 @login_required
@@ -50,10 +57,11 @@ def add_transaction():
         )
         db.session.add(transaction)
         db.session.commit()
+        log_event('create', f'Talangan {idpel} amount {amount}')
         flash(_('Talangan transaction added successfully'), 'success')
         return redirect(url_for('talangan.transactions'))
     
-    officers = Officer.query.join(User, Officer.user_id == User.id).all()
+    officers = Officer.query.join(User, Officer.user_id == User.id).options(*loading.officer_select()).all()
     return render_template('talangan/add_transaction.html', officers=officers)
 
 @talangan_bp.route('/transactions/edit/<int:id>', methods=['GET', 'POST'])
@@ -69,10 +77,11 @@ def edit_transaction(id):
         transaction.status = request.form.get('status', 'pending')
         
         db.session.commit()
+        log_event('update', f'Talangan #{id}')
         flash(_('Talangan transaction updated successfully'), 'success')
         return redirect(url_for('talangan.transactions'))
     
-    officers = Officer.query.join(User, Officer.user_id == User.id).all()
+    officers = Officer.query.join(User, Officer.user_id == User.id).options(*loading.officer_select()).all()
     return render_template('talangan/edit_transaction.html', transaction=transaction, officers=officers)
 
 @talangan_bp.route('/transactions/delete/<int:id>', methods=['POST'])
@@ -81,6 +90,7 @@ def delete_transaction(id):
     transaction = TalanganTransaction.query.get_or_404(id)
     db.session.delete(transaction)
     db.session.commit()
+    log_event('delete', f'Talangan #{id}')
     flash(_('Talangan transaction deleted successfully'), 'success')
     return redirect(url_for('talangan.transactions'))
 
@@ -98,7 +108,7 @@ def input_settlement():
         # Handle form submission
         pass
 
-    officers = Officer.query.join(User, Officer.user_id == User.id).all()
+    officers = Officer.query.join(User, Officer.user_id == User.id).options(*loading.officer_select()).all()
     return render_template('talangan/input_settlement.html', officers=officers)
 
 @talangan_bp.route('/approval')
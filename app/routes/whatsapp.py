@@ -0,0 +1,22 @@
+import hmac
+from flask import Blueprint, request, jsonify, current_app
+from app.whatsapp.receipts import receipt_buffer, parse_receipts
+
+whatsapp_bp = Blueprint('whatsapp', __name__)
+
+@whatsapp_bp.route('/receipts', methods=['POST'])
+def receipts():
+    # Called by the gateway, not a logged-in user
+    token = current_app.config.get('WA_RECEIPT_TOKEN')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not token or not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({'error': 'Invalid gateway token'}), 403
+    payload = request.get_json(silent=True)
+    try:
+        parsed, rejected = parse_receipts(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(parsed) + rejected > current_app.config.get('WA_RECEIPT_MAX_BATCH', 10000):
+        return jsonify({'error': 'Too many receipts in one request'}), 413
+    receipt_buffer.add(parsed, rejected)
+    return jsonify({'accepted': len(parsed), 'rejected': rejected}), 202
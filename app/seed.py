@@ -0,0 +1,354 @@
+"""Synthetic data for load tests and benchmarks.
+
+Run with the Flask CLI against a throwaway database::
+
+    flask seed generate --create-tables
+    flask seed generate --scale 50    # ~25M transactions, 5M WA and 5M monitoring logs
+
+Builds an areas -> coordinators -> officers tree, then customers that each
+pay once per ``periode`` (so ``(idpel, periode)`` stays unique) over the last
+months, with pending bills concentrated in the recent ones, plus WA logs,
+monitoring logs, talangan, settlements, anomalies and print logs spread over
+the same window. Rows are generated with numpy in ``BATCH`` sized
+executemany inserts, each batch in its own transaction, so memory stays flat
+at any scale. The same ``--seed`` always produces the same data.
+
+Inserts go around the ORM, so the rollup, customer search and customer
+summary tables are rebuilt once at the end. Every generated user has the
+password given with ``--password``. WA logs get the gateway ids ``seed-<n>``,
+which ``benchmarks/stub_gateway.py`` sends delivery receipts for.
+"""
+import math
+import time
+from datetime import date, datetime
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import (Area, User, Officer, Transaction, WALog, MonitoringLog, TalanganTransaction,
+                        DailySettlement, Anomaly, AnomalyMaster, PrintLog)
+
+seed_cli = AppGroup('seed', help='Synthetic data for load tests and benchmarks.')
+
+BATCH = 10000
+IDPEL_BASE = 510000000000
+
+# Row counts at --scale 1
+SIZES = {
+    'customers': 50000,
+    'transactions': 500000,
+    'wa_logs': 100000,
+    'monitoring_logs': 100000,
+    'talangan': 10000,
+    'settlements': 10000,
+    'anomalies': 5000,
+    'print_logs': 20000,
+}
+
+ANOMALY_TYPES = [
+    ('METER_RUSAK', 'Meter rusak / tidak berfungsi', 'Meter'),
+    ('SEGEL_PUTUS', 'Segel meter putus', 'Meter'),
+    ('RUMAH_KOSONG', 'Rumah kosong', 'Pelanggan'),
+    ('ALAMAT_TIDAK_DITEMUKAN', 'Alamat tidak ditemukan', 'Pelanggan'),
+    ('PEMBAYARAN_GANDA', 'Pembayaran ganda', 'Transaksi'),
+    ('SAMBUNG_LANGSUNG', 'Sambungan langsung tanpa meter', 'Pelanggaran'),
+]
+MODULES = ['auth', 'dashboard', 'reports', 'master_data', 'talangan', 'information', 'anomaly']
+EVENTS = ['login', 'view', 'export', 'create', 'update', 'delete']
+
+
+class Generator:
+    """Fills an empty database; ``counts`` maps the keys of ``SIZES`` to row counts"""
+
+    def __init__(self, counts, areas=10, coordinators_per_area=4, officers_per_coordinator=8,
+                 password='password', seed=42, log=None):
+        self.counts = counts
+        self.areas = areas
+        self.coordinators_per_area = coordinators_per_area
+        self.officers_per_coordinator = officers_per_coordinator
+        self.password = password
+        self.rng = np.random.default_rng(seed)
+        self.log = log or (lambda message: None)
+        self.months = max(1, math.ceil(counts['transactions'] / max(counts['customers'], 1)))
+        # First day of each generated periode, oldest first
+        current = np.datetime64(date.today().replace(day=1), 'M')
+        self.periodes = np.arange(current - self.months + 1, current + 1).astype('datetime64[D]')
+        self.window_start = self.periodes[0].astype('datetime64[s]')
+        self.now = np.datetime64(datetime.utcnow(), 's')
+        self.window_seconds = int((self.now - self.window_start).astype(int))
+
+    # helpers
+
+    def _insert(self, model, total, make_rows):
+        table = model.__table__
+        started = time.perf_counter()
+        for start in range(0, total, BATCH):
+            rows = make_rows(start, min(BATCH, total - start))
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), rows)
+        if total:
+            seconds = time.perf_counter() - started
+            self.log(f'{table.name}: {total} rows in {seconds:.1f}s ({total / seconds:,.0f} rows/s)')
+
+    def _pick(self, values, n, p=None):
+        return self.rng.choice(np.asarray(values, dtype=object), n, p=p).tolist()
+
+    def _timestamps(self, n):
+        offsets = self.rng.integers(0, self.window_seconds, n).astype('timedelta64[s]')
+        return (self.window_start + offsets).tolist()
+
+    def _dates(self, n):
+        days = self.window_seconds // 86400 + 1
+        return (self.periodes[0] + self.rng.integers(0, days, n).astype('timedelta64[D]')).tolist()
+
+    def _amounts(self, n, median, cap):
+        return np.minimum(np.round(self.rng.lognormal(math.log(median), 0.6, n), -2), cap).tolist()
+
+    def _idpels(self, customers):
+        return np.char.mod('%012d', IDPEL_BASE + customers).tolist()
+
+    @staticmethod
+    def _ids(model, **filters):
+        return np.array(db.session.execute(select(model.id).filter_by(**filters).order_by(model.id)).scalars().all())
+
+    # tables
+
+    def staff(self):
+        """Areas, coordinators, officers and one admin; all share one password hash"""
+        password_hash = generate_password_hash(self.password)
+        now = datetime.utcnow()
+        areas = [{'code': f'S{a:04d}', 'name': f'Synthetic Area {a:04d}'} for a in range(1, self.areas + 1)]
+        with db.engine.begin() as connection:
+            connection.execute(Area.__table__.insert(), areas)
+            users = [{'username': 'seed-admin', 'password_hash': password_hash, 'role': 'admin',
+                      'area_code': areas[0]['code'], 'active': True, 'created_at': now}]
+            for area in areas:
+                for c in range(1, self.coordinators_per_area + 1):
+                    users.append({'username': f'seed-coord-{area["code"]}-{c:02d}', 'password_hash': password_hash,
+                                  'role': 'coordinator', 'area_code': area['code'], 'active': True,
+                                  'created_at': now})
+                    for o in range(1, self.officers_per_coordinator + 1):
+                        users.append({'username': f'seed-officer-{area["code"]}-{c:02d}-{o:02d}',
+                                      'password_hash': password_hash, 'role': 'field_officer',
+                                      'area_code': area['code'], 'active': True, 'created_at': now})
+            connection.execute(User.__table__.insert(), users)
+            ids = dict(connection.execute(
+                select(User.username, User.id).where(User.username.like('seed-%'))
+            ).all())
+            officers = []
+            for area in areas:
+                for c in range(1, self.coordinators_per_area + 1):
+                    coordinator_id = ids[f'seed-coord-{area["code"]}-{c:02d}']
+                    for o in range(1, self.officers_per_coordinator + 1):
+                        officers.append({'user_id': ids[f'seed-officer-{area["code"]}-{c:02d}-{o:02d}'],
+                                         'rbm_code': f'RBM{area["code"]}{c:02d}',
+                                         'coordinator_id': coordinator_id, 'active': True,
+                                         'created_at': now, 'updated_at': now})
+            connection.execute(Officer.__table__.insert(), officers)
+            known = set(connection.execute(select(AnomalyMaster.code)).scalars())
+            types = [{'code': code, 'description': description, 'category': category, 'active': True,
+                      'created_at': now}
+                     for code, description, category in ANOMALY_TYPES if code not in known]
+            if types:
+                connection.execute(AnomalyMaster.__table__.insert(), types)
+        self.log(f'staff: {len(areas)} areas, {len(users) - 1 - len(officers)} coordinators, '
+                 f'{len(officers)} officers')
+        self.officer_ids = self._ids(Officer)
+        self.officer_user_ids = np.array(db.session.execute(
+            select(Officer.user_id).order_by(Officer.id)
+        ).scalars().all())
+        # Each customer is served by one officer
+        self.customer_officer = self.officer_ids[
+            self.rng.integers(0, len(self.officer_ids), self.counts['customers'])
+        ]
+
+    def transactions(self):
+        customers = self.counts['customers']
+        # Share of bills still open (pending) and failed, by months before the current one
+        pending = np.where(np.arange(self.months)[::-1] == 0, 0.6,
+                           np.where(np.arange(self.months)[::-1] < 3, 0.15, 0.03))
+
+        def rows(start, n):
+            k = np.arange(start, start + n)
+            customer, month = k % customers, k // customers
+            u = self.rng.random(n)
+            status = np.where(u < 0.02, 'failed', np.where(u < 0.02 + pending[month], 'pending', 'completed'))
+            created = np.minimum(self.periodes[month].astype('datetime64[s]')
+                                 + self.rng.integers(0, 27 * 86400, n).astype('timedelta64[s]'), self.now).tolist()
+            return [
+                {'idpel': idpel, 'periode': periode, 'total': total, 'payment_type': payment_type,
+                 'officer_id': officer_id, 'status': s, 'created_at': c, 'updated_at': c}
+                for idpel, periode, total, payment_type, officer_id, s, c in zip(
+                    self._idpels(customer), self.periodes[month].tolist(),
+                    self._amounts(n, 150000, 20000000),
+                    self._pick(['cash', 'installment', 'transfer'], n, [0.6, 0.15, 0.25]),
+                    self.customer_officer[customer].tolist(), status.tolist(), created)
+            ]
+
+        self._insert(Transaction, self.counts['transactions'], rows)
+
+    def wa_logs(self):
+        def rows(start, n):
+            sent = self._timestamps(n)
+            status = self._pick(['sent', 'delivered', 'read', 'failed'], n, [0.1, 0.35, 0.5, 0.05])
+            idpels = self._idpels(self.rng.integers(0, self.counts['customers'], n))
+            return [
+                {'idpel': idpel, 'status': s, 'sent_at': at, 'created_at': at, 'message_id': f'seed-{start + i}',
+                 'message': f'Tagihan listrik {idpel} sudah terbit. Mohon segera melakukan pembayaran.',
+                 'delivered_at': at if s in ('delivered', 'read') else None,
+                 'read_at': at if s == 'read' else None}
+                for i, (idpel, s, at) in enumerate(zip(idpels, status, sent))
+            ]
+
+        self._insert(WALog, self.counts['wa_logs'], rows)
+
+    def monitoring_logs(self):
+        def rows(start, n):
+            return [
+                {'module_name': module, 'event_type': event, 'user_id': user_id, 'created_at': at,
+                 'details': f'{event} in {module}'}
+                for module, event, user_id, at in zip(
+                    self._pick(MODULES, n), self._pick(EVENTS, n, [0.1, 0.6, 0.05, 0.1, 0.1, 0.05]),
+                    self.officer_user_ids[self.rng.integers(0, len(self.officer_user_ids), n)].tolist(),
+                    self._timestamps(n))
+            ]
+
+        self._insert(MonitoringLog, self.counts['monitoring_logs'], rows)
+
+    def talangan(self):
+        def rows(start, n):
+            created = self._timestamps(n)
+            return [
+                {'idpel': idpel, 'amount': amount, 'date': at.date(), 'status': status,
+                 'officer_id': officer_id, 'created_at': at, 'updated_at': at}
+                for idpel, amount, status, officer_id, at in zip(
+                    self._idpels(self.rng.integers(0, self.counts['customers'], n)),
+                    self._amounts(n, 150000, 20000000),
+                    self._pick(['pending', 'approved', 'rejected', 'settled'], n, [0.2, 0.2, 0.05, 0.55]),
+                    self._pick(self.officer_ids.tolist(), n), created)
+            ]
+
+        self._insert(TalanganTransaction, self.counts['talangan'], rows)
+
+    def settlements(self):
+        def rows(start, n):
+            return [
+                {'date': day, 'total_amount': amount, 'officer_id': officer_id, 'status': status,
+                 'created_at': datetime.combine(day, datetime.min.time()),
+                 'verified_at': datetime.combine(day, datetime.min.time()) if status == 'verified' else None}
+                for day, amount, officer_id, status in zip(
+                    self._dates(n), self._amounts(n, 3000000, 90000000), self._pick(self.officer_ids.tolist(), n),
+                    self._pick(['pending', 'completed', 'verified'], n, [0.1, 0.3, 0.6]))
+            ]
+
+        self._insert(DailySettlement, self.counts['settlements'], rows)
+
+    def anomalies(self):
+        admin_id = db.session.execute(select(User.id).filter_by(username='seed-admin')).scalar()
+
+        def rows(start, n):
+            return [
+                {'idpel': idpel, 'anomaly_type': anomaly_type, 'description': anomaly_type.replace('_', ' ').lower(),
+                 'status': status, 'reported_by': reporter, 'created_at': at,
+                 'resolved_by': admin_id if status == 'resolved' else None,
+                 'resolved_at': at if status == 'resolved' else None}
+                for idpel, anomaly_type, status, reporter, at in zip(
+                    self._idpels(self.rng.integers(0, self.counts['customers'], n)),
+                    self._pick([code for code, _d, _c in ANOMALY_TYPES], n),
+                    self._pick(['reported', 'investigating', 'resolved'], n, [0.3, 0.2, 0.5]),
+                    self._pick(self.officer_user_ids.tolist(), n), self._timestamps(n))
+            ]
+
+        self._insert(Anomaly, self.counts['anomalies'], rows)
+
+    def print_logs(self):
+        first, last = db.session.execute(select(func.min(Transaction.id), func.max(Transaction.id))).one()
+        if first is None:
+            return
+
+        def rows(start, n):
+            return [
+                {'transaction_id': transaction_id, 'printed_by': user_id, 'printed_at': at,
+                 'file_path': f'receipts/{transaction_id}.pdf'}
+                for transaction_id, user_id, at in zip(
+                    self.rng.integers(first, last + 1, n).tolist(),
+                    self._pick(self.officer_user_ids.tolist(), n), self._timestamps(n))
+            ]
+
+        self._insert(PrintLog, self.counts['print_logs'], rows)
+
+    def derived_tables(self):
+        from app import rollup, customer_search, customer_summary
+        for name, rebuild in (('rollup', rollup.rebuild), ('customer search', customer_search.rebuild),
+                              ('customer summary', customer_summary.rebuild)):
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                rebuild(connection)
+            self.log(f'{name} rebuilt in {time.perf_counter() - started:.1f}s')
+
+    def run(self):
+        self.staff()
+        self.transactions()
+        self.wa_logs()
+        self.monitoring_logs()
+        self.talangan()
+        self.settlements()
+        self.anomalies()
+        self.print_logs()
+        self.derived_tables()
+        db.session.remove()
+
+
+def counts_for(scale=1.0, **overrides):
+    """Row counts for ``scale``; ``overrides`` (keys of ``SIZES``) win when not ``None``"""
+    counts = {key: int(value * scale) for key, value in SIZES.items()}
+    counts.update((key, value) for key, value in overrides.items() if value is not None)
+    return counts
+
+
+def create_schema():
+    """Create every table of an empty database and mark the migrations applied"""
+    from app import migrations
+    db.create_all()
+    migrations.upgrade()
+
+
+def generate(counts, **options):
+    """Fill the database of the current app; see ``Generator`` for ``options``"""
+    Generator(counts, **options).run()
+
+
+@seed_cli.command('generate')
+@click.option('--scale', default=1.0, show_default=True, help='Multiplier for all default row counts.')
+@click.option('--customers', type=int)
+@click.option('--transactions', type=int, help='Customers pay once per periode, so this also sets the months covered.')
+@click.option('--wa-logs', type=int)
+@click.option('--monitoring-logs', type=int)
+@click.option('--talangan', type=int)
+@click.option('--settlements', type=int)
+@click.option('--anomalies', type=int)
+@click.option('--print-logs', type=int)
+@click.option('--areas', default=10, show_default=True)
+@click.option('--coordinators-per-area', default=4, show_default=True)
+@click.option('--officers-per-coordinator', default=8, show_default=True)
+@click.option('--password', default='password', show_default=True, help='Password of every generated user.')
+@click.option('--seed', default=42, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--create-tables', is_flag=True, help='Create the schema first (db.create_all and migrations).')
+def generate_command(scale, customers, transactions, wa_logs, monitoring_logs, talangan, settlements,
+                     anomalies, print_logs, areas, coordinators_per_area, officers_per_coordinator,
+                     password, seed, create_tables):
+    """Fill an empty database with synthetic data."""
+    if create_tables:
+        create_schema()
+    if db.session.execute(select(Transaction.id).limit(1)).first():
+        raise click.ClickException('The transactions table is not empty; seed a fresh database.')
+    counts = counts_for(scale, customers=customers, transactions=transactions, wa_logs=wa_logs,
+                        monitoring_logs=monitoring_logs, talangan=talangan, settlements=settlements,
+                        anomalies=anomalies, print_logs=print_logs)
+    started = time.perf_counter()
+    generate(counts, areas=areas, coordinators_per_area=coordinators_per_area,
+             officers_per_coordinator=officers_per_coordinator, password=password, seed=seed,
+             log=click.echo)
+    click.echo(f'Done in {time.perf_counter() - started:.0f}s. Log in as seed-admin / {password}.')
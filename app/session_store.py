@@ -0,0 +1,209 @@
+"""SQLite session store.
+
+Flask-Session's ``filesystem`` backend keeps one file per session in a
+single directory and only prunes it when it grows past a threshold, by
+listing the whole directory. Here sessions live in one SQLite database in
+WAL mode instead: readers never block the writer, every worker process
+opens its own connections, and a write is one small upsert into a
+``WITHOUT ROWID`` table keyed on the session id.
+
+A session that was read but not modified is only written back (to push its
+expiry forward) once every ``SESSION_TOUCH_INTERVAL`` seconds. Expired rows are
+deleted in batches by a daemon thread in each worker every
+``SESSION_SWEEP_INTERVAL`` seconds, or with ``flask sessions sweep``; several
+workers sweeping at once just find less to delete.
+
+Enabled with ``SESSION_TYPE = 'sqlite'``; any other type is handed to
+Flask-Session unchanged.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import click
+from flask.cli import AppGroup
+from itsdangerous import BadSignature
+from flask_session import Session
+from flask_session.sessions import FileSystemSessionInterface, ServerSideSession
+
+sessions_cli = AppGroup('sessions', help='Session store maintenance.')
+
+SWEEP_BATCH = 1000
+
+
+class SQLiteSessionStore:
+    """Key/value store with expiry, with the ``get``/``set``/``delete`` API of a cachelib cache"""
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions ('
+                     'id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL) WITHOUT ROWID')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)')
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Durable at checkpoints only: a power cut may lose the last few session writes
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def connection(self):
+        # One connection per thread, reopened in a forked worker
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def get_with_expiry(self, key):
+        """Return ``(value, expires)`` or ``(None, None)`` if missing or expired"""
+        row = self.connection.execute(
+            'SELECT data, expires FROM sessions WHERE id = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None, None
+        try:
+            return pickle.loads(row[0]), row[1]
+        except Exception:
+            return None, None
+
+    def get(self, key):
+        return self.get_with_expiry(key)[0]
+
+    def set(self, key, value, timeout):
+        self.connection.execute(
+            'INSERT INTO sessions (id, data, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET data = excluded.data, expires = excluded.expires',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + timeout)
+        )
+        return True
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM sessions WHERE id = ?', (key,))
+        return True
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def sweep(self, batch=SWEEP_BATCH):
+        """Delete expired sessions in batches; returns the number deleted"""
+        deleted = 0
+        now = time.time()
+        while True:
+            cursor = self.connection.execute(
+                'DELETE FROM sessions WHERE id IN '
+                '(SELECT id FROM sessions WHERE expires <= ? LIMIT ?)', (now, batch)
+            )
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch:
+                return deleted
+
+
+class SQLiteSession(ServerSideSession):
+    stored_expires = None
+
+
+class SQLiteSessionInterface(FileSystemSessionInterface):
+    """Flask-Session's filesystem interface with the cache swapped for ``SQLiteSessionStore``
+
+    Relies on internals of Flask-Session 0.5 (``cache``, ``_generate_sid``,
+    ``_get_signer``), which is why requirements.txt pins that version.
+    """
+
+    session_class = SQLiteSession
+
+    def __init__(self, path, key_prefix, use_signer=False, permanent=True,
+                 touch_interval=60, sweep_interval=300):
+        self.cache = SQLiteSessionStore(path)
+        self.key_prefix = key_prefix
+        self.use_signer = use_signer
+        self.permanent = permanent
+        self.touch_interval = touch_interval
+        self.sweep_interval = sweep_interval
+        self.has_same_site_capability = hasattr(self, 'get_cookie_samesite')
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        self._ensure_sweeper(app)
+        sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if sid and self.use_signer:
+            signer = self._get_signer(app)
+            if signer is None:
+                return None
+            try:
+                sid = signer.unsign(sid).decode()
+            except BadSignature:
+                sid = None
+        if not sid:
+            return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+        data, expires = self.cache.get_with_expiry(self.key_prefix + sid)
+        if data is None:
+            return self.session_class(sid=sid, permanent=self.permanent)
+        session = self.session_class(data, sid=sid)
+        session.stored_expires = expires
+        return session
+
+    def save_session(self, app, session, response):
+        if session and not session.modified and session.stored_expires is not None:
+            lifetime = app.permanent_session_lifetime.total_seconds()
+            # Written less than touch_interval ago: nothing to save, the cookie stays valid
+            if session.stored_expires - time.time() > lifetime - self.touch_interval:
+                return
+        super().save_session(app, session, response)
+
+    def _ensure_sweeper(self, app):
+        if self.sweep_interval <= 0 or self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            thread = threading.Thread(target=self._sweep_forever, args=(app.logger,),
+                                      name='session-sweeper', daemon=True)
+            thread.start()
+
+    def _sweep_forever(self, logger):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.cache.sweep()
+            except sqlite3.Error:
+                logger.exception('Session sweep failed')
+
+
+def init_app(app):
+    """Install the session interface for ``SESSION_TYPE``"""
+    if app.config.get('SESSION_TYPE') != 'sqlite':
+        Session(app)
+        return
+    path = app.config.get('SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.db')
+    app.session_interface = SQLiteSessionInterface(
+        path,
+        app.config.get('SESSION_KEY_PREFIX', 'session:'),
+        app.config.get('SESSION_USE_SIGNER', False),
+        app.config.get('SESSION_PERMANENT', True),
+        touch_interval=app.config.get('SESSION_TOUCH_INTERVAL', 60),
+        sweep_interval=app.config.get('SESSION_SWEEP_INTERVAL', 300),
+    )
+    app.cli.add_command(sessions_cli)
+
+
+@sessions_cli.command('sweep')
+def sweep_command():
+    """Delete expired sessions from the SQLite session store."""
+    from flask import current_app
+    store = current_app.session_interface.cache
+    deleted = store.sweep()
+    click.echo(f'Deleted {deleted} expired sessions, {store.count()} left.')
@@ -0,0 +1,232 @@
+"""Per-request SQL instrumentation and slow-request log.
+
+Cursor hooks on every engine time each statement run while a request is
+being served, and the request keeps its statement count, total DB time and
+its ``SQL_STATS_TOP`` slowest statements (SQL text only, never parameters).
+The cost is two ``perf_counter()`` calls and a small heap push per
+statement, so it stays on in production.
+
+When the request is torn down (after a streamed export has finished, too):
+
+- Requests that took ``SLOW_REQUEST_MS`` or longer are queued for
+  ``monitoring_logs`` through ``app.audit``, with ``module_name`` set to the
+  blueprint and ``event_type = 'slow_request'``; ``details`` is JSON with the
+  endpoint, timings and slowest statements.
+- The totals are added to per-process counters keyed by day and endpoint. A
+  daemon thread in each worker folds them into ``endpoint_sql_stats`` with an
+  additive upsert every ``SQL_STATS_FLUSH_INTERVAL`` seconds, so all workers
+  add up in one table that ``reports.sql_stats`` ranks by DB time. A worker
+  killed without a clean exit loses at most one interval.
+"""
+import atexit
+import heapq
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask import g, has_request_context, request
+from sqlalchemy import event, func
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import EndpointSqlStats
+from app.audit import log_event
+
+# Longest SQL text kept per slow statement
+MAX_STATEMENT = 1000
+COUNTER_KEYS = ('requests', 'queries', 'slow_logged', 'flushes', 'flush_errors')
+# Columns of endpoint_sql_stats summed per (day, endpoint); times in microseconds
+TOTAL_FIELDS = ('requests', 'queries', 'db_time', 'request_time', 'max_db_time', 'slow_requests')
+MAX_FIELD = TOTAL_FIELDS.index('max_db_time')
+
+
+class RequestSqlStats:
+    __slots__ = ('started', 'queries', 'seconds', 'slowest', 'top')
+
+    def __init__(self, top):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest = []
+        self.top = top
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def slowest_statements(self):
+        return [{'ms': round(seconds * 1000, 1), 'sql': statement[:MAX_STATEMENT]}
+                for seconds, statement in sorted(self.slowest, reverse=True)]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context: one that fails never reaches the after hook
+    context._sql_stats_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_sql_stats_start', None)
+    if started is not None and has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.add(statement, time.perf_counter() - started)
+
+
+def _merge(totals, values):
+    for i, value in enumerate(values):
+        totals[i] = max(totals[i], value) if i == MAX_FIELD else totals[i] + value
+
+
+def upsert_statement(dialect_name, rows):
+    """Additive multi-row upsert into ``endpoint_sql_stats``"""
+    table = EndpointSqlStats.__table__
+    added = ('requests', 'queries', 'db_time', 'request_time', 'slow_requests')
+    if dialect_name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        values = {name: table.c[name] + stmt.inserted[name] for name in added}
+        values['max_db_time'] = func.greatest(table.c.max_db_time, stmt.inserted.max_db_time)
+        return stmt.on_duplicate_key_update(**values)
+    from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(rows)
+    values = {name: table.c[name] + stmt.excluded[name] for name in added}
+    values['max_db_time'] = func.max(table.c.max_db_time, stmt.excluded.max_db_time)
+    return stmt.on_conflict_do_update(index_elements=[c for c in table.primary_key.columns], set_=values)
+
+
+class SqlStats:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_ms = 1000
+        self.top = 5
+        self.flush_interval = 60
+        self._app = None
+        self._pending = defaultdict(lambda: [0] * len(TOTAL_FIELDS))
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('SQL_STATS_ENABLED', True)
+        self.slow_ms = app.config.get('SLOW_REQUEST_MS', 1000)
+        self.top = app.config.get('SQL_STATS_TOP', 5)
+        self.flush_interval = app.config.get('SQL_STATS_FLUSH_INTERVAL', 60)
+        if not self.enabled:
+            return
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._note_status)
+        app.teardown_request(self._finish_request)
+        atexit.register(self.flush)
+
+    def _start_request(self):
+        if request.endpoint == 'static':
+            return
+        self._ensure_flusher()
+        g.sql_stats = RequestSqlStats(self.top)
+
+    @staticmethod
+    def _note_status(response):
+        g.sql_stats_status = response.status_code
+        return response
+
+    def _finish_request(self, exc):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unknown'
+        slow = elapsed * 1000 >= self.slow_ms
+        db_time = int(stats.seconds * 1e6)
+        with self._lock:
+            _merge(self._pending[(datetime.utcnow().date(), endpoint[:100])],
+                   (1, stats.queries, db_time, int(elapsed * 1e6), db_time, int(slow)))
+            self._counters['requests'] += 1
+            self._counters['queries'] += stats.queries
+        if slow:
+            self._log_slow(endpoint, stats, elapsed, g.pop('sql_stats_status', 500))
+
+    def _log_slow(self, endpoint, stats, elapsed, status):
+        details = {
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 1),
+            'queries': stats.queries,
+            'db_ms': round(stats.seconds * 1000, 1),
+            'slowest': stats.slowest_statements(),
+        }
+        if log_event('slow_request', details):
+            self._counters['slow_logged'] += 1
+
+    def _ensure_flusher(self):
+        if self.flush_interval <= 0 or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            # A forked worker starts from zero; the parent flushes its own totals
+            self._pending.clear()
+            threading.Thread(target=self._flush_forever, name='sql-stats-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Add the totals collected since the last flush to ``endpoint_sql_stats``"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: [0] * len(TOTAL_FIELDS))
+        if not pending or self._app is None:
+            return
+        rows = [dict(zip(TOTAL_FIELDS, totals), day=day, endpoint=endpoint)
+                for (day, endpoint), totals in pending.items()]
+        try:
+            with self._app.app_context(), db.engine.begin() as connection:
+                connection.execute(upsert_statement(connection.dialect.name, rows))
+            self._counters['flushes'] += 1
+        except SQLAlchemyError:
+            self._counters['flush_errors'] += 1
+            self._app.logger.warning('Could not flush SQL statistics', exc_info=True)
+            # Keep them for the next flush
+            with self._lock:
+                for key, totals in pending.items():
+                    _merge(self._pending[key], totals)
+
+    def metrics(self):
+        with self._lock:
+            values = dict(self._counters, pending_endpoints=len(self._pending))
+        values.update(enabled=self.enabled, slow_request_ms=self.slow_ms,
+                      flush_interval=self.flush_interval, pid=os.getpid())
+        return values
+
+
+sql_stats = SqlStats()
+
+
+def endpoint_ranking(since):
+    """Per-endpoint totals from ``since`` (a date) on, most DB time first"""
+    table = EndpointSqlStats
+    return db.session.query(
+        table.endpoint,
+        func.sum(table.requests).label('requests'),
+        func.sum(table.queries).label('queries'),
+        func.sum(table.db_time).label('db_time'),
+        func.sum(table.request_time).label('request_time'),
+        func.max(table.max_db_time).label('max_db_time'),
+        func.sum(table.slow_requests).label('slow_requests'),
+    ).filter(table.day >= since).group_by(table.endpoint).order_by(func.sum(table.db_time).desc())
@@ -0,0 +1,282 @@
+"""Arrears aging for the tunggakan report.
+
+Every pending transaction is one unpaid month of one customer (there is one
+bill per ``idpel`` and ``periode``). The engine reads ``idpel, periode,
+total, officer_id`` of all of them over one server-side cursor,
+``TUNGGAKAN_CHUNK_ROWS`` rows at a time. The periode comes back as year,
+month and day and the total as cents, all integers, so a chunk turns into
+NumPy columns without a Python ``date`` or ``Decimal`` per row; it is then
+folded into per-customer partial sums with a pandas group-by, so
+memory follows the number of customers rather than the number of bills.
+
+A bill's age is the number of days from its ``periode`` to the report date,
+bucketed as 0-30, 31-60, 61-90 and over 90 days (``BUCKETS``); amounts are
+summed in whole cents. Per customer the report has the unpaid months, the
+amount in each bucket, the total, the oldest unpaid periode (which sets the
+customer's own bucket) and the officer of the newest unpaid bill, under whom
+the customer is counted in the officer and area breakdowns.
+
+The page and the ``tunggakan_customers``, ``tunggakan_officers`` and
+``tunggakan_areas`` exports read the same ``AgingReport``. Each worker keeps
+it for ``TUNGGAKAN_CACHE_TTL`` seconds; while one request recomputes it the
+others keep reading the previous one. Payments made since are not seen
+until then, which the page states with the report time.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import Integer, cast, extract, func, select
+from app import db
+from app.models import Area, Officer, Transaction, User
+
+BUCKETS = ('0-30', '31-60', '61-90', '90+')
+# Upper day bound of every bucket but the last
+BUCKET_EDGES = np.array([30, 60, 90])
+AMOUNT_COLUMNS = ['days_0_30', 'days_31_60', 'days_61_90', 'days_over_90']
+# How partial per-customer rows combine; 'last' is taken after sorting by newest
+AGGREGATIONS = dict({name: 'sum' for name in ['months'] + AMOUNT_COLUMNS},
+                    oldest='min', newest='max', officer_id='last')
+COUNTER_KEYS = ('hits', 'computes', 'stale_served')
+
+
+def _bucket_of(days):
+    return np.searchsorted(BUCKET_EDGES, days)
+
+
+def _fold_chunk(rows, as_of):
+    """Per-customer partial sums of one chunk of ``(idpel, year, month, day, cents, officer_id)`` rows"""
+    idpels, years, months, days, cents, officer_ids = zip(*rows)
+    periode = ((np.array(years, dtype=np.int64) - 1970) * 12 + np.array(months, dtype=np.int64) - 1).astype(
+        'datetime64[M]').astype('datetime64[D]') + (np.array(days, dtype=np.int64) - 1)
+    cents = np.array(cents, dtype=np.int64)
+    amounts = np.zeros((len(cents), len(BUCKETS)), dtype=np.int64)
+    amounts[np.arange(len(cents)), _bucket_of((as_of - periode).astype(np.int64))] = cents
+    frame = pd.DataFrame(amounts, columns=AMOUNT_COLUMNS)
+    frame['idpel'] = np.array(idpels, dtype=object)
+    frame['months'] = 1
+    frame['oldest'] = periode
+    frame['newest'] = periode
+    frame['officer_id'] = np.array(officer_ids, dtype=np.int64)
+    return _combine(frame)
+
+
+def _combine(frame):
+    return frame.sort_values('newest', kind='stable').groupby('idpel', sort=False).agg(AGGREGATIONS)
+
+
+def _officer_frame():
+    """Username, area code and area name of every officer, indexed by officer id"""
+    rows = db.session.execute(
+        select(Officer.id, User.username, User.area_code, Area.name)
+        .outerjoin(User, User.id == Officer.user_id)
+        .outerjoin(Area, Area.code == User.area_code)
+    ).all()
+    frame = pd.DataFrame(rows, columns=['officer_id', 'officer_name', 'area_code', 'area_name'])
+    return frame.set_index('officer_id')
+
+
+def aging_query():
+    """The pending bills as plain integers, so no ``date`` or ``Decimal`` is built per row"""
+    periode = Transaction.periode
+    return select(
+        Transaction.idpel, extract('year', periode), extract('month', periode), extract('day', periode),
+        cast(func.round(Transaction.total * 100), Integer), Transaction.officer_id,
+    ).where(Transaction.status == 'pending')
+
+
+def compute_aging(as_of=None, chunk_rows=None):
+    """Read every pending transaction and build the ``AgingReport`` as of ``as_of`` (default today)"""
+    as_of = as_of or date.today()
+    chunk_rows = chunk_rows or current_app.config.get('TUNGGAKAN_CHUNK_ROWS', 100000)
+    started = time.perf_counter()
+    today = np.datetime64(as_of, 'D')
+    query = aging_query()
+    partials, partial_rows, bills = [], 0, 0
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_rows).execute(query)
+        for rows in result.partitions():
+            bills += len(rows)
+            partials.append(_fold_chunk(rows, today))
+            partial_rows += len(partials[-1])
+            # Customers whose bills span chunks are merged as the partials grow
+            if len(partials) > 1 and partial_rows > 4 * chunk_rows:
+                partials = [_combine(pd.concat(partials).reset_index())]
+                partial_rows = len(partials[0])
+    if partials:
+        customers = _combine(pd.concat(partials).reset_index()) if len(partials) > 1 else partials[0]
+    else:
+        customers = pd.DataFrame({name: pd.Series(dtype=np.int64) for name in ['months'] + AMOUNT_COLUMNS})
+        customers['oldest'] = customers['newest'] = pd.Series(dtype='datetime64[s]')
+        customers['officer_id'] = pd.Series(dtype=np.int64)
+        customers.index.name = 'idpel'
+
+    customers['total'] = customers[AMOUNT_COLUMNS].sum(axis=1)
+    customers['days_overdue'] = (today - customers['oldest'].to_numpy().astype('datetime64[D]')).astype(np.int64)
+    customers['bucket'] = _bucket_of(customers['days_overdue'].to_numpy())
+    customers = customers.join(_officer_frame(), on='officer_id')
+    customers = customers.sort_values(['total', 'months'], ascending=False, kind='stable').reset_index()
+    return AgingReport(as_of, customers, bills, time.perf_counter() - started)
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+class AgingReport:
+    """Per-customer aging as of one date, with officer and area breakdowns of any subset"""
+
+    def __init__(self, as_of, customers, bills, seconds):
+        self.as_of = as_of
+        self.customers = customers
+        self.bills = bills
+        self.seconds = seconds
+        self.computed_at = datetime.now()
+
+    def areas(self):
+        """``(code, name)`` of the areas that have customers in arrears"""
+        areas = self.customers[['area_code', 'area_name']].dropna(subset=['area_code']).drop_duplicates()
+        return sorted(areas.itertuples(index=False, name=None))
+
+    def select(self, idpel=None, officer_id=None, area=None, bucket=None):
+        """The customers matching the given filters, largest total first"""
+        frame = self.customers
+        mask = np.ones(len(frame), dtype=bool)
+        if idpel:
+            mask &= (frame['idpel'] == idpel).to_numpy()
+        if officer_id is not None:
+            mask &= (frame['officer_id'] == officer_id).to_numpy()
+        if area:
+            mask &= (frame['area_code'] == area).to_numpy()
+        if bucket in BUCKETS:
+            mask &= frame['bucket'].to_numpy() == BUCKETS.index(bucket)
+        return frame if mask.all() else frame[mask]
+
+    def summary(self, frame=None):
+        """Totals of ``frame`` (default every customer), amounts per bucket and customers per bucket"""
+        frame = self.customers if frame is None else frame
+        customers = np.bincount(frame['bucket'].to_numpy(), minlength=len(BUCKETS))
+        return {
+            'customers': len(frame),
+            'months': int(frame['months'].sum()),
+            'total': _money(frame['total'].sum()),
+            'buckets': [{'label': label, 'amount': _money(frame[column].sum()), 'customers': int(count)}
+                        for label, column, count in zip(BUCKETS, AMOUNT_COLUMNS, customers)],
+        }
+
+    def by_officer(self, frame=None):
+        return self._breakdown(frame, ['officer_id', 'officer_name', 'area_code'])
+
+    def by_area(self, frame=None):
+        return self._breakdown(frame, ['area_code', 'area_name'])
+
+    def _breakdown(self, frame, keys):
+        frame = self.customers if frame is None else frame
+        grouped = frame.groupby(keys, dropna=False, sort=False).agg(
+            customers=('months', 'size'), months=('months', 'sum'),
+            **{name: (name, 'sum') for name in AMOUNT_COLUMNS + ['total']},
+        ).reset_index().sort_values('total', ascending=False, kind='stable')
+        return [self._record(row) for row in grouped.to_dict('records')]
+
+    def rows(self, frame=None, offset=0, limit=None):
+        """Customer records of ``frame``, amounts as ``Decimal`` and periodes as dates"""
+        frame = self.customers if frame is None else frame
+        frame = frame.iloc[offset:offset + limit if limit is not None else None]
+        return [self._record(row) for row in frame.to_dict('records')]
+
+    @staticmethod
+    def _record(row):
+        for name in AMOUNT_COLUMNS + ['total']:
+            row[name] = _money(row[name])
+        for name in ('oldest', 'newest'):
+            if name in row:
+                row[name] = row[name].date()
+        if 'bucket' in row:
+            row['bucket'] = BUCKETS[row['bucket']]
+        for name in ('officer_name', 'area_code', 'area_name'):
+            if name in row and pd.isna(row[name]):
+                row[name] = None
+        return row
+
+
+class TunggakanAging:
+    def __init__(self, app=None):
+        self.ttl = 300
+        self._report = None
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('TUNGGAKAN_CACHE_TTL', 300)
+
+    def get(self):
+        """The current ``AgingReport``, recomputed once it is ``ttl`` seconds old or from an earlier day"""
+        report = self._report
+        if report is not None and self._fresh(report):
+            self._counters['hits'] += 1
+            return report
+        if report is not None and not self._lock.acquire(blocking=False):
+            # Another request is recomputing; keep serving the previous report meanwhile
+            self._counters['stale_served'] += 1
+            return report
+        if report is None:
+            self._lock.acquire()
+        try:
+            if self._report is None or not self._fresh(self._report):
+                self._report = compute_aging()
+                self._counters['computes'] += 1
+            return self._report
+        finally:
+            self._lock.release()
+
+    def _fresh(self, report):
+        return report.as_of == date.today() and (datetime.now() - report.computed_at).total_seconds() < self.ttl
+
+    def invalidate(self):
+        self._report = None
+
+    def metrics(self):
+        values = dict(self._counters, ttl=self.ttl, pid=os.getpid())
+        report = self._report
+        if report is not None:
+            values.update(as_of=report.as_of.isoformat(), computed_at=report.computed_at.isoformat(timespec='seconds'),
+                          seconds=round(report.seconds, 3), bills=report.bills, customers=len(report.customers))
+        return values
+
+
+tunggakan_aging = TunggakanAging()
+
+
+CUSTOMER_EXPORT_KEYS = ['idpel', 'officer_name', 'area_name', 'months', 'oldest', 'days_overdue', 'bucket'] + \
+    AMOUNT_COLUMNS + ['total']
+OFFICER_EXPORT_KEYS = ['officer_name', 'area_code', 'customers', 'months'] + AMOUNT_COLUMNS + ['total']
+AREA_EXPORT_KEYS = ['area_code', 'area_name', 'customers', 'months'] + AMOUNT_COLUMNS + ['total']
+
+
+def _tuples(records, keys):
+    return (tuple(record[key] for key in keys) for record in records)
+
+
+def customer_export_rows():
+    """Every customer in arrears, largest total first, converted in chunks as the file is written"""
+    report = tunggakan_aging.get()
+    frame = report.customers
+    chunk = 10000
+    for offset in range(0, len(frame), chunk):
+        yield from _tuples(report.rows(frame, offset, chunk), CUSTOMER_EXPORT_KEYS)
+
+
+def officer_export_rows():
+    report = tunggakan_aging.get()
+    return _tuples(report.by_officer(), OFFICER_EXPORT_KEYS)
+
+
+def area_export_rows():
+    report = tunggakan_aging.get()
+    return _tuples(report.by_area(), AREA_EXPORT_KEYS)
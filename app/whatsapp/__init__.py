@@ -0,0 +1,4 @@
+"""WhatsApp gateway integration (delivery receipts, outbound reminders)"""
+from flask.cli import AppGroup
+
+wa_cli = AppGroup('wa', help='WhatsApp gateway.')
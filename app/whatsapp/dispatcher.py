@@ -0,0 +1,264 @@
+"""Outbound billing reminders over WhatsApp.
+
+Run from cron or by hand, never inside a web worker::
+
+    flask wa send-reminders --dry-run
+    flask wa send-reminders --rate 30 --concurrency 20
+    flask wa send-reminders --officer-id 12 --limit 500
+
+Every customer with pending transactions (the ``reports.tunggakan`` rows)
+gets one message built from ``WA_REMINDER_TEMPLATE`` with their number of
+unpaid months and total owed. Customers who already got a WA message in the
+last ``--resend-after`` hours are skipped.
+
+Customers are read in chunks of ``CHUNK`` idpels, one grouped query per
+chunk, and fed to ``WA_DISPATCH_CONCURRENCY`` sender coroutines. A token
+bucket holds the whole run to ``WA_DISPATCH_RATE`` messages per second
+(100,000 an hour is about 28). A send that times out or gets a 429 or 5xx is
+retried up to ``WA_DISPATCH_RETRIES`` times, after a random wait of up to
+``WA_DISPATCH_BACKOFF * 2 ** attempt`` seconds (full jitter). Every
+send is recorded in ``wa_logs`` as ``sent``, with the gateway's message id
+for the receipts, or as ``failed``. Rows are inserted ``WA_DISPATCH_BATCH``
+at a time, or each second, from a single writer, together with the customer
+summary refresh of those customers. A batch that fails to write is kept and
+retried with the next one, and written rows are counted in the result so a
+run that ends with rows it could not write says so.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import func, select
+from app import db, customer_summary
+from app.models import Transaction, WALog
+from app.whatsapp import wa_cli
+from app.whatsapp.gateway import GatewayClient, GatewayError
+
+# Customers read per query
+CHUNK = 2000
+COUNTER_KEYS = ('customers', 'sent', 'failed', 'retries', 'skipped', 'written', 'write_errors', 'unwritten')
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, up to ``burst`` at once"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def reminder_chunk(after, officer_id=None, resend_after=None, limit=CHUNK):
+    """Reminders for the next customers with pending bills after idpel ``after``
+
+    Returns ``(reminders, last idpel read, customers skipped)``; the last idpel
+    is ``None`` once every customer has been read.
+    """
+    query = select(
+        Transaction.idpel, func.count(Transaction.id), func.sum(Transaction.total), func.min(Transaction.periode),
+    ).where(Transaction.status == 'pending').group_by(Transaction.idpel).order_by(Transaction.idpel).limit(limit)
+    if after is not None:
+        query = query.where(Transaction.idpel > after)
+    if officer_id is not None:
+        query = query.where(Transaction.officer_id == officer_id)
+    rows = db.session.execute(query).all()
+    if not rows:
+        return [], None, 0
+    recent = set()
+    if resend_after:
+        since = datetime.utcnow() - timedelta(hours=resend_after)
+        recent = set(db.session.execute(select(WALog.idpel).where(
+            WALog.idpel.in_([row[0] for row in rows]), WALog.created_at >= since)).scalars())
+    template = current_app.config['WA_REMINDER_TEMPLATE']
+    reminders = [{
+        'idpel': idpel,
+        'text': template.format(idpel=idpel, months=months, total=float(total or 0),
+                                since=oldest.strftime('%m/%Y') if oldest else '-'),
+    } for idpel, months, total, oldest in rows if idpel not in recent]
+    return reminders, rows[-1][0], len(rows) - len(reminders)
+
+
+def write_logs(rows):
+    """Insert the ``wa_logs`` rows of one batch and refresh their customers' summaries"""
+    idpels = [row['idpel'] for row in rows]
+    with db.engine.begin() as connection:
+        customer_summary.lock(connection, idpels)
+        connection.execute(WALog.__table__.insert(), rows)
+        customer_summary.refresh(connection, idpels)
+
+
+class Dispatcher:
+    def __init__(self, app, client, rate, concurrency, retries=3, backoff=0.5, batch_size=500, log=None):
+        self.app = app
+        self.client = client
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.log = log
+        self.counters = dict.fromkeys(COUNTER_KEYS, 0)
+        self._rows = []
+        self._write_lock = asyncio.Lock()
+        self._write_after = 0.0
+        self._done = asyncio.Event()
+
+    def _in_app(self, function, *args, **kwargs):
+        def call():
+            with self.app.app_context():
+                return function(*args, **kwargs)
+        return asyncio.to_thread(call)
+
+    async def run(self, officer_id=None, resend_after=None, limit=None):
+        queue = asyncio.Queue(self.concurrency * 4)
+        senders = [asyncio.create_task(self._sender(queue)) for _ in range(self.concurrency)]
+        flusher = asyncio.create_task(self._flush_every_second())
+        started = time.monotonic()
+        try:
+            after = None
+            while limit is None or self.counters['customers'] < limit:
+                size = CHUNK if limit is None else min(CHUNK, limit - self.counters['customers'])
+                reminders, after, skipped = await self._in_app(reminder_chunk, after, officer_id, resend_after, size)
+                self.counters['skipped'] += skipped
+                for reminder in reminders:
+                    await queue.put(reminder)
+                    self.counters['customers'] += 1
+                if after is None:
+                    break
+            await queue.join()
+        finally:
+            for task in senders:
+                task.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+            # The flusher writes what is left and stops
+            self._done.set()
+            await flusher
+            await self.client.close()
+            self.counters['unwritten'] = len(self._rows)
+        self.counters['seconds'] = round(time.monotonic() - started, 1)
+        return self.counters
+
+    async def _sender(self, queue):
+        while True:
+            reminder = await queue.get()
+            try:
+                await self._send(reminder)
+            except Exception:
+                # One bad reminder must not take its sender down with it
+                self.app.logger.warning('Could not send the reminder for %s', reminder['idpel'], exc_info=True)
+            finally:
+                queue.task_done()
+
+    async def _send(self, reminder):
+        message_id, status = None, 'failed'
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            try:
+                message_id = await self.client.send(reminder['idpel'], reminder['text'])
+                status = 'sent'
+                break
+            except GatewayError as e:
+                if not e.retryable or attempt == self.retries:
+                    if self.log:
+                        self.log(f"{reminder['idpel']}: {e}")
+                    break
+                self.counters['retries'] += 1
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        self.counters[status] += 1
+        now = datetime.utcnow()
+        self._rows.append({'idpel': reminder['idpel'], 'message': reminder['text'], 'message_id': message_id,
+                           'status': status, 'sent_at': now, 'created_at': now})
+        if len(self._rows) >= self.batch_size and time.monotonic() >= self._write_after:
+            await self._flush()
+
+    async def _flush_every_second(self):
+        while not self._done.is_set():
+            try:
+                await asyncio.wait_for(self._done.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+            await self._flush()
+        # Last rows of the run: retry like a send before giving up on them
+        for attempt in range(self.retries):
+            if not self._rows:
+                break
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            await self._flush()
+
+    async def _flush(self):
+        async with self._write_lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                await self._in_app(write_logs, rows)
+            except Exception:
+                # Keep the rows (their messages went out) for the next flush
+                self._rows = rows + self._rows
+                self._write_after = time.monotonic() + self.backoff
+                self.counters['write_errors'] += 1
+                self.app.logger.warning('Could not write %s WhatsApp log rows', len(rows), exc_info=True)
+                return
+            self.counters['written'] += len(rows)
+
+
+def send_reminders(app=None, rate=None, concurrency=None, officer_id=None, resend_after=24, limit=None, log=None):
+    """Send the reminders of one run; returns its counters"""
+    app = app or current_app._get_current_object()
+    config = app.config
+    if not config.get('WA_GATEWAY_URL'):
+        raise click.ClickException('Set WA_GATEWAY_URL to send WhatsApp messages.')
+    concurrency = concurrency or config['WA_DISPATCH_CONCURRENCY']
+
+    async def run():
+        client = GatewayClient(config['WA_GATEWAY_URL'], config.get('WA_GATEWAY_TOKEN'),
+                               timeout=config['WA_DISPATCH_TIMEOUT'], max_connections=concurrency)
+        dispatcher = Dispatcher(app, client, rate or config['WA_DISPATCH_RATE'], concurrency,
+                                retries=config['WA_DISPATCH_RETRIES'], backoff=config['WA_DISPATCH_BACKOFF'],
+                                batch_size=config['WA_DISPATCH_BATCH'], log=log)
+        return await dispatcher.run(officer_id, resend_after, limit)
+
+    return asyncio.run(run())
+
+
+@wa_cli.command('send-reminders')
+@click.option('--rate', type=float, help='Messages per second (default WA_DISPATCH_RATE).')
+@click.option('--concurrency', type=int, help='Sends in flight (default WA_DISPATCH_CONCURRENCY).')
+@click.option('--officer-id', type=int, help="Only this officer's customers.")
+@click.option('--resend-after', default=24, show_default=True,
+              help='Skip customers messaged within this many hours (0 sends to everyone).')
+@click.option('--limit', type=int, help='Stop after this many customers.')
+@click.option('--dry-run', is_flag=True, help='Only count the customers that would get a reminder.')
+def send_reminders_command(rate, concurrency, officer_id, resend_after, limit, dry_run):
+    """Send WhatsApp payment reminders to customers with pending bills."""
+    if dry_run:
+        after, customers, skipped = None, 0, 0
+        while True:
+            reminders, after, chunk_skipped = reminder_chunk(after, officer_id, resend_after)
+            customers += len(reminders)
+            skipped += chunk_skipped
+            if after is None:
+                break
+        click.echo(f'{customers} customers would get a reminder ({skipped} messaged recently).')
+        return
+    counters = send_reminders(rate=rate, concurrency=concurrency, officer_id=officer_id,
+                              resend_after=resend_after, limit=limit, log=click.echo)
+    click.echo(f"Sent {counters['sent']}, failed {counters['failed']}, skipped {counters['skipped']} "
+               f"({counters['retries']} retries) in {counters['seconds']}s.")
+    if counters['unwritten']:
+        raise click.ClickException(f"{counters['unwritten']} sends could not be recorded in wa_logs.")
@@ -0,0 +1,107 @@
+"""Asyncio client for the WhatsApp gateway's send API.
+
+The gateway takes ``POST <WA_GATEWAY_URL>`` with a JSON body
+``{"idpel": ..., "text": ..., "reference": ...}`` (its contact book is keyed
+by customer id) and answers ``{"message_id": ...}``; delivery receipts later
+refer to that id (see ``app.whatsapp.receipts``).
+
+Only the standard library is used: requests go over keep-alive HTTP/1.1
+connections opened with ``asyncio.open_connection`` (TLS for ``https``
+URLs), at most ``max_connections`` of them, each carrying one request at a
+time. Responses must have a ``Content-Length`` or be chunked.
+"""
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+
+
+class GatewayError(Exception):
+    """A send that failed; ``retryable`` is set for timeouts, connection errors, 429 and 5xx"""
+
+    def __init__(self, message, status=None, retryable=False):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+
+
+class GatewayClient:
+    def __init__(self, url, token=None, timeout=10, max_connections=20):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.token = token
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def send(self, idpel, text, reference=None):
+        """Send one message; returns the gateway's message id"""
+        body = json.dumps({'idpel': idpel, 'text': text, 'reference': reference}).encode()
+        async with self._slots:
+            try:
+                status, payload = await asyncio.wait_for(self._post(body), self.timeout)
+            except asyncio.TimeoutError:
+                raise GatewayError('Gateway timed out', retryable=True)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError) as e:
+                raise GatewayError(f'Gateway connection failed: {e}', retryable=True)
+        if status != 200 and status != 201:
+            raise GatewayError(f'Gateway answered HTTP {status}', status, retryable=status == 429 or status >= 500)
+        try:
+            return str(json.loads(payload)['message_id'])
+        except (ValueError, KeyError, TypeError):
+            raise GatewayError('Gateway answered without a message id', status)
+
+    async def _post(self, body):
+        reader, writer = self._idle.pop() if self._idle else await self._connect()
+        try:
+            headers = [f'POST {self.path} HTTP/1.1', f'Host: {self.host}', 'Content-Type: application/json',
+                       f'Content-Length: {len(body)}', 'Connection: keep-alive']
+            if self.token:
+                headers.append(f'Authorization: Bearer {self.token}')
+            writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+            await writer.drain()
+            status, keep_alive, payload = await self._read_response(reader)
+        except BaseException:
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, payload
+
+    async def _connect(self):
+        return await asyncio.open_connection(self.host, self.port,
+                                             ssl=ssl.create_default_context() if self.tls else None)
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            payload = b''.join(chunks)
+        else:
+            payload = await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, headers.get('connection', '').lower() != 'close', payload
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
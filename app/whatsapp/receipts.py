@@ -0,0 +1,205 @@
+"""Delivery receipt ingestion for ``wa_logs``.
+
+The gateway POSTs batches of status callbacks to ``/wa/receipts`` with
+``Authorization: Bearer <WA_RECEIPT_TOKEN>``::
+
+    {"receipts": [{"message_id": "wamid.HBgM", "status": "delivered",
+                   "timestamp": "2025-06-01T08:00:03Z"}, ...]}
+
+``timestamp`` may also be epoch seconds, and is taken as now when missing.
+The request only validates the receipts and merges them into an in-memory
+map holding the latest state of each message, then answers 202; it never
+waits for the database. A message only moves forward (sent, delivered, read,
+with failed last), so receipts may arrive in any order and duplicates cost
+nothing. ``delivered_at`` and ``read_at`` keep the earliest time reported,
+and a read receipt also stands for delivery.
+
+A daemon thread in each worker swaps the map out every
+``WA_RECEIPT_FLUSH_INTERVAL`` seconds, or as soon as
+``WA_RECEIPT_MAX_PENDING`` messages are waiting. It applies the map with one
+``UPDATE ... CASE`` per ``UPDATE_BATCH`` messages, each in its own
+transaction together with the customer summary refresh of the customers it
+touched. The statement never moves a row back to an earlier status, so
+workers flushing the same message in any order end up agreeing. A batch that
+fails is merged back for the next flush. Receipts for unknown (or archived)
+messages are counted and dropped.
+"""
+import atexit
+import os
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import case, func, select, update
+from app import db, customer_summary
+from app.models import WALog
+
+STATUSES = ('sent', 'delivered', 'read', 'failed')
+RANK = {status: rank for rank, status in enumerate(STATUSES)}
+DELIVERED, READ = RANK['delivered'], RANK['read']
+# Messages per UPDATE statement
+UPDATE_BATCH = 500
+MAX_MESSAGE_ID = 64
+COUNTER_KEYS = ('received', 'rejected', 'updated', 'unmatched', 'flushes', 'flush_errors')
+
+
+def _timestamp(value, now):
+    if value is None:
+        return now
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError(value)
+
+
+def parse_receipts(payload, now=None):
+    """``([(message_id, rank, time)], rejected count)`` from a gateway payload"""
+    items = payload.get('receipts') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise ValueError('Expected a list of receipts')
+    now = now or datetime.utcnow()
+    receipts, rejected = [], 0
+    for item in items:
+        try:
+            message_id, status = item['message_id'], item['status']
+            if not isinstance(message_id, str) or not 0 < len(message_id) <= MAX_MESSAGE_ID:
+                raise ValueError(message_id)
+            receipts.append((message_id, RANK[status], _timestamp(item.get('timestamp'), now)))
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            rejected += 1
+    return receipts, rejected
+
+
+def _merge(pending, message_id, rank, delivered_at, read_at):
+    state = pending.get(message_id)
+    if state is None:
+        pending[message_id] = [rank, delivered_at, read_at]
+        return
+    state[0] = max(state[0], rank)
+    if delivered_at is not None and (state[1] is None or delivered_at < state[1]):
+        state[1] = delivered_at
+    if read_at is not None and (state[2] is None or read_at < state[2]):
+        state[2] = read_at
+
+
+def _earliest(dialect_name, column, new):
+    """The earlier of ``column`` and ``new``, taking ``new`` while the column is NULL"""
+    least = func.least if dialect_name == 'mysql' else func.min
+    return least(func.coalesce(column, new), new)
+
+
+def apply_receipts(connection, states):
+    """Bulk-update ``wa_logs`` from ``{message_id: [rank, delivered_at, read_at]}``; returns rows matched"""
+    table = WALog.__table__
+    c = table.c
+    ids = list(states)
+    new_rank = case({m: s[0] for m, s in states.items()}, value=c.message_id)
+    new_status = case({m: STATUSES[s[0]] for m, s in states.items()}, value=c.message_id)
+    values = {'status': case((case(RANK, value=c.status) < new_rank, new_status), else_=c.status)}
+    delivered = {m: s[1] or s[2] for m, s in states.items() if s[1] or s[2]}
+    if delivered:
+        values['delivered_at'] = _earliest(connection.dialect.name, c.delivered_at,
+                                           case(delivered, value=c.message_id, else_=c.delivered_at))
+    read = {m: s[2] for m, s in states.items() if s[2]}
+    if read:
+        values['read_at'] = _earliest(connection.dialect.name, c.read_at, case(read, value=c.message_id, else_=c.read_at))
+    idpels = connection.execute(select(c.idpel).where(c.message_id.in_(ids))).scalars().all()
+    if not idpels:
+        return 0
+    customer_summary.lock(connection, idpels)
+    matched = connection.execute(update(table).where(c.message_id.in_(ids)).values(**values)).rowcount
+    customer_summary.refresh(connection, idpels)
+    return matched
+
+
+class ReceiptBuffer:
+    def __init__(self, app=None):
+        self.flush_interval = 2
+        self.max_pending = 100000
+        self._app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held while applying, so an explicit flush waits for one in progress
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher_pid = None
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.flush_interval = app.config.get('WA_RECEIPT_FLUSH_INTERVAL', self.flush_interval)
+        self.max_pending = app.config.get('WA_RECEIPT_MAX_PENDING', self.max_pending)
+        atexit.register(self.flush)
+
+    def add(self, receipts, rejected=0):
+        """Merge parsed receipts into the pending map"""
+        self._ensure_flusher()
+        with self._lock:
+            for message_id, rank, at in receipts:
+                _merge(self._pending, message_id, rank,
+                       at if rank == DELIVERED else None, at if rank == READ else None)
+            self._counters['received'] += len(receipts)
+            self._counters['rejected'] += rejected
+            waiting = len(self._pending)
+        if waiting >= self.max_pending:
+            self._wake.set()
+
+    def _ensure_flusher(self):
+        if self.flush_interval <= 0 or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            # A forked worker starts empty; the parent flushes its own receipts
+            self._pending = {}
+            threading.Thread(target=self._flush_forever, name='wa-receipt-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Apply the receipts collected since the last flush; returns the rows updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending or self._app is None:
+                return 0
+            return self._apply(list(pending.items()))
+
+    def _apply(self, items):
+        updated = 0
+        for start in range(0, len(items), UPDATE_BATCH):
+            batch = dict(items[start:start + UPDATE_BATCH])
+            try:
+                with self._app.app_context(), db.engine.begin() as connection:
+                    matched = apply_receipts(connection, batch)
+            except Exception:
+                self._counters['flush_errors'] += 1
+                self._app.logger.warning('Could not apply %s WhatsApp receipts', len(batch), exc_info=True)
+                # Keep them for the next flush
+                with self._lock:
+                    for message_id, state in items[start:]:
+                        _merge(self._pending, message_id, *state)
+                break
+            updated += matched
+            self._counters['updated'] += matched
+            self._counters['unmatched'] += len(batch) - matched
+        self._counters['flushes'] += 1
+        return updated
+
+    def metrics(self):
+        with self._lock:
+            values = dict(self._counters, pending=len(self._pending))
+        values.update(flush_interval=self.flush_interval, max_pending=self.max_pending, pid=os.getpid())
+        return values
+
+
+receipt_buffer = ReceiptBuffer()
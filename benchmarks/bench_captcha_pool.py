@@ -0,0 +1,74 @@
+"""Login-page captcha latency under a burst of concurrent logins.
+
+Usage::
+
+    python benchmarks/bench_captcha_pool.py --logins 2000 --threads 16
+
+Renders ``--logins`` login-page captchas from ``--threads`` request threads,
+first with the library's inline rendering, then from a warmed
+``PooledSessionCaptcha`` (``--pool-size`` challenges, refilled in the
+background), and reports throughput and latency percentiles of ``generate()``.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(app, captcha, logins, threads):
+    def one(_):
+        with app.test_request_context('/login'):
+            started = time.perf_counter()
+            captcha.generate()
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        timings = sorted(executor.map(one, range(logins)))
+    seconds = time.perf_counter() - started
+    return {
+        'logins_per_second': round(logins / seconds),
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 2),
+        'p99_ms': round(timings[int(len(timings) * 0.99)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from flask import Flask
+    from flask_session_captcha import FlaskSessionCaptcha
+    from app.captcha_pool import PooledSessionCaptcha
+
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    app.config.update(CAPTCHA_ENABLE=True, CAPTCHA_LENGTH=5, CAPTCHA_WIDTH=160, CAPTCHA_HEIGHT=60,
+                      CAPTCHA_POOL_SIZE=args.pool_size, CAPTCHA_POOL_LOW_WATER=args.pool_size // 4)
+
+    report = {'logins': args.logins, 'threads': args.threads, 'pool_size': args.pool_size}
+    report['inline'] = run(app, FlaskSessionCaptcha(app), args.logins, args.threads)
+
+    pooled = PooledSessionCaptcha(app)
+    started = time.perf_counter()
+    pooled.take()
+    while len(pooled._pool) < args.pool_size:
+        time.sleep(0.05)
+    report['pool_warmup_seconds'] = round(time.perf_counter() - started, 1)
+    report['pooled'] = run(app, pooled, args.logins, args.threads)
+    report['pooled']['served_inline'] = pooled.metrics()['inline'] - 1
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
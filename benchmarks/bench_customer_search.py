@@ -0,0 +1,107 @@
+"""Time customer search against a large customer base.
+
+Usage::
+
+    python benchmarks/bench_customer_search.py --customers 1000000
+    python benchmarks/bench_customer_search.py --database-url mysql+pymysql://user:pw@host/bench_db
+
+Loads one transaction per synthetic customer into an empty database (a
+temporary SQLite file by default), builds the n-gram index and the customer
+summary and reports the median and worst latency of exact, prefix and
+misspelled lookups. Customer ids are sequential from ``seed.IDPEL_BASE`` as
+in ``flask seed generate``, so most n-grams are shared by nearly every
+customer; ``--scattered`` spreads them over the whole id space instead.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH = 10000
+
+
+def idpel_for(i, scattered=False):
+    from app.seed import IDPEL_BASE
+    return f'{(i * 7919) % 10 ** 11:011d}' if scattered else f'{IDPEL_BASE + i:012d}'
+
+
+def typo(idpel, rng):
+    position = rng.randrange(len(idpel))
+    digit = str((int(idpel[position]) + 1) % 10)
+    return idpel[:position] + digit + idpel[position + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--customers', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--database-url')
+    parser.add_argument('--scattered', action='store_true', help='Spread ids over the id space instead of seed-style sequential ids.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from flask import Flask
+    from app import db
+    from app.models import CustomerSummary, Transaction
+    from app import customer_search, customer_summary
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'search.db')
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        table = Transaction.__table__
+        for start in range(0, args.customers, BATCH):
+            db.session.execute(table.insert(), [
+                {'idpel': idpel_for(i, args.scattered), 'periode': date(2025, 1 + i % 12, 1), 'total': 100000,
+                 'payment_type': 'cash', 'officer_id': 1, 'status': 'pending'}
+                for i in range(start, min(start + BATCH, args.customers))
+            ])
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        customer_search.rebuild()
+        customer_summary.rebuild()
+        db.session.commit()
+        index_seconds = time.perf_counter() - started
+
+        rng = random.Random(42)
+        samples = [idpel_for(rng.randrange(args.customers), args.scattered) for _ in range(args.queries)]
+        misspelled = []
+        for sample in samples:
+            # Sequential ids are one digit apart: retry until the typo is not another customer
+            query = typo(sample, rng)
+            while db.session.get(CustomerSummary, query) is not None:
+                query = typo(sample, rng)
+            misspelled.append((query, sample))
+        # (query, the customer it must find, or None for any result)
+        cases = {
+            'exact': [(s, s) for s in samples],
+            'prefix': [(s[:6], None) for s in samples],
+            'typo': misspelled,
+        }
+        report = {'customers': args.customers, 'ids': 'scattered' if args.scattered else 'sequential',
+                  'load_seconds': round(load_seconds, 1),
+                  'index_seconds': round(index_seconds, 1)}
+        for name, queries in cases.items():
+            timings = []
+            found = 0
+            for query, expected in queries:
+                started = time.perf_counter()
+                results = customer_search.search(query)
+                timings.append((time.perf_counter() - started) * 1000)
+                found += bool(results.items) if expected is None else expected in {r['idpel'] for r in results}
+            report[name] = {'median_ms': round(statistics.median(timings), 1),
+                            'max_ms': round(max(timings), 1), 'found': f'{found}/{len(queries)}'}
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
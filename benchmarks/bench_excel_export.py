@@ -0,0 +1,76 @@
+"""Compare Excel export with untyped and typed export columns.
+
+Usage::
+
+    python benchmarks/bench_excel_export.py --rows 100000
+
+``auto`` passes plain header names, so every value is type-checked as it is
+formatted; ``typed`` declares the column kinds up front. Each engine runs in
+a fresh subprocess over the same synthetic transaction rows; the script
+reports wall time and peak resident memory of that process.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADERS = ['id', 'idpel', 'periode', 'total', 'payment_type', 'status', 'officer_name', 'created_at']
+KINDS = ['int', 'text', 'date', 'decimal', 'text', 'text', 'text', 'datetime']
+
+
+def synthetic_rows(count):
+    created = datetime(2025, 1, 1)
+    for i in range(count):
+        yield (
+            i + 1,
+            f'{i % 1000000:011d}',
+            date(2025, 1 + i % 12, 1),
+            Decimal('125000.00') + i % 997,
+            ('cash', 'installment', 'transfer')[i % 3],
+            'pending',
+            f'officer{i % 2000}',
+            created + timedelta(seconds=i),
+        )
+
+
+def run_engine(engine, rows):
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    from app.exports.columns import ExportColumn
+    from app.exports.xlsx import write_xlsx
+    if engine == 'typed':
+        columns = [ExportColumn(h, kind=k) for h, k in zip(HEADERS, KINDS)]
+    else:
+        columns = HEADERS
+    with tempfile.TemporaryFile() as output:
+        write_xlsx(synthetic_rows(rows), columns, output)
+        size = output.tell()
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'engine': engine, 'rows': rows, 'seconds': round(elapsed, 2),
+                      'peak_rss_mb': round(peak_kb / 1024, 1), 'bytes': size}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--engine', choices=['auto', 'typed'])
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.engine, args.rows)
+        return
+
+    for engine in ('auto', 'typed'):
+        subprocess.run([sys.executable, __file__, '--engine', engine, '--rows', str(args.rows)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""Time every report, export and list route against a seeded database.
+
+Usage::
+
+    python benchmarks/bench_routes.py --scale 0.1
+    python benchmarks/bench_routes.py --database-url mysql+pymysql://user:pw@host/bench_db
+    python benchmarks/bench_routes.py --compare benchmarks/results/1a2b3c4.json
+
+Without ``--database-url`` a temporary SQLite database is filled with
+``flask seed generate`` data at ``--scale``; a given database must already be
+seeded (its ``seed-admin`` user is used). Logged in as that admin, the script
+requests every GET route of the dashboard, report, information, talangan,
+anomaly and master-data pages that takes no URL argument, plus each export
+route once per format, ``--repeat`` times. It reads the whole response body
+and records the first (cold cache) time and the median and p95 of the rest.
+
+Results go to ``benchmarks/results/<commit>.json`` (or ``--output``) with the
+row counts they were measured on; ``--compare`` prints each route's median
+against an earlier results file, so two commits can be measured on the same
+data.
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BLUEPRINTS = ('main', 'dashboard', 'reports', 'information', 'talangan', 'anomaly', 'master_data')
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    return commit, bool(git('status', '--porcelain', '--untracked-files=no'))
+
+
+def routes(app):
+    """``(endpoint, url)`` for every argument-free GET route, and every export format"""
+    from flask import url_for
+    from app.exports.registry import EXPORT_FORMATS
+    found = []
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+            if rule.endpoint.split('.')[0] not in BLUEPRINTS or 'GET' not in rule.methods:
+                continue
+            if not rule.arguments:
+                found.append((rule.endpoint, url_for(rule.endpoint)))
+            elif rule.arguments == {'format'}:
+                found.extend((rule.endpoint, url_for(rule.endpoint, format=f)) for f in EXPORT_FORMATS)
+    return found
+
+
+def row_counts():
+    from sqlalchemy import func, select
+    from app import db
+    return {table.name: db.session.execute(select(func.count()).select_from(table)).scalar()
+            for table in db.metadata.sorted_tables}
+
+
+def time_route(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url)
+        size = len(response.get_data())
+        timings.append((time.perf_counter() - started) * 1000)
+    warm = sorted(timings[1:]) or timings
+    return {
+        'status': response.status_code,
+        'bytes': size,
+        'first_ms': round(timings[0], 1),
+        'median_ms': round(statistics.median(warm), 1),
+        'p95_ms': round(warm[min(len(warm) - 1, int(len(warm) * 0.95))], 1),
+    }
+
+
+def compare(previous, current):
+    print(f"\n{'route':<45} {'before':>10} {'after':>10} {'change':>8}")
+    for url, result in current['routes'].items():
+        before = previous['routes'].get(url)
+        if not before or not before['median_ms']:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] * 100
+        print(f"{url:<45} {before['median_ms']:>8.1f}ms {result['median_ms']:>8.1f}ms {change:>+7.0f}%")
+    if previous.get('rows') != current.get('rows'):
+        print('\nWarning: the two runs were measured on different row counts.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='An already seeded database (default: seed a temporary SQLite file).')
+    parser.add_argument('--scale', type=float, default=0.1, help='Seed scale for the temporary database.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='Results file (default benchmarks/results/<commit>.json).')
+    parser.add_argument('--compare', help='Earlier results file to compare against.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import select
+    from app import create_app, db, seed
+    from app.models import User
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'SESSION_SQLITE_PATH': os.path.join(workdir, 'sessions.db'),
+        'DASHBOARD_CACHE_DIR': os.path.join(workdir, 'dashboard_cache'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+    })
+
+    with app.app_context():
+        if not args.database_url:
+            started = time.perf_counter()
+            seed.create_schema()
+            seed.generate(seed.counts_for(args.scale), log=lambda message: print(message, file=sys.stderr))
+            print(f'Seeded in {time.perf_counter() - started:.0f}s', file=sys.stderr)
+        admin_id = db.session.execute(select(User.id).filter_by(username='seed-admin')).scalar()
+        if admin_id is None:
+            sys.exit('No seed-admin user: seed the database with `flask seed generate` first.')
+        rows = row_counts()
+        dialect = db.engine.dialect.name
+        db.session.remove()
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'database': dialect,
+        'repeat': args.repeat,
+        'rows': rows,
+        'routes': {},
+    }
+    # Failing routes are reported by their status code below
+    app.logger.setLevel(logging.CRITICAL)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    for endpoint, url in routes(app):
+        result = time_route(client, url, args.repeat)
+        report['routes'][url] = dict(result, endpoint=endpoint)
+        flag = '' if result['status'] == 200 else f"  (HTTP {result['status']})"
+        print(f"{url:<45} first {result['first_ms']:>8.1f}ms  median {result['median_ms']:>8.1f}ms  "
+              f"p95 {result['p95_ms']:>8.1f}ms{flag}", file=sys.stderr)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}', file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
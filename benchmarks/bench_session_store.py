@@ -0,0 +1,100 @@
+"""Compare the SQLite session store with Flask-Session's filesystem backend.
+
+Usage::
+
+    python benchmarks/bench_session_store.py --sessions 100000 --workers 4
+
+Fills each store with ``--sessions`` sessions, then has ``--workers``
+processes replay a request mix against it (every request reads its session,
+one in ``--write-every`` also writes it back, a few are new logins), the way
+several web workers share one store. Reports requests per second, the p99
+request latency and what the store left on disk.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT = 31 * 24 * 3600
+PAYLOAD = {'_user_id': '1', '_fresh': True, '_id': 'x' * 128, 'language': 'id', 'csrf_token': 'y' * 40}
+
+
+def make_store(kind, path):
+    sys.path.insert(0, ROOT)
+    if kind == 'filesystem':
+        from cachelib.file import FileSystemCache
+        # Flask-Session's defaults for SESSION_TYPE = 'filesystem'
+        return FileSystemCache(path, threshold=500, mode=0o600)
+    from app.session_store import SQLiteSessionStore
+    return SQLiteSessionStore(os.path.join(path, 'sessions.db'))
+
+
+def fill(kind, path, sessions):
+    store = make_store(kind, path)
+    started = time.perf_counter()
+    for i in range(sessions):
+        store.set(f'session:{i}', PAYLOAD, TIMEOUT)
+    return time.perf_counter() - started
+
+
+def replay(job):
+    kind, path, sessions, requests, write_every, seed = job
+    store = make_store(kind, path)
+    rng = random.Random(seed)
+    timings = []
+    for n in range(requests):
+        started = time.perf_counter()
+        if n % 50 == 0:
+            store.set(f'session:new-{seed}-{n}', PAYLOAD, TIMEOUT)
+        else:
+            key = f'session:{rng.randrange(sessions)}'
+            data = store.get(key)
+            if n % write_every == 0:
+                store.set(key, data or PAYLOAD, TIMEOUT)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def disk_usage(path):
+    files = [os.path.join(path, name) for name in os.listdir(path)]
+    return len(files), sum(os.path.getsize(f) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=5000, help='Requests per worker.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--write-every', type=int, default=10)
+    parser.add_argument('--backends', default='filesystem,sqlite')
+    args = parser.parse_args()
+
+    report = {'sessions': args.sessions, 'workers': args.workers, 'requests_per_worker': args.requests}
+    for kind in args.backends.split(','):
+        path = tempfile.mkdtemp(prefix=f'sessions-{kind}-')
+        fill_seconds = fill(kind, path, args.sessions)
+        jobs = [(kind, path, args.sessions, args.requests, args.write_every, seed) for seed in range(args.workers)]
+        started = time.perf_counter()
+        with Pool(args.workers) as pool:
+            timings = [t for worker in pool.map(replay, jobs) for t in worker]
+        seconds = time.perf_counter() - started
+        files, size = disk_usage(path)
+        report[kind] = {
+            'fill_seconds': round(fill_seconds, 2),
+            'requests_per_second': round(len(timings) / seconds),
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'p99_ms': round(sorted(timings)[int(len(timings) * 0.99)] * 1000, 3),
+            'files': files,
+            'disk_mb': round(size / 2 ** 20, 1),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
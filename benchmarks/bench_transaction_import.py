@@ -0,0 +1,81 @@
+"""Time a bulk transaction import.
+
+Usage::
+
+    python benchmarks/bench_transaction_import.py --rows 1000000
+    python benchmarks/bench_transaction_import.py --database-url mysql+pymysql://user:pw@host/bench_db
+
+Writes a CSV of synthetic collections (a share of them repeating an earlier
+idpel/periode, plus some invalid rows) and imports it twice into an empty
+database (a temporary SQLite file by default): once into empty tables and
+once again, where every valid row becomes an update.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_csv(path, rows, officers):
+    with open(path, 'w') as output:
+        output.write('idpel,periode,total,officer,payment_type,status\n')
+        for i in range(rows):
+            idpel = f'{(i * 7919) % 10 ** 11:011d}'
+            total = 'n/a' if i % 500 == 0 else f'{50000 + i % 900000}.00'
+            output.write(f'{idpel},2025-{1 + i % 12:02d}-01,{total},off{i % officers},'
+                         f"{('cash', 'installment', 'transfer')[i % 3]},{('pending', 'completed')[i % 2]}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--officers', type=int, default=50)
+    parser.add_argument('--batch-rows', type=int, default=5000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from flask import Flask
+    from app import db
+    from app.models import User, Officer, Transaction
+    from app.imports import transactions
+    from app.dashboard_stats import dashboard_stats
+
+    workdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or 'sqlite:///' + os.path.join(workdir, 'import.db')
+    app.config['DASHBOARD_CACHE_TYPE'] = 'null'
+    db.init_app(app)
+    dashboard_stats.init_app(app)
+
+    path = os.path.join(workdir, 'transactions.csv')
+    started = time.perf_counter()
+    write_csv(path, args.rows, args.officers)
+    report = {'rows': args.rows, 'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+              'write_seconds': round(time.perf_counter() - started, 1)}
+
+    with app.app_context():
+        db.create_all()
+        for i in range(args.officers):
+            user = User(username=f'off{i}', password_hash='-', role='field_officer')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Officer(user_id=user.id))
+        db.session.commit()
+
+        for name in ('first_import', 'reimport'):
+            started = time.perf_counter()
+            result = transactions.import_file(path, os.path.join(workdir, 'rejects.csv'), args.batch_rows)
+            seconds = time.perf_counter() - started
+            report[name] = dict(result.as_dict(), seconds=round(seconds, 1),
+                                rows_per_second=round(result.rows / seconds))
+        report['transactions'] = db.session.query(Transaction).count()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Check that list views and exports stay within their query budgets.
+
+Usage::
+
+    python benchmarks/check_query_budgets.py
+    python benchmarks/check_query_budgets.py --database-url mysql+pymysql://user:pw@host/bench_db
+
+Without ``--database-url`` a temporary SQLite database is filled with
+``flask seed generate`` data at ``--scale``, as in ``bench_routes.py``.
+Logged in as ``seed-admin``, the script requests every URL of ``BUDGETS``
+once to warm the per-process caches, then again under
+``app.loading.assert_max_queries`` with its budget. Views in ``PAGED`` are
+requested at two page sizes and must run the same number of queries at
+both, so a per-row lazy load fails even while the total is under budget.
+Exits with status 1 and the statements of every view that failed.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# url -> most statements one warm request may run; {idpel} is a seeded customer
+BUDGETS = {
+    '/dashboard/': 2,
+    '/reports/tunggakan': 3,
+    '/reports/wa-monitoring': 4,
+    '/reports/log-monitoring': 4,
+    '/reports/daily-settlement': 4,
+    '/reports/bluetooth-print': 4,
+    '/anomaly/daily-reports': 4,
+    '/talangan/transactions': 4,
+    '/master-data/officers': 2,
+    '/master-data/coordinators': 3,
+    '/information/customer-lookup?idpel={idpel}': 3,
+    '/information/customer-lookup?search_query={idpel}': 6,
+    '/reports/tunggakan/export/pdf': 2,
+    '/reports/tunggakan/export/excel': 2,
+    '/reports/tunggakan/customers/export/csv': 1,
+}
+PAGED = {
+    '/reports/wa-monitoring', '/reports/log-monitoring', '/reports/daily-settlement',
+    '/reports/bluetooth-print', '/anomaly/daily-reports', '/talangan/transactions', '/reports/tunggakan',
+}
+PAGE_SIZES = (5, 50)
+
+
+def check(client, url, budget, assert_max_queries):
+    """Request ``url`` (at each page size if paged); returns a failure message or ``None``"""
+    sizes = PAGE_SIZES if url in PAGED else (None,)
+    counts = []
+    for size in sizes:
+        target = url if size is None else f"{url}{'&' if '?' in url else '?'}per_page={size}"
+        client.get(target).get_data()
+        try:
+            with assert_max_queries(budget) as counter:
+                response = client.get(target)
+                response.get_data()
+        except AssertionError as e:
+            return f'{target}: {e}'
+        if response.status_code != 200:
+            return f'{target}: HTTP {response.status_code}'
+        counts.append(counter.count)
+    if len(set(counts)) > 1:
+        return f'{url}: {counts} queries at page sizes {PAGE_SIZES}; the query count grows with the rows shown'
+    print(f'{url:<55} {counts[0]:>3} queries (budget {budget})', file=sys.stderr)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='An already seeded database (default: seed a temporary SQLite file).')
+    parser.add_argument('--scale', type=float, default=0.01, help='Seed scale for the temporary database.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import select
+    from app import create_app, db, seed
+    from app.loading import assert_max_queries
+    from app.models import CustomerSummary, User
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url or 'sqlite:///' + os.path.join(workdir, 'budget.db'),
+        'SESSION_SQLITE_PATH': os.path.join(workdir, 'sessions.db'),
+        'DASHBOARD_CACHE_DIR': os.path.join(workdir, 'dashboard_cache'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+    })
+    app.logger.setLevel(logging.CRITICAL)
+
+    with app.app_context():
+        if not args.database_url:
+            seed.create_schema()
+            seed.generate(seed.counts_for(args.scale), log=lambda message: print(message, file=sys.stderr))
+        admin_id = db.session.execute(select(User.id).filter_by(username='seed-admin')).scalar()
+        if admin_id is None:
+            sys.exit('No seed-admin user: seed the database with `flask seed generate` first.')
+        idpel = db.session.execute(select(CustomerSummary.idpel).where(
+            CustomerSummary.txn_count > 0).limit(1)).scalar()
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+    failures = []
+    with app.app_context():
+        for url, budget in BUDGETS.items():
+            failure = check(client, url.format(idpel=idpel), budget, assert_max_queries)
+            if failure:
+                failures.append(failure)
+    for failure in failures:
+        print(f'\nFAILED {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
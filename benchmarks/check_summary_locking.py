@@ -0,0 +1,122 @@
+"""Check that concurrent writers of one customer serialize on its summary row.
+
+Usage::
+
+    python benchmarks/check_summary_locking.py --database-url mysql+pymysql://user:pw@host/bench_db
+
+Needs a seeded MySQL (InnoDB) database: SQLite has a single writer and no row
+locks, so it cannot show the ordering. Two sessions, A and B, each commit a
+transaction for the same customer ``IDPEL``:
+
+1. A flushes its insert and then holds its database transaction open for
+   ``PAUSE`` seconds, between the insert and its summary refresh.
+2. B flushes its own insert for the customer meanwhile.
+3. A refreshes the summary with locking reads and commits.
+
+The summary row is locked before any source row is written, so B waits in
+step 2 before its insert and A's reads in step 3 see no uncommitted row of
+B. Were the row locked only after the insert, A would wait on B's row while
+B waits on the summary lock A takes, and InnoDB would abort one of them as a
+deadlock. The check passes when both commit, B finishes only after A has
+committed and the summary counts both transactions. The rows it writes are
+removed again. Exits with status 1 otherwise.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IDPEL = 'lock-check-0001'
+PAUSE = 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', required=True, help='A seeded MySQL database.')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import event, make_url, select, text
+    from app import create_app, db
+    from app.models import CustomerSearchGram, CustomerSummary, Officer, Transaction
+
+    if make_url(args.database_url).get_backend_name() != 'mysql':
+        sys.exit('Needs a MySQL database: row locks are what this checks.')
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url,
+        'SESSION_SQLITE_PATH': os.path.join(workdir, 'sessions.db'),
+        'DASHBOARD_CACHE_DIR': os.path.join(workdir, 'dashboard_cache'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+    })
+
+    def cleanup():
+        # Through the ORM, so the rollup and summary hooks undo the test rows too
+        for transaction in Transaction.query.filter_by(idpel=IDPEL):
+            db.session.delete(transaction)
+        db.session.execute(CustomerSearchGram.__table__.delete().where(CustomerSearchGram.idpel == IDPEL))
+        db.session.commit()
+
+    with app.app_context():
+        officer_id = db.session.execute(select(Officer.id).limit(1)).scalar()
+        if officer_id is None:
+            sys.exit('No officer: seed the database with `flask seed generate` first.')
+        cleanup()
+
+    inserted = threading.Event()
+    finished = {}
+    errors = []
+
+    def pause_after_insert(session, flush_context):
+        # Runs before the summary refresh of A's flush, with A's row inserted
+        if session.info.pop('pause_after_insert', False):
+            inserted.set()
+            time.sleep(PAUSE)
+
+    event.listen(db.session, 'after_flush', pause_after_insert, insert=True)
+
+    def writer(name, periode):
+        try:
+            with app.app_context():
+                db.session.execute(text('SET SESSION innodb_lock_wait_timeout = 30'))
+                if name == 'B':
+                    inserted.wait(30)
+                else:
+                    db.session.info['pause_after_insert'] = True
+                db.session.add(Transaction(idpel=IDPEL, periode=periode, total=1000, officer_id=officer_id,
+                                           status='pending'))
+                db.session.commit()
+                finished[name] = time.perf_counter()
+        except Exception as e:
+            errors.append(f'{name}: {e}')
+
+    threads = [threading.Thread(target=writer, args=('A', date(2000, 1, 1))),
+               threading.Thread(target=writer, args=('B', date(2000, 2, 1)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        summary = db.session.get(CustomerSummary, IDPEL)
+        counted = summary.txn_count if summary else 0
+        cleanup()
+
+    failures = list(errors)
+    if not errors and finished['B'] < finished['A']:
+        failures.append('B committed before A: its flush did not wait for the summary lock')
+    if not errors and counted != 2:
+        failures.append(f'the summary counts {counted} of 2 transactions')
+    for failure in failures:
+        print(f'FAILED {failure}', file=sys.stderr)
+    if not failures:
+        print('ok: B waited for A and the summary counts both transactions', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Stand-in for the WhatsApp gateway when testing against a local server.
+
+Usage::
+
+    python benchmarks/stub_gateway.py serve --port 8025 --latency-ms 80 --error-rate 0.02 \
+        --receipts-url http://127.0.0.1:5000/wa/receipts --token local-token
+    flask wa send-reminders    # with WA_GATEWAY_URL = 'http://127.0.0.1:8025/messages'
+
+    flask seed generate --create-tables --wa-logs 200000
+    python benchmarks/stub_gateway.py replay --token local-token --count 200000 --rate 60000
+
+``serve`` answers every ``POST`` like the gateway's send API, after
+``--latency-ms``, with a new ``message_id``, or with a 503 for a share of
+``--error-rate`` of them. With ``--receipts-url`` it posts a delivered receipt
+(and for ``--read-share`` of them a read receipt) for each message it took, a
+second or more later, in batches, like the gateway's status callback. It
+prints its counters every ten seconds.
+
+``replay`` sends delivery receipts for the messages ``<prefix>0`` to
+``<prefix><count - 1>`` (``flask seed generate`` names its WA logs
+``seed-<n>``) to ``/wa/receipts`` the way the gateway does: in batches of
+``--batch`` from ``--concurrency`` connections, paced at ``--rate`` receipts
+per minute (0: as fast as the server takes them). Every message gets a
+delivered receipt and ``--read-share`` of them a read receipt as well;
+``--duplicates`` re-sends that share of receipts, and the receipts are
+shuffled so that some read receipts overtake their delivered one. Prints the
+achieved rate and the server's accepted and rejected totals.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def receipts(args):
+    rng = random.Random(args.seed)
+    start = datetime.now(timezone.utc)
+    items = []
+    for n in range(args.count):
+        message_id = f'{args.prefix}{n}'
+        delivered = start + timedelta(seconds=rng.randint(1, 30))
+        items.append({'message_id': message_id, 'status': 'delivered',
+                      'timestamp': delivered.isoformat().replace('+00:00', 'Z')})
+        if rng.random() < args.read_share:
+            read = delivered + timedelta(seconds=rng.randint(5, 3600))
+            items.append({'message_id': message_id, 'status': 'read', 'timestamp': read.timestamp()})
+    items.extend(rng.sample(items, int(len(items) * args.duplicates)))
+    # Shuffle within windows, so receipts of one message stay roughly close together
+    window = args.batch * 4
+    for i in range(0, len(items), window):
+        chunk = items[i:i + window]
+        rng.shuffle(chunk)
+        items[i:i + window] = chunk
+    return items
+
+
+def post(url, token, batch):
+    request = urllib.request.Request(url, data=json.dumps({'receipts': batch}).encode(), method='POST', headers={
+        'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.load(response)
+
+
+def replay(args):
+    items = receipts(args)
+    batches = [items[i:i + args.batch] for i in range(0, len(items), args.batch)]
+    interval = args.batch / (args.rate / 60) if args.rate else 0
+    totals = {'accepted': 0, 'rejected': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    def send(batch):
+        try:
+            result = post(args.url, args.token, batch)
+        except OSError as e:
+            print(f'Batch failed: {e}', file=sys.stderr)
+            result = {'failed': len(batch)}
+        with lock:
+            for key, value in result.items():
+                totals[key] = totals.get(key, 0) + value
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for i, batch in enumerate(batches):
+            if interval:
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, batch)
+    seconds = time.perf_counter() - started
+    print(f'{len(items)} receipts in {len(batches)} batches in {seconds:.1f}s '
+          f'({len(items) / seconds * 60:,.0f} per minute): {totals}')
+
+
+def serve(args):
+    rng = random.Random(args.seed)
+    run = int(time.time())
+    lock = threading.Lock()
+    counters = {'messages': 0, 'errors': 0, 'receipts': 0, 'receipt_errors': 0}
+    # (time sent, message id) waiting for their receipts
+    sent = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if args.latency_ms:
+                time.sleep(args.latency_ms / 1000 * rng.uniform(0.5, 1.5))
+            with lock:
+                failed = rng.random() < args.error_rate
+                if failed:
+                    counters['errors'] += 1
+                else:
+                    counters['messages'] += 1
+                    message_id = f"stub-{run}-{counters['messages']}"
+                    sent.append((time.time(), message_id))
+            body = json.dumps({'error': 'busy'} if failed else {'message_id': message_id}).encode()
+            self.send_response(503 if failed else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def send_receipts():
+        while True:
+            time.sleep(1)
+            with lock:
+                due = [m for at, m in sent if at <= time.time() - 1]
+                del sent[:len(due)]
+            for i in range(0, len(due), args.batch):
+                batch = []
+                for message_id in due[i:i + args.batch]:
+                    batch.append({'message_id': message_id, 'status': 'delivered', 'timestamp': time.time()})
+                    if rng.random() < args.read_share:
+                        batch.append({'message_id': message_id, 'status': 'read', 'timestamp': time.time()})
+                try:
+                    post(args.receipts_url, args.token, batch)
+                    key = 'receipts'
+                except OSError as e:
+                    print(f'Receipts failed: {e}', file=sys.stderr)
+                    key = 'receipt_errors'
+                with lock:
+                    counters[key] += len(batch)
+
+    def report():
+        while True:
+            time.sleep(10)
+            print(f'{datetime.now():%H:%M:%S} {counters}', file=sys.stderr)
+
+    if args.receipts_url:
+        threading.Thread(target=send_receipts, daemon=True).start()
+    threading.Thread(target=report, daemon=True).start()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    print(f'Stub gateway listening on http://127.0.0.1:{args.port}/', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(counters, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_replay = commands.add_parser('replay', help='Post delivery receipts to the app.')
+    parser_replay.add_argument('--url', default='http://127.0.0.1:5000/wa/receipts')
+    parser_replay.add_argument('--token', required=True, help='WA_RECEIPT_TOKEN of the app.')
+    parser_replay.add_argument('--prefix', default='seed-', help='Message ids are <prefix><n>.')
+    parser_replay.add_argument('--count', type=int, default=100000, help='Messages to send receipts for.')
+    parser_replay.add_argument('--read-share', type=float, default=0.6)
+    parser_replay.add_argument('--duplicates', type=float, default=0.05)
+    parser_replay.add_argument('--batch', type=int, default=1000)
+    parser_replay.add_argument('--concurrency', type=int, default=4)
+    parser_replay.add_argument('--rate', type=int, default=0, help='Receipts per minute (0: unthrottled).')
+    parser_replay.add_argument('--seed', type=int, default=42)
+    parser_serve = commands.add_parser('serve', help='Take messages like the send API.')
+    parser_serve.add_argument('--port', type=int, default=8025)
+    parser_serve.add_argument('--latency-ms', type=int, default=50)
+    parser_serve.add_argument('--error-rate', type=float, default=0.0, help='Share of sends answered with 503.')
+    parser_serve.add_argument('--receipts-url', help='Post delivery receipts here (the app\'s /wa/receipts).')
+    parser_serve.add_argument('--token', help='WA_RECEIPT_TOKEN of the app.')
+    parser_serve.add_argument('--read-share', type=float, default=0.6)
+    parser_serve.add_argument('--batch', type=int, default=1000)
+    parser_serve.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.command == 'replay':
+        replay(args)
+    else:
+        serve(args)
+
+
+if __name__ == '__main__':
+    main()
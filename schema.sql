@@ -71,6 +71,7 @@ CREATE TABLE wa_logs (
     id INT AUTO_INCREMENT PRIMARY KEY,
     idpel VARCHAR(20) NOT NULL,
     message TEXT,
+    message_id VARCHAR(64),
     status ENUM('sent', 'delivered', 'read', 'failed') DEFAULT 'sent',
     sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     delivered_at TIMESTAMP NULL,
@@ -122,6 +123,10 @@ CREATE TABLE report_exports (
     report_type VARCHAR(100) NOT NULL,
     file_path VARCHAR(255) NOT NULL,
     exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    format VARCHAR(10),
+    status ENUM('queued', 'running', 'completed', 'failed') DEFAULT 'completed',
+    error TEXT,
+    completed_at DATETIME NULL,
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
@@ -147,6 +152,141 @@ CREATE TABLE daily_settlements (
     FOREIGN KEY (officer_id) REFERENCES officers(id)
 );
 
+-- Transaction rollup, maintained by app/rollup.py (migration 0002)
+CREATE TABLE transaction_daily_rollup (
+    officer_id INT NOT NULL,
+    day DATE NOT NULL,
+    status ENUM('pending', 'completed', 'failed') NOT NULL,
+    payment_type ENUM('cash', 'installment', 'transfer') NOT NULL,
+    txn_count INT NOT NULL DEFAULT 0,
+    total DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (officer_id, day, status, payment_type),
+    FOREIGN KEY (officer_id) REFERENCES officers(id)
+);
+CREATE INDEX ix_rollup_day ON transaction_daily_rollup (day);
+CREATE INDEX ix_rollup_status_count ON transaction_daily_rollup (status, txn_count);
+
+-- Positional 4-grams of customer ids, maintained by app/customer_search.py (migration 0004)
+CREATE TABLE customer_search_grams (
+    gram VARCHAR(4) NOT NULL,
+    position SMALLINT NOT NULL,
+    idpel VARCHAR(20) NOT NULL,
+    PRIMARY KEY (gram, position, idpel)
+);
+CREATE INDEX ix_customer_search_grams_idpel ON customer_search_grams (idpel);
+
+-- One row per customer, maintained by app/customer_summary.py (migration 0005)
+CREATE TABLE customer_summary (
+    idpel VARCHAR(20) PRIMARY KEY,
+    txn_count INT NOT NULL DEFAULT 0,
+    last_periode DATE NULL,
+    last_payment_at DATETIME NULL,
+    last_paid_periode DATE NULL,
+    outstanding_count INT NOT NULL DEFAULT 0,
+    outstanding_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    officer_id INT NULL,
+    talangan_exposure DECIMAL(14,2) NOT NULL DEFAULT 0,
+    open_anomalies INT NOT NULL DEFAULT 0,
+    last_wa_status ENUM('sent', 'delivered', 'read', 'failed') NULL,
+    last_wa_at DATETIME NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (officer_id) REFERENCES officers(id)
+);
+
+-- Bulk transaction import files and their progress (migration 0006)
+CREATE TABLE transaction_imports (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    file_path VARCHAR(255) NOT NULL,
+    status ENUM('queued', 'running', 'completed', 'failed') DEFAULT 'queued',
+    total_rows INT NOT NULL DEFAULT 0,
+    inserted INT NOT NULL DEFAULT 0,
+    updated INT NOT NULL DEFAULT 0,
+    rejected INT NOT NULL DEFAULT 0,
+    rejects_path VARCHAR(255),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    completed_at TIMESTAMP NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+-- Daily SQL totals per endpoint, flushed by app/sql_stats.py (migration 0007)
+CREATE TABLE endpoint_sql_stats (
+    day DATE NOT NULL,
+    endpoint VARCHAR(100) NOT NULL,
+    requests INT NOT NULL DEFAULT 0,
+    queries BIGINT NOT NULL DEFAULT 0,
+    db_time BIGINT NOT NULL DEFAULT 0,
+    request_time BIGINT NOT NULL DEFAULT 0,
+    max_db_time BIGINT NOT NULL DEFAULT 0,
+    slow_requests INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, endpoint)
+);
+
+-- Compressed files of archived log rows, written by app/retention.py (migration 0008)
+CREATE TABLE archive_segments (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    min_time DATETIME NOT NULL,
+    max_time DATETIME NOT NULL,
+    min_id INT NOT NULL,
+    max_id INT NOT NULL,
+    row_count INT NOT NULL,
+    path VARCHAR(255) NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    filter_bloom BLOB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX ix_archive_segments_table_range ON archive_segments (table_name, max_time, max_id);
+
+-- Schema migration bookkeeping (see app/migrations.py)
+CREATE TABLE schema_migrations (
+    version VARCHAR(20) PRIMARY KEY,
+    description VARCHAR(255),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Secondary indexes for the hot query shapes (migration 0001)
+CREATE INDEX ix_users_role_area ON users (role, area_code);
+CREATE INDEX ix_transactions_status_created ON transactions (status, created_at, id);
+CREATE INDEX ix_transactions_periode ON transactions (periode);
+CREATE INDEX ix_transactions_officer_status ON transactions (officer_id, status);
+CREATE INDEX ix_transactions_created ON transactions (created_at, id);
+CREATE INDEX ix_talangan_date ON talangan_transactions (date, id);
+CREATE INDEX ix_talangan_status_date ON talangan_transactions (status, date);
+CREATE INDEX ix_talangan_idpel ON talangan_transactions (idpel);
+CREATE INDEX ix_wa_logs_created ON wa_logs (created_at, id);
+CREATE INDEX ix_wa_logs_status_created ON wa_logs (status, created_at);
+CREATE INDEX ix_wa_logs_idpel ON wa_logs (idpel);
+CREATE INDEX ix_print_logs_printed ON print_logs (printed_at, id);
+CREATE INDEX ix_monitoring_logs_created ON monitoring_logs (created_at, id);
+CREATE INDEX ix_monitoring_logs_module_created ON monitoring_logs (module_name, created_at);
+CREATE INDEX ix_anomalies_created ON anomalies (created_at, id);
+CREATE INDEX ix_anomalies_status_created ON anomalies (status, created_at);
+CREATE INDEX ix_anomalies_idpel ON anomalies (idpel);
+CREATE INDEX ix_daily_settlements_date ON daily_settlements (date, id);
+CREATE INDEX ix_report_exports_user_exported ON report_exports (user_id, exported_at);
+
+-- One bill per customer and period; bulk imports upsert on it (migration 0006)
+CREATE UNIQUE INDEX uq_transactions_idpel_periode ON transactions (idpel, periode);
+
+-- Delivery receipts find their message by the gateway id (migration 0009)
+CREATE UNIQUE INDEX uq_wa_logs_message_id ON wa_logs (message_id);
+
+INSERT INTO schema_migrations (version, description) VALUES
+('0001', 'Indexes for dashboard, report and list view queries'),
+('0002', 'Transaction daily rollup table'),
+('0003', 'Background export job columns'),
+('0004', 'Customer search n-gram index'),
+('0005', 'Customer summary table'),
+('0006', 'Unique transaction (idpel, periode) and import tracking'),
+('0007', 'Per-endpoint SQL statistics'),
+('0008', 'Log table archive segments'),
+('0009', 'WhatsApp gateway message ids'),
+('0010', 'Covering index for the dashboard status counts'),
+('0011', 'Archive segment filter blooms');
+
 -- Insert seed data
 INSERT INTO areas (code, name) VALUES 
 ('A001', 'Area Jakarta Pusat'),
@@ -171,4 +311,10 @@ INSERT INTO officers (user_id, rbm_code, active) VALUES
 INSERT INTO transactions (idpel, periode, total, payment_type, officer_id, status) VALUES
 ('00123456789', '2025-09-01', 120000.00, 'cash', 3, 'completed'),
 ('00123456790', '2025-09-01', 95000.00, 'installment', 3, 'completed'),
-('00123456791', '2025-08-01', 150000.00, 'cash', 3, 'pending');
\ No newline at end of file
+('00123456791', '2025-08-01', 150000.00, 'cash', 3, 'pending');
+
+-- transaction_daily_rollup, customer_search_grams and customer_summary are
+-- derived tables; after loading rows with plain SQL run:
+--   flask rollup rebuild
+--   flask customer-search rebuild
+--   flask customer-summary rebuild